@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+Minimal runner for the asv style benchmarks in this package.
+
+    python -m benchmarks run [--output results.json] [--filter substring]
+    python -m benchmarks compare base.json new.json [--factor 1.2]
+
+Benchmark modules are the `bench_*.py` files. Their classes may define
+`params`/`param_names`, `setup`/`teardown` and `time_*` methods, as for
+airspeed velocity, and can also be run with asv directly.
+"""
+import argparse
+import importlib
+import inspect
+import itertools
+import json
+import os
+import pkgutil
+import platform
+import sys
+import timeit
+
+
+def discover(pattern=None):
+    """Yields (name, benchmark class, method name, params) for every benchmark"""
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    for _, module_name, _ in sorted(pkgutil.iter_modules([package_dir])):
+        if not module_name.startswith('bench_'):
+            continue
+        module = importlib.import_module('benchmarks.' + module_name)
+        for class_name, cls in sorted(inspect.getmembers(module, inspect.isclass)):
+            if cls.__module__ != module.__name__:
+                continue
+            params = getattr(cls, 'params', [])
+            if params and not isinstance(params, tuple):
+                params = (params,)
+            for method in sorted(m for m in dir(cls) if m.startswith('time_')):
+                for combination in itertools.product(*params):
+                    name = '{0}.{1}.{2}'.format(module_name, class_name, method)
+                    if combination:
+                        name += '({0})'.format(', '.join(str(p) for p in combination))
+                    if pattern and pattern not in name:
+                        continue
+                    yield name, cls, method, combination
+
+
+def time_benchmark(cls, method, params, repeat=3):
+    instance = cls()
+    if hasattr(instance, 'setup'):
+        instance.setup(*params)
+    try:
+        func = getattr(instance, method)
+        timer = timeit.Timer(lambda: func(*params))
+        number, _ = timer.autorange()
+        return min(timer.repeat(repeat=repeat, number=number)) / number
+    finally:
+        if hasattr(instance, 'teardown'):
+            instance.teardown(*params)
+
+
+def run(args):
+    results = {}
+    for name, cls, method, params in discover(args.filter):
+        seconds = time_benchmark(cls, method, params, repeat=args.repeat)
+        results[name] = seconds
+        print('{0:<70} {1:>12.6f}s'.format(name, seconds))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'python': platform.python_version(),
+                       'machine': platform.machine(),
+                       'results': results}, f, indent=2, sort_keys=True)
+    return 0
+
+
+def compare(args):
+    with open(args.base) as f:
+        base = json.load(f)['results']
+    with open(args.new) as f:
+        new = json.load(f)['results']
+    regressions = 0
+    for name in sorted(set(base) & set(new)):
+        ratio = new[name] / base[name] if base[name] else float('inf')
+        flag = ''
+        if ratio > args.factor:
+            flag = 'REGRESSION'
+            regressions += 1
+        elif ratio < 1. / args.factor:
+            flag = 'improved'
+        print('{0:<70} {1:>10.6f}s {2:>10.6f}s {3:>7.2f}x {4}'.format(
+            name, base[name], new[name], ratio, flag))
+    for name in sorted(set(base) ^ set(new)):
+        print('{0:<70} only in {1}'.format(name, 'base' if name in base else 'new'))
+    print('{0} regression(s) beyond {1}x'.format(regressions, args.factor))
+    return 1 if regressions else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks')
+    commands = parser.add_subparsers(dest='command')
+    run_parser = commands.add_parser('run', help="run benchmarks")
+    run_parser.add_argument('--output', help="write results to this JSON file")
+    run_parser.add_argument('--filter', help="only run benchmarks whose name contains this")
+    run_parser.add_argument('--repeat', type=int, default=3)
+    compare_parser = commands.add_parser('compare', help="flag regressions between two runs")
+    compare_parser.add_argument('base')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('--factor', type=float, default=1.2,
+                                help="slowdown ratio counted as a regression")
+    args = parser.parse_args(argv)
+    if args.command == 'run':
+        return run(args)
+    if args.command == 'compare':
+        return compare(args)
+    parser.print_help()
+    return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
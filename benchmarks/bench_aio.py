@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for the asyncio facade: many concurrent detect_type calls
+"""
+import asyncio
+
+from match import aio, match
+
+from .corpora import ParseCachesDisabled, mixed_corpus
+
+
+class ConcurrentDetectType(ParseCachesDisabled):
+    """Each call on the default executor, vs micro-batched through AsyncMatcher"""
+    params = [16, 256]
+    param_names = ['batch_size']
+
+    def setup(self, batch_size):
+        self.disable_parse_caches()
+        self.values = mixed_corpus(2000)
+
+    def time_executor_per_call(self, batch_size):
+        async def run():
+            loop = asyncio.get_running_loop()
+            await asyncio.gather(*[loop.run_in_executor(None, match.detect_type, s)
+                                   for s in self.values])
+        asyncio.run(run())
+
+    def time_micro_batched(self, batch_size):
+        async def run():
+            matcher = aio.AsyncMatcher(batch_size=batch_size)
+            await asyncio.gather(*[matcher.detect_type(s) for s in self.values])
+        asyncio.run(run())
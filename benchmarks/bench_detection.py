@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for type detection
+"""
+from match import match
+
+from .corpora import ParseCachesDisabled, column, mixed_corpus
+
+
+class DetectType(ParseCachesDisabled):
+    params = ['string', 'phonenumber', 'email', 'datetime', 'mixed']
+    param_names = ['corpus']
+
+    def setup(self, corpus):
+        self.disable_parse_caches()
+        if corpus == 'mixed':
+            self.values = mixed_corpus(200)
+        else:
+            self.values = column(corpus, 200)
+
+    def time_detect_type(self, corpus):
+        for s in self.values:
+            match.detect_type(s)
+
+    def time_detect_types(self, corpus):
+        match.detect_types(self.values)
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+"""
+Cold start: a fresh interpreter importing match and making a first call.
+Dependencies are imported on first use, so eager_dependencies (match plus
+everything it can use) shows what every import used to cost.
+"""
+import os
+import subprocess
+import sys
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCRIPTS = {
+    'startup': "pass",
+    'import': "import match.match",
+    'parse_email': "from match import match; match.parse_as('foo@gmail.com', 'email')",
+    'detect_type': "from match import match; match.detect_type('608-555-5555')",
+    'eager_dependencies': ("import match.match, dateutil.parser, phonenumbers, numpy, "
+                           "scipy.sparse, py_stringmatching"),
+}
+
+
+class ColdStart(object):
+    params = sorted(SCRIPTS)
+    param_names = ['script']
+
+    def setup(self, script):
+        self.env = dict(os.environ, PYTHONPATH=ROOT)
+
+    def time_cold_start(self, script):
+        subprocess.check_call([sys.executable, '-c', SCRIPTS[script]], env=self.env)
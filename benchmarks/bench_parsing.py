@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for parsing with each datatype, with parse caching disabled
+"""
+import random
+
+import phonenumbers
+
+from match import datatypes, match
+
+from .corpora import ParseCachesDisabled, column, mixed_corpus
+
+
+class ParseAs(ParseCachesDisabled):
+    params = ['phonenumber', 'email', 'datetime', 'string']
+    param_names = ['dtype']
+
+    def setup(self, dtype):
+        self.values = column(dtype, 200)
+        self.disable_parse_caches()
+
+    def time_parse_as(self, dtype):
+        for s in self.values:
+            match.parse_as(s, dtype)
+
+
+class DateTimeColumn(ParseCachesDisabled):
+    """Column of dates: dateutil on every value vs inferred formats"""
+
+    def setup(self):
+        self.values = column('datetime', 2000)
+        self.dtype = datatypes.get_datatype('datetime')
+        self.disable_parse_caches()
+
+    def time_parse_each(self):
+        for s in self.values:
+            self.dtype.parse(s)
+
+    def time_parse_column(self):
+        self.dtype.parse_column(self.values)
+
+
+class EpochColumn(ParseCachesDisabled):
+    """Column of epoch milliseconds: one at a time vs in bulk"""
+
+    def setup(self):
+        rng = random.Random(0)
+        self.values = [str(rng.randint(1000000000000, 1700000000000)) for _ in range(20000)]
+        self.dtype = datatypes.get_datatype('datetime')
+        self.disable_parse_caches()
+
+    def time_parse_each(self):
+        for s in self.values:
+            self.dtype.parse(s)
+
+    def time_parse_epochs(self):
+        self.dtype.parse_epochs(self.values)
+
+
+class PhoneNumberColumn(ParseCachesDisabled):
+    """Phone numbers and free text: libphonenumber on every value vs screened"""
+    params = ['phonenumber', 'mixed']
+    param_names = ['corpus']
+
+    def setup(self, corpus):
+        if corpus == 'mixed':
+            self.values = mixed_corpus(2000)
+        else:
+            self.values = column(corpus, 2000)
+        self.dtype = datatypes.get_datatype('phonenumber')
+        self.disable_parse_caches()
+
+    def time_libphonenumber(self, corpus):
+        for s in self.values:
+            s = s.strip()
+            try:
+                number = phonenumbers.parse(s, self.dtype.default_region)
+                phonenumbers.is_valid_number(number)
+            except phonenumbers.NumberParseException:
+                pass
+
+    def time_parse(self, corpus):
+        for s in self.values:
+            self.dtype.parse(s)
+
+
+class EmailColumn(ParseCachesDisabled):
+    """Distinct email addresses: one at a time vs canonicalize_column"""
+
+    def setup(self):
+        self.values = ['{0}{1}'.format(i, s) for i, s in enumerate(column('email', 20000))]
+        self.dtype = datatypes.get_datatype('email')
+        self.disable_parse_caches()
+
+    def time_parse_each(self):
+        for s in self.values:
+            self.dtype.parse(s)
+
+    def time_canonicalize_column(self):
+        self.dtype.canonicalize_column(self.values)
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for every similarity measure and tokenizer, across string lengths
+"""
+import random
+
+from match.join import similarity_join
+from match.similarity import (
+    SimilarityModel,
+    get_tokenizer,
+    similarity_measure_lookup,
+    set_similarity,
+    tokenizer_lookup)
+
+from .corpora import mutate, random_string, similar_pairs
+
+
+# Measures taking q-gram token lists, or word token lists, instead of strings
+TOKEN_MEASURES = ['cosine', 'dice', 'jaccard', 'overlap_coefficient',
+                  'tversky_index', 'tfidf']
+WORD_MEASURES = ['generalized_jaccard', 'monge_elkan', 'soft_tfidf']
+
+
+def words(s, size=6):
+    return [s[i:i + size] for i in range(0, len(s), size)]
+
+
+class SimilarityMeasure(object):
+    params = (sorted(similarity_measure_lookup), [8, 32, 128])
+    param_names = ['measure', 'length']
+
+    def setup(self, measure, length):
+        pairs = similar_pairs(50, length)
+        if measure in TOKEN_MEASURES:
+            tokenizer = get_tokenizer('3grams')
+            pairs = [(tokenizer.tokenize(a), tokenizer.tokenize(b)) for a, b in pairs]
+        elif measure in WORD_MEASURES:
+            pairs = [(words(a), words(b)) for a, b in pairs]
+        self.pairs = pairs
+        instance = similarity_measure_lookup[measure]()
+        self.score = getattr(instance, 'get_sim_score', None) or instance.get_raw_score
+
+    def time_score(self, measure, length):
+        score = self.score
+        for a, b in self.pairs:
+            score(a, b)
+
+
+class Tokenizer(object):
+    params = (sorted(tokenizer_lookup), [8, 32, 128])
+    param_names = ['tokenizer', 'length']
+
+    def setup(self, tokenizer, length):
+        self.tokenizer = get_tokenizer(tokenizer)
+        self.values = [' '.join(words(a)) for a, b in similar_pairs(50, length)]
+
+    def time_tokenize(self, tokenizer, length):
+        tokenize = self.tokenizer.tokenize
+        for s in self.values:
+            tokenize(s)
+
+
+class InternedSetSimilarity(object):
+    """Set similarity of one string against many: token sets vs interned ids"""
+    params = ([8, 32, 128],)
+    param_names = ['length']
+
+    def setup(self, length):
+        pairs = similar_pairs(200, length)
+        self.query = pairs[0][0]
+        self.candidates = [b for a, b in pairs]
+        self.model = SimilarityModel('jaccard', tokenizer='3grams')
+        # Warm the encoding cache, as for repeated comparisons
+        self.model.similarity_many(self.query, self.candidates)
+
+    def time_token_sets(self, length):
+        tokens = self.model.tokens
+        query = tokens(self.query)
+        for s in self.candidates:
+            set_similarity('jaccard', query, tokens(s))
+
+    def time_interned(self, length):
+        for s in self.candidates:
+            self.model.similarity(self.query, s)
+
+    def time_interned_many(self, length):
+        self.model.similarity_many(self.query, self.candidates)
+
+
+class OneVsMany(object):
+    """Sequence measures scoring one string against many: pairwise vs similarity_many"""
+    params = (['jaro', 'jaro_winkler', 'levenshtein'], [8, 32, 64])
+    param_names = ['measure', 'length']
+
+    def setup(self, measure, length):
+        self.candidates = [b for a, b in similar_pairs(1000, length)]
+        self.query = self.candidates[0]
+        self.measure = similarity_measure_lookup[measure]()
+
+    def time_pairwise(self, measure, length):
+        score = self.measure.get_sim_score
+        for s in self.candidates:
+            score(self.query, s)
+
+    def time_similarity_many(self, measure, length):
+        self.measure.similarity_many(self.query, self.candidates)
+
+
+class ThresholdedMatch(object):
+    """is_exact_match on mostly non-matching pairs: full score vs early termination"""
+    params = (['jaro', 'jaro_winkler', 'levenshtein'], [8, 32, 64])
+    param_names = ['measure', 'length']
+
+    def setup(self, measure, length):
+        rng = random.Random(0)
+        pairs = similar_pairs(500, length)
+        # Near duplicates, and non-matches of varying length
+        self.pairs = pairs + [(a, random_string(rng, rng.randint(max(1, length // 2), length * 3 // 2)))
+                              for a, b in pairs]
+        self.measure = similarity_measure_lookup[measure]()
+
+    def time_full_score(self, measure, length):
+        score = self.measure.get_sim_score
+        for a, b in self.pairs:
+            score(a, b) > .95
+
+    def time_exceeds_threshold(self, measure, length):
+        exceeds = self.measure.exceeds_threshold
+        for a, b in self.pairs:
+            exceeds(a, b, .95)
+
+
+class SetSimilarityJoin(object):
+    """All pairs with jaccard of at least .8: inverted index queries vs prefix filtering join"""
+    params = [2000, 10000]
+    param_names = ['n']
+
+    def setup(self, n):
+        rng = random.Random(0)
+        base = [random_string(rng, rng.randint(8, 30)) for _ in range(n)]
+        self.corpus = base + [mutate(rng, s, edits=1) for s in base[:n // 2]]
+
+    def time_index_self_join(self, n):
+        model = SimilarityModel('jaccard').fit(self.corpus)
+        model.build_index()
+        for pair in model.self_join(threshold=.8):
+            pass
+
+    def time_similarity_join(self, n):
+        for pair in similarity_join(self.corpus, threshold=.8):
+            pass
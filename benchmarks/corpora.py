@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+Reproducible synthetic corpora for benchmarks
+"""
+import random
+
+from match import datatypes
+
+
+WORDS = ['hi', 'how', 'are', 'you', 'the', 'quick', 'brown', 'fox', 'jumps',
+         'over', 'lazy', 'dog', 'match', 'is', 'out', 'please', 'call', 'me',
+         'tomorrow', 'thanks', 'see', 'attached', 'invoice', 'order', 'shipped']
+FIRST_NAMES = ['john', 'jane', 'susan', 'bob', 'jayden', 'maria', 'wei', 'ahmed']
+LAST_NAMES = ['smith', 'johnson', 'van gogh', 'wjorcek', 'garcia', 'chen', 'ali']
+DOMAINS = ['gmail.com', 'example.com', 'yahoo.com', 'outlook.com', 'corp.io']
+MONTHS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct',
+          'Nov', 'Dec']
+
+
+def sentence(rng, min_words=2, max_words=12):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(min_words, max_words))]
+    s = ' '.join(words).capitalize()
+    return s + rng.choice(['', '.', '?', '!'])
+
+
+def phonenumber(rng):
+    digits = '608%03d%04d' % (rng.randint(200, 999), rng.randint(0, 9999))
+    fmt = rng.choice(['{0}{1}{2}', '({0}) {1}-{2}', '{0}-{1}-{2}', '{0}.{1}.{2}',
+                      '+1 {0} {1} {2}', '+1 ({0}) {1}-{2}'])
+    return fmt.format(digits[:3], digits[3:6], digits[6:])
+
+
+def email(rng):
+    local = rng.choice(FIRST_NAMES) + rng.choice(['.', '_', '']) + rng.choice(LAST_NAMES).replace(' ', '')
+    if rng.random() < .2:
+        local += '+' + rng.choice(WORDS)
+    return local + '@' + rng.choice(DOMAINS)
+
+
+def datetime_string(rng):
+    year = rng.randint(1990, 2020)
+    month = rng.randint(1, 12)
+    day = rng.randint(1, 28)
+    fmt = rng.choice(['{y}-{m:02d}-{d:02d}', '{y}-{m:02d}-{d:02d}T10:36:28',
+                      '{mon} {d} {y}', '{m}/{d}/{y}', 'epoch'])
+    if fmt == 'epoch':
+        return str(rng.randint(600000000, 1500000000))
+    return fmt.format(y=year, m=month, d=day, mon=MONTHS[month - 1])
+
+
+def fullname(rng):
+    return '{0} {1}'.format(rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)).title()
+
+
+generators = {
+    'string': sentence,
+    'phonenumber': phonenumber,
+    'email': email,
+    'datetime': datetime_string,
+    'fullname': fullname,
+}
+
+
+def column(dtype, n, seed=0):
+    rng = random.Random(seed)
+    generate = generators[dtype]
+    return [generate(rng) for _ in range(n)]
+
+
+def mixed_corpus(n, weights=None, seed=0):
+    """Mostly free text, with some entities mixed in"""
+    if weights is None:
+        weights = {'string': .7, 'fullname': .1, 'phonenumber': .07,
+                   'email': .07, 'datetime': .06}
+    rng = random.Random(seed)
+    dtypes = sorted(weights)
+    cum_weights = []
+    total = 0
+    for t in dtypes:
+        total += weights[t]
+        cum_weights.append(total)
+    corpus = []
+    for _ in range(n):
+        r = rng.random() * total
+        t = dtypes[[i for i, w in enumerate(cum_weights) if r < w][0]]
+        corpus.append(generators[t](rng))
+    return corpus
+
+
+def random_string(rng, length, alphabet='abcdefghijklmnopqrstuvwxyz'):
+    return ''.join(rng.choice(alphabet) for _ in range(length))
+
+
+def mutate(rng, s, edits=2, alphabet='abcdefghijklmnopqrstuvwxyz'):
+    """Substitute `edits` characters, keeping the length"""
+    s = list(s)
+    for _ in range(edits):
+        if s:
+            s[rng.randrange(len(s))] = rng.choice(alphabet)
+    return ''.join(s)
+
+
+def similar_pairs(n, length, seed=0):
+    """Pairs of equal length strings, each a few substitutions apart"""
+    rng = random.Random(seed)
+    pairs = []
+    for _ in range(n):
+        s = random_string(rng, length)
+        pairs.append((s, mutate(rng, s, edits=max(1, length // 8))))
+    return pairs
+
+
+class ParseCachesDisabled(object):
+    """Mixin for benchmarks that should time parsing rather than cache hits"""
+
+    def disable_parse_caches(self):
+        self.cache_sizes = dict((t, datatypes.get_datatype(t).parse_cache_size)
+                                for t in datatypes.ALL_TYPES)
+        for t in self.cache_sizes:
+            datatypes.set_parse_cache(t, 0)
+
+    def teardown(self, *params):
+        for t, size in self.cache_sizes.items():
+            datatypes.set_parse_cache(t, size)
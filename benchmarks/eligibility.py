@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+Parser calls made by `detect_type` with and without the `eligible_types`
+fingerprint prefilter, over a mixed free-text corpus.
+
+    python -m benchmarks.eligibility [n]
+"""
+import sys
+import time
+
+from dateutil import parser
+import phonenumbers
+
+from match import datatypes
+from match import match
+
+from .corpora import mixed_corpus
+
+
+class CallCounter(object):
+
+    def __init__(self, module, attr):
+        self.module = module
+        self.attr = attr
+        self.calls = 0
+
+    def __enter__(self):
+        self.original = getattr(self.module, self.attr)
+
+        def counted(*args, **kwargs):
+            self.calls += 1
+            return self.original(*args, **kwargs)
+
+        setattr(self.module, self.attr, counted)
+        return self
+
+    def __exit__(self, *exc):
+        setattr(self.module, self.attr, self.original)
+
+
+def run(corpus, select_types):
+    with CallCounter(phonenumbers, 'parse') as phone_calls, \
+            CallCounter(parser, 'parse') as date_calls:
+        start = time.time()
+        for s in corpus:
+            scores = match.score_types(s, select_types(s))
+            max(scores, key=lambda x: x[0])
+        elapsed = time.time() - start
+    return phone_calls.calls, date_calls.calls, elapsed
+
+
+def main(n=10000):
+    corpus = mixed_corpus(n)
+    results = [
+        ('all types', run(corpus, lambda s: datatypes.ALL_TYPES)),
+        ('eligible types', run(corpus, datatypes.eligible_types)),
+    ]
+    print('{0} values'.format(n))
+    print('{0:<16}{1:>14}{2:>14}{3:>10}'.format('', 'phonenumbers', 'dateutil', 'secs'))
+    for label, (phone_calls, date_calls, elapsed) in results:
+        print('{0:<16}{1:>14}{2:>14}{3:>10.3f}'.format(label, phone_calls,
+                                                       date_calls, elapsed))
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+"""
+asyncio facade for online serving. `detect_type`, `parse_as` and
+`score_similarity` are CPU bound, so calling them from a coroutine blocks
+the event loop. Here concurrent calls are coalesced into micro-batches: a
+call waits at most `max_latency` seconds for others to join it, or until
+`batch_size` calls are queued, and each batch runs on an executor through
+the batch paths (`detect_types`, `DataType.parse_many` and
+`DataType.score_similarity_many`).
+
+    matcher = AsyncMatcher(batch_size=256, max_latency=.002)
+    score, dtype = await matcher.detect_type('608-555-5555')
+    matcher.metrics()['queue_depth']
+
+The module level coroutines share a default AsyncMatcher, which keeps
+separate batchers for each event loop it is used from. The batch functions
+are module level, so a ProcessPoolExecutor works as well as the event
+loop's default thread pool.
+"""
+import asyncio
+import functools
+
+from .datatypes import get_closest_common_type, get_datatype, value_key
+from .match import detect_type as detect_type_sync
+from .match import detect_types
+from .match import parse_as as parse_as_sync
+from .match import score_similarity as score_similarity_sync
+
+
+def run_batch(batch_func, item_func, items):
+    """
+    batch_func(items) as a list of (ok, result or exception). If the batch
+    fails, items are retried one at a time with item_func, so one bad value
+    only fails its own call.
+    """
+    try:
+        return [(True, result) for result in batch_func(items)]
+    except Exception:
+        pass
+    results = []
+    for item in items:
+        try:
+            results.append((True, item_func(item)))
+        except Exception as e:
+            results.append((False, e))
+    return results
+
+
+class MicroBatcher(object):
+    """
+    Queues items submitted from coroutines and runs them through
+    batch_func(items) -> results on an executor, in batches of at most
+    batch_size. A batch is dispatched once it is full or max_latency
+    seconds after its first item was queued. A batcher serves one event loop
+    at a time; calls still queued or in flight on a loop that has since
+    closed are dropped when another loop starts using it.
+    """
+
+    def __init__(self, batch_func, item_func, batch_size=256, max_latency=.002, executor=None):
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        self.run = functools.partial(run_batch, batch_func, item_func)
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self.executor = executor
+        self.loop = None
+        # [(item, future)] waiting for dispatch
+        self.pending = []
+        self.timer = None
+        self.in_flight = 0
+        self.max_queue_depth = 0
+        self.submitted = 0
+        self.batches = 0
+
+    @property
+    def queue_depth(self):
+        return len(self.pending)
+
+    async def submit(self, item):
+        loop = asyncio.get_running_loop()
+        if loop is not self.loop:
+            if (self.pending or self.in_flight) and not self.loop.is_closed():
+                raise RuntimeError("MicroBatcher is in use by another event loop")
+            self.loop = loop
+            # Their futures belong to the closed loop and can't be resolved
+            self.pending = []
+            self.timer = None
+            self.in_flight = 0
+        future = loop.create_future()
+        self.pending.append((item, future))
+        self.submitted += 1
+        self.max_queue_depth = max(self.max_queue_depth, len(self.pending))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+        elif self.timer is None:
+            self.timer = loop.call_later(self.max_latency, self.flush)
+        return await future
+
+    def flush(self):
+        """Dispatch everything queued"""
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        while self.pending:
+            batch = self.pending[:self.batch_size]
+            del self.pending[:self.batch_size]
+            self.batches += 1
+            self.in_flight += len(batch)
+            task = self.loop.run_in_executor(self.executor, self.run, [item for item, _ in batch])
+            task.add_done_callback(functools.partial(self.resolve, batch))
+
+    def resolve(self, batch, task):
+        self.in_flight -= len(batch)
+        if task.cancelled():
+            for _, future in batch:
+                future.cancel()
+            return
+        error = task.exception()
+        results = task.result() if error is None else [(False, error)] * len(batch)
+        for (_, future), (ok, result) in zip(batch, results):
+            # Callers may have been cancelled while waiting
+            if future.done():
+                continue
+            if ok:
+                future.set_result(result)
+            else:
+                future.set_exception(result)
+
+    def metrics(self):
+        dispatched = self.submitted - self.queue_depth
+        return {
+            'queue_depth': self.queue_depth,
+            'in_flight': self.in_flight,
+            'max_queue_depth': self.max_queue_depth,
+            'submitted': self.submitted,
+            'batches': self.batches,
+            'mean_batch_size': dispatched / float(self.batches) if self.batches else 0.,
+        }
+
+
+"""
+Batch functions
+"""
+
+def detect_type_batch(values):
+    return detect_types(values)
+
+
+def parse_batch(dtype, to_object, dtype_kwargs, values):
+    return get_datatype(dtype, **dict(dtype_kwargs)).parse_many(values, to_object)
+
+
+def parse_item(dtype, to_object, dtype_kwargs, s):
+    return parse_as_sync(s, dtype, to_object, **dict(dtype_kwargs))
+
+
+def score_similarity_batch(as_type, similarity_measure, dtype_kwargs, pairs):
+    """(score, as_type) for each pair, scoring all pairs sharing s1 together"""
+    results = [None] * len(pairs)
+    groups = {}
+    for i, (s1, s2) in enumerate(pairs):
+        t = as_type if as_type is not None else get_closest_common_type(s1, s2)
+        groups.setdefault((t, value_key(s1)), []).append(i)
+    for (t, _), indices in groups.items():
+        s1 = pairs[indices[0]][0]
+        dtype = get_datatype(t, similarity_measure=similarity_measure, **dict(dtype_kwargs))
+        scores = dtype.score_similarity_many(s1, [pairs[i][1] for i in indices])
+        for i, score in zip(indices, scores):
+            results[i] = (score, t)
+    return results
+
+
+def score_similarity_item(as_type, similarity_measure, dtype_kwargs, pair):
+    return score_similarity_sync(pair[0], pair[1], as_type, similarity_measure,
+                                 **dict(dtype_kwargs))
+
+
+class AsyncMatcher(object):
+    """
+    Coroutine versions of `detect_type`, `parse_as` and `score_similarity`.
+    Calls on the same event loop with the same datatype arguments share a
+    MicroBatcher. Calls with unhashable datatype arguments run on the
+    executor one at a time.
+    """
+
+    def __init__(self, batch_size=256, max_latency=.002, executor=None):
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self.executor = executor
+        # loop -> {(method, args): MicroBatcher}
+        self.loop_batchers = {}
+
+    def batchers(self, loop):
+        batchers = self.loop_batchers.get(loop)
+        if batchers is None:
+            # Forget loops that have closed, their calls can't complete
+            for other in [other for other in self.loop_batchers if other.is_closed()]:
+                del self.loop_batchers[other]
+            batchers = self.loop_batchers[loop] = {}
+        return batchers
+
+    async def submit(self, method, batch_func, item_func, item, *args):
+        loop = asyncio.get_running_loop()
+        batchers = self.batchers(loop)
+        key = (method,) + args
+        try:
+            batcher = batchers.get(key)
+        except TypeError:
+            # Unhashable datatype arguments can't key a batcher
+            return await loop.run_in_executor(self.executor,
+                                              functools.partial(item_func, *args), item)
+        if batcher is None:
+            batcher = batchers[key] = MicroBatcher(
+                functools.partial(batch_func, *args), functools.partial(item_func, *args),
+                self.batch_size, self.max_latency, self.executor)
+        return await batcher.submit(item)
+
+    async def detect_type(self, s):
+        return await self.submit('detect_type', detect_type_batch, detect_type_sync, s)
+
+    async def parse_as(self, s, dtype, to_object=False, **dtype_kwargs):
+        return await self.submit('parse_as', parse_batch, parse_item, s, dtype, to_object,
+                                 tuple(sorted(dtype_kwargs.items())))
+
+    async def score_similarity(self, s1, s2, as_type=None, similarity_measure=None,
+                               **dtype_kwargs):
+        return await self.submit('score_similarity', score_similarity_batch,
+                                 score_similarity_item, (s1, s2), as_type, similarity_measure,
+                                 tuple(sorted(dtype_kwargs.items())))
+
+    def flush(self):
+        """Dispatch all queued calls without waiting out max_latency"""
+        for loop, batchers in self.loop_batchers.items():
+            if loop.is_closed():
+                continue
+            for batcher in batchers.values():
+                batcher.flush()
+
+    def metrics(self):
+        """
+        Total queue depth (calls waiting for their batch to be dispatched)
+        and calls in flight, plus totals per method.
+        """
+        methods = {}
+        all_batchers = [item for batchers in self.loop_batchers.values()
+                        for item in batchers.items()]
+        for key, batcher in all_batchers:
+            totals = methods.setdefault(key[0], dict.fromkeys(
+                ['queue_depth', 'in_flight', 'max_queue_depth', 'submitted', 'batches'], 0))
+            for name, value in batcher.metrics().items():
+                if name == 'max_queue_depth':
+                    totals[name] = max(totals[name], value)
+                elif name in totals:
+                    totals[name] += value
+        return {
+            'queue_depth': sum(m['queue_depth'] for m in methods.values()),
+            'in_flight': sum(m['in_flight'] for m in methods.values()),
+            'methods': methods,
+        }
+
+
+default_matcher = None
+
+
+def get_default_matcher():
+    global default_matcher
+    if default_matcher is None:
+        default_matcher = AsyncMatcher()
+    return default_matcher
+
+
+async def detect_type(s):
+    return await get_default_matcher().detect_type(s)
+
+
+async def parse_as(s, dtype, to_object=False, **dtype_kwargs):
+    return await get_default_matcher().parse_as(s, dtype, to_object, **dtype_kwargs)
+
+
+async def score_similarity(s1, s2, as_type=None, similarity_measure=None, **dtype_kwargs):
+    return await get_default_matcher().score_similarity(s1, s2, as_type, similarity_measure,
+                                                        **dtype_kwargs)
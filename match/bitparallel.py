@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+"""
+One-vs-many sequence similarity. The query's character bitmasks are built
+once and all candidates are scored together in NumPy: Myers' bit-parallel
+algorithm for Levenshtein distance and bitmask matching for Jaro. Scores are
+equal to py_stringmatching's, which also scores single pairs.
+
+The measures also test single pairs against a threshold with the bounds of
+`match.threshold`.
+"""
+try:
+    import numpy as np
+except ImportError:
+    np = None
+import py_stringmatching as sm
+
+from .threshold import (MAX_BANDED_DISTANCE, bounded_levenshtein, jaro_upper_bound,
+                        jaro_winkler_upper_bound, max_levenshtein_distance, to_float32)
+
+
+WORD_SIZE = 64
+# Fewer candidates than this are scored one pair at a time
+MIN_BULK_SIZE = 16
+
+
+def code_matrix(strings):
+    """
+    (len(strings), max length) array of code points, zero padded, and an
+    array of the string lengths
+    """
+    lengths = np.array([len(s) for s in strings], dtype=np.int64)
+    width = int(lengths.max()) if len(strings) else 0
+    if not width:
+        return np.zeros((len(strings), 0), dtype=np.uint32), lengths
+    codes = np.array(strings, dtype='U{}'.format(width)).view(np.uint32)
+    return codes.reshape(len(strings), width), lengths
+
+
+def low_bits(k):
+    """uint64 masks of the k lowest bits, for an array of 0 <= k <= 64"""
+    table = np.array([(1 << i) - 1 for i in range(WORD_SIZE + 1)], dtype=np.uint64)
+    return table[np.clip(k, 0, WORD_SIZE)]
+
+
+def position_masks(matches):
+    """uint64 bitmask of the True positions in each row of a (n, <= 64) bool array"""
+    padded = np.zeros((len(matches), WORD_SIZE), dtype=bool)
+    padded[:, :matches.shape[1]] = matches
+    return np.packbits(padded, axis=1, bitorder='little').view('<u8').ravel()
+
+
+def levenshtein_distances(query, candidates):
+    """
+    Levenshtein distance from query (at most 64 characters) to each of
+    candidates, running Myers' algorithm on all candidates at once.
+    """
+    m = len(query)
+    codes, lengths = code_matrix(candidates)
+    if not m:
+        return lengths
+    chars = sorted(set(query))
+    alphabet = np.array([ord(c) for c in chars], dtype=np.uint32)
+    # Bitmask of the query positions of each character, 0 for characters
+    # not in the query
+    peq = [0] * (len(chars) + 1)
+    for i, c in enumerate(query):
+        peq[chars.index(c) + 1] |= 1 << i
+    peq = np.array(peq, dtype=np.uint64)
+    found = np.minimum(np.searchsorted(alphabet, codes), len(alphabet) - 1)
+    eq_ids = np.where(alphabet[found] == codes, found + 1, 0)
+
+    # Longest first, so the candidates still running are a prefix
+    order = np.argsort(-lengths, kind='stable')
+    eq_ids = eq_ids[order]
+    remaining = -lengths[order]
+    n = len(candidates)
+    one = np.uint64(1)
+    last = np.uint64(1 << (m - 1))
+    vp = np.full(n, (1 << m) - 1, dtype=np.uint64)
+    vn = np.zeros(n, dtype=np.uint64)
+    distances = np.full(n, m, dtype=np.int64)
+    for t in range(codes.shape[1]):
+        k = np.searchsorted(remaining, -t)
+        eq = peq[eq_ids[:k, t]]
+        vp_k = vp[:k]
+        vn_k = vn[:k]
+        x = eq | vn_k
+        d0 = (((x & vp_k) + vp_k) ^ vp_k) | x
+        hp = vn_k | ~(d0 | vp_k)
+        hn = vp_k & d0
+        distances[:k] += (hp & last != 0).astype(np.int64) - (hn & last != 0)
+        x = (hp << one) | one
+        vn[:k] = x & d0
+        vp[:k] = (hn << one) | ~(x | d0)
+    result = np.empty(n, dtype=np.int64)
+    result[order] = distances
+    return result
+
+
+def jaro_parts(query, candidates):
+    """
+    (codes, lengths, common characters, transpositions) of query against
+    each of candidates (at most 64 characters), matching greedily in query
+    order as py_stringmatching does.
+    """
+    codes, lengths = code_matrix(candidates)
+    n, width = codes.shape
+    len1 = len(query)
+    in_string = np.arange(width) < lengths[:, None]
+    eq = {}
+    for c in set(query):
+        eq[c] = position_masks((codes == ord(c)) & in_string)
+    search_range = np.maximum(np.maximum(len1, lengths) // 2 - 1, 0)
+    flags = np.zeros(n, dtype=np.uint64)
+    one = np.uint64(1)
+    # Matched candidate position for each query position, or -1
+    matched = np.full((n, len1), -1, dtype=np.int64)
+    for i, c in enumerate(query):
+        low = np.maximum(i - search_range, 0)
+        high = np.minimum(i + search_range, lengths - 1)
+        window = low_bits(high + 1) & ~low_bits(low)
+        available = eq[c] & ~flags & window
+        lowest = available & (~available + one)
+        flags |= lowest
+        hit = lowest != 0
+        matched[hit, i] = np.log2(lowest[hit].astype(np.float64)).astype(np.int64)
+    common = (matched >= 0).sum(axis=1)
+    # Pair the k-th matched query character with the k-th matched candidate
+    # character
+    missing = max(width, len1) + 1
+    is_matched = matched >= 0
+    query_positions = np.sort(np.where(is_matched, np.arange(len1), missing), axis=1)
+    candidate_positions = np.sort(np.where(is_matched, matched, missing), axis=1)
+    query_codes = np.array([ord(c) for c in query] + [0], dtype=np.uint32)
+    query_chars = query_codes[np.minimum(query_positions, len1)]
+    candidate_chars = np.take_along_axis(
+        np.concatenate([codes, np.zeros((n, 1), dtype=np.uint32)], axis=1),
+        np.minimum(candidate_positions, width), axis=1)
+    transpositions = ((query_chars != candidate_chars) &
+                      (np.arange(len1) < common[:, None])).sum(axis=1) // 2
+    return codes, lengths, common, transpositions
+
+
+def jaro_scores(query, candidates):
+    """Jaro similarity of query to each of candidates (at most 64 characters)"""
+    codes, lengths, common, transpositions = jaro_parts(query, candidates)
+    scores = np.zeros(len(candidates), dtype=np.float64)
+    ok = common > 0
+    c = common[ok].astype(np.float64)
+    scores[ok] = (c / len(query) + c / lengths[ok] + (c - transpositions[ok]) / c) / 3
+    # py_stringmatching returns a C float
+    return scores.astype(np.float32)
+
+
+def jaro_winkler_scores(query, candidates, prefix_weight=.1):
+    """Jaro-Winkler similarity of query to each of candidates (at most 64 characters)"""
+    scores = jaro_scores(query, candidates)
+    codes, lengths = code_matrix(candidates)
+    prefix = np.zeros(len(candidates), dtype=np.int64)
+    same = np.ones(len(candidates), dtype=bool)
+    for p in range(min(len(query), 4, codes.shape[1])):
+        same &= (lengths > p) & (codes[:, p] == ord(query[p]))
+        prefix += same
+    # As py_stringmatching: C floats, with the bonus computed in double
+    scores = scores.astype(np.float64)
+    weight = float(np.float32(prefix_weight))
+    bonus = prefix * weight * (1 - scores)
+    return np.where(prefix > 0, scores + bonus, scores).astype(np.float32)
+
+
+class BulkSimilarityMixin(object):
+    """
+    similarity_many for a py_stringmatching sequence measure: scores query
+    against candidates with score_many where it applies, otherwise one pair
+    at a time with get_sim_score.
+    """
+
+    def similarity_many(self, query, candidates):
+        candidates = list(candidates)
+        if (np is None or len(candidates) < MIN_BULK_SIZE or not isinstance(query, str) or
+                not all(isinstance(c, str) for c in candidates)):
+            return [self.get_sim_score(query, c) for c in candidates]
+        bulk = [i for i, c in enumerate(candidates) if self.can_score_many(query, c)]
+        scores = [None] * len(candidates)
+        if bulk:
+            for i, score in zip(bulk, self.score_many(query, [candidates[i] for i in bulk])):
+                scores[i] = float(score)
+        for i, c in enumerate(candidates):
+            if scores[i] is None:
+                scores[i] = self.get_sim_score(query, c)
+        return scores
+
+    def can_score_many(self, query, candidate):
+        raise NotImplementedError
+
+    def score_many(self, query, candidates):
+        raise NotImplementedError
+
+
+class Levenshtein(BulkSimilarityMixin, sm.Levenshtein):
+
+    def can_score_many(self, query, candidate):
+        # py_stringmatching's distance differs outside the Basic Multilingual
+        # Plane, leave those to it so both paths agree
+        return (0 < len(query) <= WORD_SIZE and max(query) <= u'\uffff' and
+                (not candidate or max(candidate) <= u'\uffff'))
+
+    def score_many(self, query, candidates):
+        distances = levenshtein_distances(query, candidates)
+        lengths = np.array([len(c) for c in candidates], dtype=np.int64)
+        return 1 - distances / np.maximum(lengths, len(query)).astype(np.float64)
+
+    def exceeds_threshold(self, s1, s2, threshold):
+        """Whether get_sim_score(s1, s2) > threshold, by a distance bounded by threshold"""
+        if not (isinstance(s1, str) and isinstance(s2, str)) or max(s1 + s2 or u' ') > u'\uffff':
+            return self.get_sim_score(s1, s2) > threshold
+        max_len = max(len(s1), len(s2))
+        if not max_len:
+            return 1. > threshold
+        k = max_levenshtein_distance(threshold, max_len)
+        if k < 0 or abs(len(s1) - len(s2)) > k:
+            return False
+        if k > MAX_BANDED_DISTANCE:
+            return self.get_sim_score(s1, s2) > threshold
+        return bounded_levenshtein(s1, s2, k) is not None
+
+
+class Jaro(BulkSimilarityMixin, sm.Jaro):
+
+    def can_score_many(self, query, candidate):
+        return len(candidate) <= WORD_SIZE
+
+    def score_many(self, query, candidates):
+        if not query:
+            return np.zeros(len(candidates))
+        return jaro_scores(query, candidates)
+
+    def exceeds_threshold(self, s1, s2, threshold):
+        """Whether get_sim_score(s1, s2) > threshold, rejecting by string lengths first"""
+        # Strings of equal length have an upper bound of 1
+        if (isinstance(s1, str) and isinstance(s2, str) and len(s1) != len(s2) and
+                to_float32(jaro_upper_bound(len(s1), len(s2))) <= threshold):
+            return False
+        return self.get_sim_score(s1, s2) > threshold
+
+
+class JaroWinkler(BulkSimilarityMixin, sm.JaroWinkler):
+
+    def can_score_many(self, query, candidate):
+        return len(candidate) <= WORD_SIZE
+
+    def score_many(self, query, candidates):
+        if not query:
+            return np.zeros(len(candidates))
+        return jaro_winkler_scores(query, candidates, self.prefix_weight)
+
+    def exceeds_threshold(self, s1, s2, threshold):
+        """Whether get_sim_score(s1, s2) > threshold, rejecting by lengths and prefix first"""
+        if (isinstance(s1, str) and isinstance(s2, str) and len(s1) != len(s2) and
+                jaro_winkler_upper_bound(s1, s2, self.prefix_weight) <= threshold):
+            return False
+        return self.get_sim_score(s1, s2) > threshold
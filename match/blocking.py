@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""
+Blocking: generate candidate pairs so that only records sharing a block key
+are scored, instead of every pair.
+"""
+from .datatypes import get_datatype
+from .match import detect_column_type
+from .similarity import get_cleaner, get_tokenizer
+
+
+class BlockingStats(object):
+
+    def __init__(self, n_left, n_right, self_join=False):
+        self.n_left = n_left
+        self.n_right = n_right
+        self.self_join = self_join
+        self.n_candidates = 0
+        # Pairs generated per block, before de-duplication across blocks
+        self.block_pairs = {}
+
+    @property
+    def total_pairs(self):
+        if self.self_join:
+            return self.n_left * (self.n_left - 1) // 2
+        return self.n_left * self.n_right
+
+    @property
+    def reduction_ratio(self):
+        if not self.total_pairs:
+            return 0.
+        return 1 - self.n_candidates / float(self.total_pairs)
+
+    def __repr__(self):
+        return '<BlockingStats candidates={0} total={1} reduction_ratio={2:.4f}>'.format(
+            self.n_candidates, self.total_pairs, self.reduction_ratio)
+
+
+class Blocker(object):
+    # Whether a value can fall in more than one block, in which case a pair
+    # is only generated from the first block its values share
+    multi_key = False
+
+    def __init__(self, max_block_size=None):
+        self.max_block_size = max_block_size
+        self.stats = None
+
+    def block_keys(self, values):
+        """Iterable of block keys for each of values"""
+        raise NotImplementedError
+
+    def index(self, values):
+        blocks = {}
+        for i, keys in enumerate(self.block_keys(values)):
+            for key in keys:
+                if key is not None:
+                    blocks.setdefault(key, []).append(i)
+        if self.max_block_size:
+            blocks = dict((k, ids) for k, ids in blocks.items()
+                          if len(ids) <= self.max_block_size)
+        return blocks
+
+    def candidate_pairs(self, left, right=None):
+        """
+        Yields (i, j) index pairs of candidate matches between left and right,
+        or within left if right is None (with i < j). `self.stats` is filled
+        in as pairs are generated.
+        """
+        left = list(left)
+        self_join = right is None
+        right = left if self_join else list(right)
+        stats = self.stats = BlockingStats(len(left), len(right), self_join)
+        left_index = self.index(left)
+        right_index = left_index if self_join else self.index(right)
+        if self.multi_key:
+            # Blocks are ranked in visiting order. Per value, the ranks of
+            # its blocks that are shared by both sides, lowest first
+            left_ranks = {}
+            right_ranks = {}
+            for rank, (key, left_ids) in enumerate(left_index.items()):
+                right_ids = right_index.get(key)
+                if not right_ids:
+                    continue
+                for i in left_ids:
+                    left_ranks.setdefault(i, []).append(rank)
+                for j in right_ids:
+                    right_ranks.setdefault(j, set()).add(rank)
+        for rank, (key, left_ids) in enumerate(left_index.items()):
+            right_ids = right_index.get(key)
+            if not right_ids:
+                continue
+            n_block = 0
+            for i in left_ids:
+                for j in right_ids:
+                    if self_join and j <= i:
+                        continue
+                    n_block += 1
+                    if self.multi_key and first_shared(left_ranks[i], right_ranks[j]) != rank:
+                        continue
+                    stats.n_candidates += 1
+                    yield i, j
+            stats.block_pairs[key] = n_block
+
+
+def first_shared(ranks, other_ranks):
+    """Lowest of the sorted ranks that is also in the set other_ranks"""
+    for rank in ranks:
+        if rank in other_ranks:
+            return rank
+    return None
+
+
+class StandardBlocker(Blocker):
+    """One key per value: the cleaned value, optionally truncated to a prefix"""
+
+    def __init__(self, cleaner='alphanum', prefix_length=None, **kwargs):
+        super(StandardBlocker, self).__init__(**kwargs)
+        self.cleaner = get_cleaner(cleaner)
+        self.prefix_length = prefix_length
+
+    def block_keys(self, values):
+        for s in values:
+            key = self.cleaner(s)
+            if self.prefix_length:
+                key = key[:self.prefix_length]
+            yield [key or None]
+
+
+class CanonicalKeyBlocker(Blocker):
+    """One key per value: its canonical key as a given datatype"""
+
+    def __init__(self, as_type, max_block_size=None, **dtype_kwargs):
+        super(CanonicalKeyBlocker, self).__init__(max_block_size=max_block_size)
+        self.datatype = get_datatype(as_type, **dtype_kwargs)
+
+    def block_keys(self, values):
+        return ([key] for key in self.datatype.bulk_canonicalize(values))
+
+
+class QgramBlocker(Blocker):
+    """
+    One key per token, so values sharing any q-gram are candidates. Use
+    max_block_size to drop very common tokens.
+    """
+    multi_key = True
+
+    def __init__(self, tokenizer='3grams_set', cleaner='alphanum', **kwargs):
+        super(QgramBlocker, self).__init__(**kwargs)
+        self.tokenizer = get_tokenizer(tokenizer)
+        self.cleaner = get_cleaner(cleaner)
+
+    def block_keys(self, values):
+        for s in values:
+            s = self.cleaner(s)
+            yield set(self.tokenizer.tokenize(s)) if s else ()
+
+
+class SortedNeighbourhoodBlocker(Blocker):
+    """
+    Sorts all values by key and pairs each value with the values within
+    `window` positions of it.
+    """
+
+    def __init__(self, cleaner='alphanum', window=5, **kwargs):
+        super(SortedNeighbourhoodBlocker, self).__init__(**kwargs)
+        self.cleaner = get_cleaner(cleaner)
+        self.window = window
+
+    def candidate_pairs(self, left, right=None):
+        left = list(left)
+        self_join = right is None
+        right = [] if self_join else list(right)
+        stats = self.stats = BlockingStats(len(left), len(right), self_join)
+        records = [(self.cleaner(s), 0, i) for i, s in enumerate(left)]
+        records.extend((self.cleaner(s), 1, j) for j, s in enumerate(right))
+        records.sort()
+        # Each value has one position, so every pair is visited only once
+        for pos, (key, side, idx) in enumerate(records):
+            for other_key, other_side, other_idx in records[pos + 1:pos + self.window]:
+                if self_join:
+                    pair = (min(idx, other_idx), max(idx, other_idx))
+                elif side != other_side:
+                    pair = (idx, other_idx) if side == 0 else (other_idx, idx)
+                else:
+                    continue
+                stats.n_candidates += 1
+                yield pair
+
+
+blocker_lookup = {
+    'standard': StandardBlocker,
+    'canonical_key': CanonicalKeyBlocker,
+    'qgram': QgramBlocker,
+    'sorted_neighbourhood': SortedNeighbourhoodBlocker,
+}
+
+
+def get_blocker(blocker, **kwargs):
+    if isinstance(blocker, str):
+        try:
+            return blocker_lookup[blocker](**kwargs)
+        except KeyError:
+            raise KeyError("No such blocker {}".format(blocker))
+    if not hasattr(blocker, 'candidate_pairs'):
+        raise ValueError("blocker must have a `candidate_pairs` callable")
+    return blocker
+
+
+def score_candidate_pairs(pairs, left, right=None, as_type=None, **dtype_kwargs):
+    """
+    Score candidate pairs with the datatype's similarity. Yields (i, j, score).
+    """
+    left = list(left)
+    right = left if right is None else list(right)
+    if as_type is None:
+        (score, as_type), _ = detect_column_type(left)
+    dtype = get_datatype(as_type, **dtype_kwargs)
+    for i, j in pairs:
+        yield i, j, dtype.score_similarity(left[i], right[j])
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""
+`match` command: streaming deduplication of one column of a CSV or JSON
+lines file.
+
+    match people.csv --column email > clusters.csv
+    match people.jsonl --column name --output-mode pairs --threshold .9
+
+Rows are read and processed in chunks. Each value is compared only to the
+representatives retained for its blocks, and at most --max-block-size
+representatives are kept per block (one with canonical_key blocking, where
+equal keys are matches). Memory therefore grows with the number of distinct
+block keys rather than the number of rows: with canonical_key blocking that
+is one entry per distinct canonical value.
+"""
+import argparse
+import csv
+import io
+import itertools
+import json
+import sys
+import time
+
+from .blocking import CanonicalKeyBlocker, get_blocker
+from .datatypes import get_datatype
+from .match import infer_column_type
+
+
+def read_rows(f, fmt):
+    if fmt == 'csv':
+        for row in csv.DictReader(f):
+            yield row
+    else:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+class ColumnNotFound(ValueError):
+    pass
+
+
+def as_text(value):
+    """JSON values as strings for blocking and scoring, None if missing"""
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, sort_keys=True)
+    return str(value)
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class Progress(object):
+
+    def __init__(self, out, every=5.):
+        self.out = out
+        self.every = every
+        self.rows = 0
+        self.start = self.last = time.time()
+
+    def update(self, n):
+        self.rows += n
+        now = time.time()
+        if self.out is not None and now - self.last >= self.every:
+            self.last = now
+            self.report()
+
+    def report(self, final=False):
+        if self.out is None:
+            return
+        elapsed = max(time.time() - self.start, 1e-9)
+        self.out.write('{0}{1} rows, {2:.0f} rows/sec\n'.format(
+            'done: ' if final else '', self.rows, self.rows / elapsed))
+        self.out.flush()
+
+
+class StreamingMatcher(object):
+    """
+    Assigns each value a cluster: the id of the first retained value in one
+    of its blocks that it matches, or its own id.
+    """
+
+    def __init__(self, datatype, blocker, threshold=.9, max_block_size=100):
+        self.datatype = datatype
+        self.blocker = blocker
+        self.threshold = threshold
+        self.max_block_size = max_block_size
+        # Equal canonical keys are matches, no need to score them
+        self.exact = isinstance(blocker, CanonicalKeyBlocker)
+        # Block key -> [(row id, value)]
+        self.blocks = {}
+
+    def match_chunk(self, row_ids, values, block_keys=None):
+        """Yields (row_id, cluster_id, score) for each value"""
+        values = [as_text(value) for value in values]
+        if block_keys is None:
+            block_keys = self.blocker.block_keys(values)
+        for row_id, value, keys in zip(row_ids, values, block_keys):
+            keys = [k for k in keys if k is not None]
+            best = (None, 0)
+            for key in keys:
+                block = self.blocks.get(key, ())
+                if self.exact:
+                    if block and self.threshold <= 1:
+                        best = (block[0][0], 1)
+                        break
+                    continue
+                scores = self.datatype.score_similarity_many(
+                    value, [other for _, other in block])
+                for (other_id, other), score in zip(block, scores):
+                    if score >= self.threshold and score > best[1]:
+                        best = (other_id, score)
+            if best[0] is not None:
+                yield row_id, best[0], best[1]
+                continue
+            # Only the first value of an exact block is ever matched against
+            max_block_size = 1 if self.exact else self.max_block_size
+            for key in keys:
+                block = self.blocks.setdefault(key, [])
+                if len(block) < max_block_size:
+                    block.append((row_id, value))
+            yield row_id, row_id, None
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='match', description='Find duplicate values in a column of a CSV or JSON lines file.')
+    parser.add_argument('input', help="input file, or - for stdin")
+    parser.add_argument('--column', required=True, help="column (or JSON key) to deduplicate")
+    parser.add_argument('--format', choices=['csv', 'jsonl'],
+                        help="input format, guessed from the file extension by default")
+    parser.add_argument('--type', dest='dtype', help="datatype of the column, detected by default")
+    parser.add_argument('--blocker', choices=['canonical_key', 'standard', 'qgram'],
+                        help="blocking strategy, canonical_key for entity types and "
+                             "standard for strings by default")
+    parser.add_argument('--prefix-length', type=int, default=4,
+                        help="key prefix length for standard blocking")
+    parser.add_argument('--threshold', type=float, default=.9,
+                        help="minimum similarity for a match")
+    parser.add_argument('--max-block-size', type=int, default=100,
+                        help="representatives kept per block")
+    parser.add_argument('--chunk-size', type=int, default=10000, help="rows read at a time")
+    parser.add_argument('--output', default='-', help="output file, or - for stdout")
+    parser.add_argument('--output-mode', choices=['clusters', 'pairs'], default='clusters',
+                        help="a cluster id for every row, or only matching pairs")
+    parser.add_argument('--quiet', action='store_true', help="don't report progress")
+    return parser
+
+
+def open_input(path):
+    if path == '-':
+        return sys.stdin
+    return io.open(path, newline='', encoding='utf-8')
+
+
+def open_output(path):
+    if path == '-':
+        return sys.stdout
+    return io.open(path, 'w', newline='', encoding='utf-8')
+
+
+def run(args, log=sys.stderr):
+    fmt = args.format
+    if fmt is None:
+        fmt = 'jsonl' if args.input.endswith(('.jsonl', '.json', '.ndjson')) else 'csv'
+    infile = open_input(args.input)
+    outfile = open_output(args.output)
+    progress = Progress(None if args.quiet else log)
+    try:
+        chunks = chunked(read_rows(infile, fmt), args.chunk_size)
+        first = next(chunks, [])
+        if first and not any(args.column in row for row in first):
+            raise ColumnNotFound("column {0!r} not found in {1}".format(args.column, args.input))
+        chunks = itertools.chain([first], chunks)
+        dtype = args.dtype
+        if dtype is None:
+            dtype = infer_column_type([as_text(row.get(args.column)) for row in first],
+                                      random_state=0).dtype or 'string'
+            if not args.quiet:
+                log.write('detected column type: {}\n'.format(dtype))
+        blocker = args.blocker
+        if blocker is None:
+            blocker = 'standard' if dtype == 'string' else 'canonical_key'
+        if blocker == 'canonical_key':
+            blocker = get_blocker(blocker, as_type=dtype)
+        elif blocker == 'standard':
+            blocker = get_blocker(blocker, prefix_length=args.prefix_length)
+        else:
+            blocker = get_blocker(blocker)
+        datatype = get_datatype(dtype)
+        matcher = StreamingMatcher(datatype, blocker, threshold=args.threshold,
+                                   max_block_size=args.max_block_size)
+        writer = csv.writer(outfile)
+        if args.output_mode == 'clusters':
+            writer.writerow(['row', 'cluster', 'parsed'])
+        else:
+            writer.writerow(['row', 'match_row', 'score'])
+        row_id = 0
+        for chunk in chunks:
+            values = [as_text(row.get(args.column)) for row in chunk]
+            row_ids = range(row_id, row_id + len(values))
+            row_id += len(values)
+            parsed = datatype.bulk_canonicalize(values)
+            block_keys = [[key] for key in parsed] if matcher.exact else None
+            matches = matcher.match_chunk(row_ids, values, block_keys)
+            for (i, cluster, score), key in zip(matches, parsed):
+                if args.output_mode == 'clusters':
+                    writer.writerow([i, cluster, '' if key is None else key])
+                elif score is not None:
+                    writer.writerow([i, cluster, score])
+            progress.update(len(values))
+        progress.report(final=True)
+    finally:
+        if infile is not sys.stdin:
+            infile.close()
+        if outfile is not sys.stdout:
+            outfile.close()
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    try:
+        run(args)
+    except ColumnNotFound as e:
+        parser.error(str(e))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
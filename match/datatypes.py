@@ -1,18 +1,48 @@
+from collections import Counter, namedtuple
 import datetime
+import random
 import re
+import threading
+import time
 
-from dateutil import parser
-import phonenumbers
+from .similarity import get_similarity_measure, similarity_measure_lookup
+from .threshold import exceeds_threshold
+from .utils import LazyModule, LRUCache, memoize, optional_module, reservoir_sample
 
-from .utils import memoize
+# Imported on first use by the types that need them
+parser = LazyModule('dateutil.parser')
+phonenumbers = LazyModule('phonenumbers')
+np = optional_module('numpy')
+
+
+def value_key(s):
+    """
+    Key for results computed once per value: equal values of different
+    types, like 1, 1.0 and True, clean to different strings
+    """
+    return (type(s), s)
 
 
 class DataType(object):
     super_types = []
     SIMILARITY_MATCH_THRESHOLD = .95
+    # Highest score_type_match can return, None if unbounded. Subclasses
+    # overriding score_type_match must update it
+    MAX_TYPE_MATCH_SCORE = None
+
+    # Max entries in the per-instance parse cache, 0 disables it
+    parse_cache_size = 0
 
     def __init__(self, **kwargs):
-        pass
+        self.parse_cache = None
+        if self.parse_cache_size:
+            self.enable_parse_cache(self.parse_cache_size)
+
+    def enable_parse_cache(self, maxsize=4096):
+        self.parse_cache = LRUCache(maxsize)
+
+    def disable_parse_cache(self):
+        self.parse_cache = None
 
     def validate_and_clean(self, s):
         if not s:
@@ -24,14 +54,61 @@ class DataType(object):
     def score_similarity(self, s1, s2):
         return -1
 
+    def score_similarity_many(self, s, others):
+        """score_similarity of s to each of others"""
+        return [self.score_similarity(s, other) for other in others]
+
     def score_type_match(self, s):
         return -1
 
+    def score_type_matches(self, values):
+        """score_type_match for each of values"""
+        return [self.score_type_match(s) for s in values]
+
     def is_eligible(self, s):
         # First pass check. Purpose is to be much faster than parse
         return True
 
+    @classmethod
+    def accepts_fingerprint(cls, fp):
+        # Zeroth pass check on a `fingerprint`, shared by all types
+        return True
+
     def parse(self, s, to_object=False):
+        if self.parse_cache is not None:
+            try:
+                obj = self.parse_cache.get_or_compute(
+                    (type(s), s, to_object), lambda: self._parse(s, to_object))
+            except TypeError:
+                # Unhashable input
+                pass
+            else:
+                # Cached objects are shared, so callers get their own copy
+                return self.copy_object(obj) if to_object and obj is not None else obj
+        return self._parse(s, to_object)
+
+    def parse_many(self, values, to_object=False):
+        """parse for each of values, parsing repeated values once"""
+        parsed = {}
+        result = []
+        for s in values:
+            try:
+                obj = parsed[value_key(s)]
+            except KeyError:
+                obj = parsed[value_key(s)] = self.parse(s, to_object)
+            except TypeError:
+                obj = self.parse(s, to_object)
+            else:
+                if to_object and obj is not None:
+                    obj = self.copy_object(obj)
+            result.append(obj)
+        return result
+
+    def copy_object(self, obj):
+        """Copy of a parsed object, for types that parse to mutable objects"""
+        return obj
+
+    def _parse(self, s, to_object):
         s = self.validate_and_clean(s)
         if not s:
             return None
@@ -47,23 +124,89 @@ class DataType(object):
     def to_string(self, obj):
         return str(obj)
 
+    def is_similar(self, s1, s2, threshold):
+        """Whether score_similarity(s1, s2) > threshold"""
+        return self.score_similarity(s1, s2) > threshold
+
     def is_exact_match(self, s1, s2):
-        if self.score_similarity(s1, s2) > self.SIMILARITY_MATCH_THRESHOLD:
-            return True
-        return False
+        return self.is_similar(s1, s2, self.SIMILARITY_MATCH_THRESHOLD)
+
+    def canonical_key(self, s):
+        """
+        Hashable key for s, values with equal keys are exact matches. None if
+        s does not parse as this type.
+        """
+        return self.parse(s)
+
+    def bulk_canonicalize(self, values):
+        """canonical_key for each of values, computing repeated values once"""
+        keys = {}
+        result = []
+        for s in values:
+            try:
+                key = keys[value_key(s)]
+            except KeyError:
+                key = keys[value_key(s)] = self.canonical_key(s)
+            except TypeError:
+                key = self.canonical_key(s)
+            result.append(key)
+        return result
 
 
 class StringType(DataType):
     name = 'string'
+    MAX_TYPE_MATCH_SCORE = 0
 
     default_similarity_measure = 'jaro'
 
     def __init__(self, **kwargs):
-        self.similarity_measure = kwargs.get('similarity_measure',
-                                             self.default_similarity_measure)
+        super(StringType, self).__init__(**kwargs)
+        measure = kwargs.get('similarity_measure')
+        if measure is None:
+            measure = self.default_similarity_measure
+        self._similarity = None
+        if isinstance(measure, str):
+            # Named measures are built on first use, so types that are only
+            # parsed don't import them
+            if measure not in similarity_measure_lookup:
+                raise KeyError("No such similarity measure {}".format(measure))
+            self._similarity_measure = None
+            self._measure_name = measure
+        else:
+            self._similarity_measure = get_similarity_measure(measure)
+
+    @property
+    def similarity_measure(self):
+        if self._similarity_measure is None:
+            self._similarity_measure = get_similarity_measure(self._measure_name)
+        return self._similarity_measure
 
     def score_similarity(self, s1, s2):
-        return self.similarity_measure.similarity(s1, s2)
+        if self._similarity is None:
+            measure = self.similarity_measure
+            if hasattr(measure, 'similarity'):
+                self._similarity = measure.similarity
+            else:
+                self._similarity = measure.get_sim_score
+        return self._similarity(s1, s2)
+
+    def scores_with_measure(self):
+        # Subclasses scoring by canonical key don't use the similarity measure
+        return type(self).score_similarity is StringType.score_similarity
+
+    def score_similarity_many(self, s, others):
+        if self.scores_with_measure() and hasattr(self.similarity_measure, 'similarity_many'):
+            return self.similarity_measure.similarity_many(s, others)
+        return super(StringType, self).score_similarity_many(s, others)
+
+    def is_similar(self, s1, s2, threshold):
+        if not self.scores_with_measure():
+            return super(StringType, self).is_similar(s1, s2, threshold)
+        # Measures with an early-terminating test stop once threshold is out of reach
+        return exceeds_threshold(self.similarity_measure, s1, s2, threshold)
+
+    def parse_to_object(self, s):
+        return s
 
     def score_type_match(self, s):
         return 0
@@ -80,41 +223,94 @@ class StringType(DataType):
 
 @memoize
 def closest_common_type(t1, t2):
-    t1 = get_datatype(t1)
-    t2 = get_datatype(t2)
     if t1 == t2:
         return t1
-    for t in t1.super_types:
-        if t in t2.super_types:
-            return t
-    return None
+    t1 = registry.get_class(t1)
+    t2 = registry.get_class(t2)
+    for t in [t1] + t1.super_types:
+        if t is t2 or t in t2.super_types:
+            return t.name
+    return DEFAULT_DATATYPE
 
 def get_closest_common_type(s1, s2):
+    from .match import detect_type
     score, s1_type = detect_type(s1)
     score, s2_type = detect_type(s2)
     dtype = closest_common_type(s1_type, s2_type)
     return dtype
 
 
+Fingerprint = namedtuple('Fingerprint', ['length', 'digits', 'alphas', 'spaces',
+                                         'punctuation', 'has_at', 'has_colon', 'has_dot'])
+
+
+def fingerprint(s):
+    """Cheap character-class summary of s, computed in a single pass"""
+    if not s:
+        s = ''
+    if not isinstance(s, str):
+        s = str(s)
+    s = s.strip()
+    digits = alphas = spaces = punctuation = 0
+    for c in s:
+        if c.isdigit():
+            digits += 1
+        elif c.isalpha():
+            alphas += 1
+        elif c.isspace():
+            spaces += 1
+        else:
+            punctuation += 1
+    return Fingerprint(len(s), digits, alphas, spaces, punctuation,
+                       '@' in s, ':' in s, '.' in s)
+
+
 def eligible_types(s):
-    # TODO
-    return ALL_TYPES
+    fp = fingerprint(s)
+    return [t for t in ALL_TYPES if datatype_lookup[t].accepts_fingerprint(fp)]
 
 
 """
 Phone
 """
 
+# libphonenumber needs at least two digits to consider a number viable
+two_digits_regex = re.compile(r'\d\D*\d')
+
+# Common North American Numbering Plan shapes: an optional 1 or +1, the area
+# code (optionally in parentheses), exchange and line, with optional single
+# separators. Groups: area code (in parentheses), area code, exchange, line.
+nanp_regex = re.compile(r'^(?:\+?1[ .-]?)?(?:\(([2-9]\d\d)\)|([2-9]\d\d))[ .-]?'
+                        r'(\d{3})[ .-]?(\d{4})$', re.ASCII)
+
+
 class PhoneNumberType(StringType):
     super_types = [StringType]
+    parse_cache_size = 4096
     name = 'phonenumber'
+    MAX_TYPE_MATCH_SCORE = 1
 
     # TODO: locale support
     default_region = "US"
 
+    def __init__(self, default_region=None, **kwargs):
+        super(PhoneNumberType, self).__init__(**kwargs)
+        if default_region is not None:
+            self.default_region = default_region
+        # Common shapes are parsed without libphonenumber in NANP regions
+        self.nanp = phonenumbers.country_code_for_region(self.default_region) == 1
+
     def is_eligible(self, s):
         return (len(s) > 6 and
-                len(s) < 20)
+                len(s) < 20 and
+                two_digits_regex.search(s) is not None)
+
+    @classmethod
+    def accepts_fingerprint(cls, fp):
+        # libphonenumber needs at least two digits to consider a number viable
+        return (fp.length > 6 and
+                fp.length < 20 and
+                fp.digits >= 2)
 
     def to_string(self, obj):
         return phonenumbers.format_number(obj,
@@ -125,6 +321,16 @@ class PhoneNumberType(StringType):
         if not number:
             return None
         number = number.strip()
+        if self.nanp:
+            match = nanp_regex.match(number)
+            if match is not None:
+                area, area_no_parens, exchange, line = match.groups()
+                parsed_number = phonenumbers.PhoneNumber(
+                    country_code=1,
+                    national_number=int((area or area_no_parens) + exchange + line))
+                if not phonenumbers.is_valid_number(parsed_number):
+                    return None
+                return parsed_number
         try:
             parsed_number = phonenumbers.parse(number, self.default_region)
             if not phonenumbers.is_valid_number(parsed_number):
@@ -133,11 +339,19 @@ class PhoneNumberType(StringType):
         except phonenumbers.NumberParseException:
             return None
 
+    def copy_object(self, obj):
+        copied = phonenumbers.PhoneNumber()
+        copied.merge_from(obj)
+        return copied
+
     def score_type_match(self, s):
         return int(self.parse(s) is not None)
 
+    def score_type_matches(self, values):
+        return [int(obj is not None) for obj in self.parse_many(values)]
+
     def score_similarity(self, s1, s2):
-        return int(self.parse(s1) == self.parse(s2))
+        return int(self.canonical_key(s1) == self.canonical_key(s2))
 
 
 """
@@ -146,10 +360,36 @@ Email
 
 email_regex = re.compile(r'^[a-z0-9._%+-]+@[a-z0-9.-]+\.[a-z]{2,}$')
 
+EmailRule = namedtuple('EmailRule', ['host', 'strip_dots', 'strip_plus'])
+
+# Provider specific canonicalization, by (lowercase) host: the canonical
+# host, whether the provider ignores dots in the local part, and whether it
+# ignores everything after a +
+email_rules = {
+    'gmail.com': EmailRule('gmail.com', True, True),
+    'googlemail.com': EmailRule('gmail.com', True, True),
+    'outlook.com': EmailRule('outlook.com', False, True),
+    'hotmail.com': EmailRule('hotmail.com', False, True),
+    'live.com': EmailRule('live.com', False, True),
+}
+
+
+def canonical_address(local, host):
+    rule = email_rules.get(host)
+    if rule is None:
+        return local + '@' + host
+    if rule.strip_plus:
+        local = local.split('+')[0]
+    if rule.strip_dots:
+        local = local.replace('.', '')
+    return local + '@' + rule.host
+
 
 class EmailType(StringType):
     super_types = [StringType]
+    parse_cache_size = 4096
     name = 'email'
+    MAX_TYPE_MATCH_SCORE = 1
 
     def is_eligible(self, s):
         return (len(s) > 4 and
@@ -157,8 +397,19 @@ class EmailType(StringType):
                 '@' in s and
                 '.' in s)
 
+    @classmethod
+    def accepts_fingerprint(cls, fp):
+        return (fp.length > 4 and
+                fp.length < 256 and
+                fp.has_at and
+                fp.has_dot and
+                not fp.has_colon and
+                not fp.spaces)
+
     def validate_and_clean(self, s):
         s = super(EmailType, self).validate_and_clean(s)
+        if s is None:
+            return None
         # Emails are case insensitive (in practice)
         return s.lower()
 
@@ -170,24 +421,79 @@ class EmailType(StringType):
             return None
 
         local, host = address.split('@')
-
-        # Gmail ignores dots and after +
-        if host == 'gmail.com':
-            local = local.split('+')[0]
-            local = local.replace('.', '')
-        return local + '@' + host
+        return canonical_address(local, host)
+
+    def canonicalize_column(self, values):
+        """
+        canonical_key for each of values, in a single pass that cleans,
+        validates and applies email_rules inline, computing repeated values
+        once.
+        """
+        match = email_regex.match
+        rules = email_rules
+        keys = {}
+        result = []
+        append = result.append
+        for s in values:
+            k = value_key(s)
+            try:
+                append(keys[k])
+                continue
+            except KeyError:
+                pass
+            except TypeError:
+                append(self.canonical_key(s))
+                continue
+            key = None
+            if s:
+                address = (s if isinstance(s, str) else str(s)).strip().lower()
+                if 4 < len(address) < 256 and match(address) is not None:
+                    local, host = address.split('@')
+                    rule = rules.get(host)
+                    if rule is None:
+                        key = address
+                    else:
+                        if rule.strip_plus:
+                            local = local.split('+')[0]
+                        if rule.strip_dots:
+                            local = local.replace('.', '')
+                        key = local + '@' + rule.host
+            keys[k] = key
+            append(key)
+        return result
+
+    def bulk_canonicalize(self, values):
+        return self.canonicalize_column(values)
+
+    def parse_many(self, values, to_object=False):
+        # Parsed emails are their canonical strings
+        return self.canonicalize_column(values)
 
     def score_type_match(self, s):
         return int(self.parse(s) is not None)
 
+    def score_type_matches(self, values):
+        return [int(obj is not None) for obj in self.parse_many(values)]
+
     def score_similarity(self, s1, s2):
-        return int(self.parse(s1) == self.parse(s2))
+        return int(self.canonical_key(s1) == self.canonical_key(s2))
 
 
 """
 DateTime
 """
 
+# Month and weekday names of dateutil's parserinfo. Without digits, dateutil
+# only finds a date in strings with one of these as a word
+date_word_regex = re.compile(r'(?<![^\W\d_])(?:{0})(?![^\W\d_])'.format('|'.join([
+    'january', 'february', 'march', 'april', 'may', 'june', 'july', 'august',
+    'september', 'sept', 'october', 'november', 'december',
+    'jan', 'feb', 'mar', 'apr', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec',
+    'monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday',
+    'mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun'])), re.IGNORECASE)
+digit_regex = re.compile(r'\d')
+
+
 def to_datetime(s):
     """s can be epoch seconds, ms, or date string"""
     try:
@@ -201,48 +507,531 @@ def to_datetime(s):
     return None
 
 
+# Epochs converted in bulk, beyond these datetime's year range may be exceeded
+# (to_datetime then fails), so those go through to_datetime one at a time.
+# to_datetime divides milliseconds as a float, which is only exact to the
+# microsecond below 2 ** 33 seconds
+BULK_SECONDS_RANGE = (-10000000000, 250000000000)
+BULK_MILLISECONDS_RANGE = (1000000000000, 2 ** 33 * 1000)
+
+def local_utc_offsets(secs):
+    """
+    Local UTC offset in seconds at each of secs (epoch seconds array), as
+    used by datetime.fromtimestamp. Offsets are looked up once per day, and
+    per value only on days with a transition.
+    """
+    days, inverse = np.unique(secs // 86400, return_inverse=True)
+    start = np.array([time.localtime(int(d) * 86400).tm_gmtoff for d in days],
+                     dtype=np.int64)
+    end = np.array([time.localtime(int(d) * 86400 + 86399).tm_gmtoff for d in days],
+                   dtype=np.int64)
+    offsets = start[inverse]
+    for i in np.flatnonzero((start != end)[inverse]):
+        offsets[i] = time.localtime(int(secs[i])).tm_gmtoff
+    return offsets
+
+
+def epochs_to_datetime64(epochs):
+    """
+    to_datetime for an int64 array of epoch seconds and milliseconds, all
+    within BULK_SECONDS_RANGE or BULK_MILLISECONDS_RANGE: local times as a
+    datetime64[us] array.
+    """
+    epochs = np.asarray(epochs, dtype=np.int64)
+    is_ms = epochs >= BULK_MILLISECONDS_RANGE[0]
+    secs = np.where(is_ms, epochs // 1000, epochs)
+    micros = np.where(is_ms, epochs % 1000 * 1000, 0)
+    local = (secs + local_utc_offsets(secs)) * 1000000 + micros
+    return local.astype('datetime64[us]')
+
+
+def datetime64_to_isoformat(values):
+    """
+    datetime.isoformat for each of a datetime64[us] array with years in
+    1000-9999, with microseconds only when non-zero.
+    """
+    fractional = values.astype(np.int64) % 1000000 != 0
+    result = np.empty(len(values), dtype=object)
+    for mask, width in ((~fractional, 19), (fractional, 26)):
+        ids = np.flatnonzero(mask)
+        if len(ids):
+            result[ids] = format_isoformat(values[ids], width)
+    return result.tolist()
+
+
+def format_isoformat(values, width):
+    """YYYY-MM-DDTHH:MM:SS[.ffffff] strings, built digit by digit in bulk"""
+    days = values.astype('datetime64[D]')
+    months = days.astype('datetime64[M]')
+    years = days.astype('datetime64[Y]')
+    micros = (values - days).astype(np.int64)
+    fields = [
+        (0, 4, years.astype(np.int64) + 1970),
+        (5, 2, (months - years).astype(np.int64) + 1),
+        (8, 2, (days - months).astype(np.int64) + 1),
+        (11, 2, micros // 3600000000),
+        (14, 2, micros // 60000000 % 60),
+        (17, 2, micros // 1000000 % 60),
+        (20, 6, micros % 1000000),
+    ]
+    chars = np.empty((len(values), 26), dtype=np.uint8)
+    chars[:, [4, 7, 10, 13, 16, 19]] = [ord(c) for c in '--T::.']
+    for start, n, field in fields:
+        for k in range(n):
+            chars[:, start + k] = ord('0') + field // 10 ** (n - 1 - k) % 10
+    chars = np.ascontiguousarray(chars[:, :width])
+    return chars.view('S{}'.format(width)).ravel().astype('U{}'.format(width))
+
+
+MONTH_NAMES = ['january', 'february', 'march', 'april', 'may', 'june', 'july',
+               'august', 'september', 'october', 'november', 'december']
+WEEKDAY_NAMES = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday',
+                 'saturday', 'sunday']
+MONTH_NUMBERS = dict([(m, i + 1) for i, m in enumerate(MONTH_NAMES)] +
+                     [(m[:3], i + 1) for i, m in enumerate(MONTH_NAMES)])
+
+# Candidate formats for inference. Only formats that dateutil reads the same
+# way belong here: no day-first or two digit year formats, and no all-digit
+# formats, which to_datetime treats as epochs.
+DATETIME_FORMATS = [
+    '%Y-%m-%d',
+    '%Y-%m-%dT%H:%M:%S',
+    '%Y-%m-%d %H:%M:%S',
+    '%Y-%m-%dT%H:%M:%S.%f',
+    '%Y-%m-%d %H:%M:%S.%f',
+    '%Y-%m-%dT%H:%M:%S%z',
+    '%Y-%m-%dT%H:%M:%S.%f%z',
+    '%Y-%m-%d %H:%M',
+    '%Y%m%dT%H%M%S',
+    '%Y%m%dT%H%M%S%z',
+    '%Y/%m/%d',
+    '%m/%d/%Y',
+    '%m/%d/%Y %H:%M:%S',
+    '%m-%d-%Y',
+    '%b %d %Y',
+    '%b %d, %Y',
+    '%B %d %Y',
+    '%B %d, %Y',
+    '%d %b %Y',
+    '%d %B %Y',
+    '%a %b %d %Y',
+    '%b %d %H:%M:%S %Y',
+    '%a %b %d %H:%M:%S %Y',
+    '%A %B %d %H:%M:%S %Y',
+]
+
+
+class DateTimeFormat(object):
+    """
+    A strptime style format compiled to a regex, so matching values are
+    parsed without dateutil. parse returns None for values not in the format.
+    """
+    directives = {
+        'Y': r'\d{4}',
+        'm': r'\d{1,2}',
+        'd': r'\d{1,2}',
+        'H': r'\d{1,2}',
+        'M': r'\d{1,2}',
+        'S': r'\d{1,2}',
+        'f': r'\d{1,6}',
+        'z': r'Z|[+-]\d\d:?\d\d',
+        'b': '|'.join(m[:3] for m in MONTH_NAMES),
+        'B': '|'.join(MONTH_NAMES),
+        'a': '|'.join(d[:3] for d in WEEKDAY_NAMES),
+        'A': '|'.join(WEEKDAY_NAMES),
+    }
+
+    def __init__(self, fmt):
+        self.format = fmt
+        pattern = []
+        parts = re.split(r'%(.)', fmt)
+        for i, part in enumerate(parts):
+            if i % 2 == 0:
+                pattern.append(re.escape(part))
+                continue
+            if part not in self.directives:
+                raise ValueError("Unsupported directive %{} in {}".format(part, fmt))
+            regex = self.directives[part]
+            # Adjacent numeric fields (%Y%m%d) must be fixed width
+            if regex == r'\d{1,2}' and ((i + 2 < len(parts) and not parts[i + 1]) or
+                                        (i > 1 and not parts[i - 1])):
+                regex = r'\d{2}'
+            pattern.append('(?P<{0}>{1})'.format(part, regex))
+        self.regex = re.compile(''.join(pattern) + '$', re.IGNORECASE)
+
+    def parse(self, s):
+        match = self.regex.match(s)
+        if match is None:
+            return None
+        fields = match.groupdict()
+        if 'm' in fields:
+            month = int(fields['m'])
+        else:
+            month = MONTH_NUMBERS[(fields.get('b') or fields['B']).lower()]
+        tzinfo = None
+        z = fields.get('z')
+        if z:
+            if z in 'zZ':
+                tzinfo = datetime.timezone.utc
+            else:
+                minutes = int(z[1:3]) * 60 + int(z[-2:])
+                if z[0] == '-':
+                    minutes = -minutes
+                tzinfo = datetime.timezone(datetime.timedelta(minutes=minutes))
+        try:
+            return datetime.datetime(int(fields['Y']), month, int(fields['d']),
+                                     int(fields.get('H') or 0),
+                                     int(fields.get('M') or 0),
+                                     int(fields.get('S') or 0),
+                                     int((fields.get('f') or '0').ljust(6, '0')),
+                                     tzinfo)
+        except ValueError:
+            # Out of range fields, eg Feb 30
+            return None
+
+
+@memoize
+def get_datetime_format(fmt):
+    return DateTimeFormat(fmt)
+
+
+def infer_datetime_formats(values, formats=None, min_share=.05):
+    """
+    Formats matching at least min_share of the (cleaned) values, most
+    common first. Each value counts towards the first format it matches.
+    """
+    if formats is None:
+        formats = DATETIME_FORMATS
+    parsers = [get_datetime_format(f) for f in formats]
+    counts = Counter()
+    n = 0
+    for s in values:
+        if s is None or s == '':
+            continue
+        s = str(s).strip()
+        n += 1
+        # Every format has a year
+        if digit_regex.search(s) is None:
+            continue
+        for p in parsers:
+            if p.parse(s) is not None:
+                counts[p.format] += 1
+                break
+    return [f for f, count in counts.most_common() if count >= min_share * n]
+
+
 class DateTimeType(StringType):
     super_types = [StringType]
+    parse_cache_size = 4096
     name = 'datetime'
+    MAX_TYPE_MATCH_SCORE = 1
+
+    def __init__(self, formats=None, **kwargs):
+        """
+        formats: strptime style formats (see DateTimeFormat) tried before
+        dateutil, eg from infer_datetime_formats.
+        """
+        super(DateTimeType, self).__init__(**kwargs)
+        self.formats = None if formats is None else tuple(formats)
+        self.format_parsers = [get_datetime_format(f) for f in self.formats or ()]
 
     def is_eligible(self, s):
         return (len(s) > 2 and
                 len(s) < 48)
 
+    @classmethod
+    def accepts_fingerprint(cls, fp):
+        # Without digits, dateutil needs a month or weekday name (at least
+        # three letters), among any number of words like 'on' or 'of'
+        return (fp.length > 2 and
+                fp.length < 48 and
+                (fp.digits > 0 or fp.alphas >= 3))
+
     def to_string(self, obj):
         return obj.isoformat()
 
     def parse_to_object(self, s):
+        for p in self.format_parsers:
+            obj = p.parse(s)
+            if obj is not None:
+                return obj
+        if digit_regex.search(s) is None and date_word_regex.search(s) is None:
+            return None
         try:
             return to_datetime(s)
-        except ValueError:
+        except (ValueError, OverflowError, OSError):
+            # Unparseable, or an epoch out of range for the platform
             return None
 
+    def parse_column(self, values, to_object=False, sample_size=500, random_state=0):
+        """
+        parse for each of values. Unless this instance was configured with
+        formats, they are inferred from a sample of the values, and only
+        values matching none of them go through dateutil.
+        """
+        values = list(values)
+        formats = self.formats
+        if formats is None:
+            sample = reservoir_sample(values, sample_size, random.Random(random_state))
+            formats = infer_datetime_formats(sample)
+        parsers = [get_datetime_format(f) for f in formats]
+        parsed = {}
+        misses = []
+        for s in values:
+            k = value_key(s)
+            try:
+                if k in parsed:
+                    continue
+            except TypeError:
+                continue
+            obj = parsed[k] = self._parse_formats(s, parsers, to_object)
+            if obj is None:
+                misses.append(s)
+        # Epochs are converted in bulk, anything else goes through dateutil
+        for s, obj in zip(misses, self.parse_epochs(misses, to_object)):
+            parsed[value_key(s)] = obj
+        result = []
+        for s in values:
+            try:
+                result.append(parsed[value_key(s)])
+            except TypeError:
+                result.append(self.parse(s, to_object))
+        return result
+
+    def _parse_formats(self, s, parsers, to_object):
+        cleaned = self.validate_and_clean(s)
+        if cleaned and self.is_eligible(cleaned):
+            for p in parsers:
+                obj = p.parse(cleaned)
+                if obj is not None:
+                    return obj if to_object else self.to_string(obj)
+        return None
+
+    def parse_epochs(self, values, to_object=False):
+        """
+        parse for each of a column of epoch seconds or milliseconds (ints or
+        digit strings), detecting the unit and converting them in bulk.
+        Other values are parsed one at a time.
+        """
+        if np is None:
+            return [self.parse(s, to_object) for s in values]
+        values = list(values)
+        result = [None] * len(values)
+        if not values:
+            return result
+        epochs, is_epoch, is_none = self._classify_epochs(values)
+        in_bulk = is_epoch & (
+            ((epochs >= BULK_SECONDS_RANGE[0]) & (epochs < BULK_SECONDS_RANGE[1])) |
+            ((epochs >= BULK_MILLISECONDS_RANGE[0]) & (epochs < BULK_MILLISECONDS_RANGE[1])))
+        # to_datetime gives up on larger epochs
+        is_none |= is_epoch & (epochs >= 1000000000000000)
+        for i in np.flatnonzero(~(in_bulk | is_none)):
+            result[i] = self.parse(values[i], to_object)
+        bulk = np.flatnonzero(in_bulk)
+        if not len(bulk):
+            return result
+        converted = epochs_to_datetime64(epochs[bulk])
+        if to_object:
+            converted = converted.astype(object).tolist()
+        else:
+            converted = datetime64_to_isoformat(converted)
+        for i, obj in zip(bulk.tolist(), converted):
+            result[i] = obj
+        return result
+
+    def _classify_epochs(self, values):
+        """
+        (int64 epochs, mask of eligible integer values, mask of values that
+        parse to None)
+        """
+        array = np.asarray(values)
+        no_none = np.zeros(len(array), dtype=bool)
+        if array.dtype.kind in 'iu':
+            # Clamp uint64 that would wrap around, it's too large anyway
+            epochs = np.minimum(array, 10 ** 18).astype(np.int64)
+            # Formatted, an eligible value has at least 3 characters
+            is_epoch = (epochs >= 100) | (epochs <= -10)
+            return epochs, is_epoch, ~is_epoch
+        if array.dtype.kind == 'U':
+            try:
+                # Same conversion as to_datetime's int(s)
+                epochs = array.astype(np.int64)
+            except (ValueError, OverflowError):
+                epochs = None
+            if epochs is not None:
+                # Values of at least 3 digits are eligible, unless too long
+                is_epoch = (epochs >= 1000) | (epochs <= -100)
+                if array.dtype.itemsize // 4 >= 48:
+                    is_epoch &= np.char.str_len(array) < 48
+                return epochs, is_epoch, no_none
+            # Not all integers, find the digit strings
+            stripped = np.char.strip(array)
+            lengths = np.char.str_len(stripped)
+            digits = np.char.isdecimal(stripped)
+            # Longer digit strings could overflow int64 (or have leading zeros)
+            is_epoch = digits & (lengths > 2) & (lengths <= 18)
+            epochs = np.zeros(len(array), dtype=np.int64)
+            epochs[is_epoch] = stripped[is_epoch].astype(np.int64)
+            return epochs, is_epoch, (lengths == 0) | (digits & (lengths <= 2))
+        epochs = np.zeros(len(values), dtype=np.int64)
+        is_epoch = np.zeros(len(values), dtype=bool)
+        for i, s in enumerate(values):
+            if (isinstance(s, int) and not isinstance(s, bool) and
+                    (100 <= s < 10 ** 18 or -10 ** 18 < s <= -10)):
+                epochs[i] = s
+                is_epoch[i] = True
+        return epochs, is_epoch, no_none
+
+    def bulk_canonicalize(self, values):
+        return self.parse_column(values)
+
+    def parse_many(self, values, to_object=False):
+        return self.parse_column(values, to_object)
+
     def score_type_match(self, s):
         return int(self.parse(s) is not None)
 
-    def score_similarity(self, s1, s2):
-        return int(self.parse(s1) == self.parse(s2))
-
+    def score_type_matches(self, values):
+        return [int(obj is not None) for obj in self.parse_many(values)]
 
-datatype_lookup = {
+    def score_similarity(self, s1, s2):
+        return int(self.canonical_key(s1) == self.canonical_key(s2))
+
+
+class DataTypeRegistry(object):
+    """
+    Registered datatypes by name, plus a cache of configured instances keyed
+    by (type, kwargs) so hot paths reuse warm instances. Safe to share across
+    threads.
+    """
+
+    def __init__(self, types):
+        self.lookup = dict(types)
+        self.names = [name for name, _ in types]
+        self.instances = {}
+        self.lock = threading.Lock()
+
+    def add_type(self, name, dtype):
+        """Register a DataType subclass, or a preconfigured instance, as name"""
+        if isinstance(dtype, DataType):
+            instance, dtype = dtype, type(dtype)
+        elif isinstance(dtype, type) and issubclass(dtype, DataType):
+            instance = None
+        else:
+            raise ValueError("dtype must be a DataType subclass or instance")
+        with self.lock:
+            self._evict(name)
+            self.lookup[name] = dtype
+            if name not in self.names:
+                self.names.append(name)
+            if instance is not None:
+                self.instances[(name, ())] = instance
+
+    def remove_type(self, name):
+        with self.lock:
+            if name not in self.lookup:
+                raise KeyError("No such datatype {}".format(name))
+            self._evict(name)
+            del self.lookup[name]
+            self.names.remove(name)
+
+    def _evict(self, name):
+        dtype = self.lookup.get(name)
+        for key in list(self.instances):
+            if key[0] == name or (dtype is not None and key[0] is dtype):
+                del self.instances[key]
+
+    def set_parse_cache(self, name, maxsize):
+        """Enable (maxsize > 0) or disable (maxsize 0) parse caching for a type"""
+        dtype = self.get_class(name)
+        with self.lock:
+            dtype.parse_cache_size = maxsize
+            for instance in self.instances.values():
+                if type(instance) is not dtype:
+                    continue
+                if maxsize:
+                    instance.enable_parse_cache(maxsize)
+                else:
+                    instance.disable_parse_cache()
+
+    def parse_cache_stats(self):
+        stats = {}
+        with self.lock:
+            instances = list(self.instances.items())
+        for (dtype, kwargs), instance in instances:
+            if instance.parse_cache is None:
+                continue
+            name = getattr(dtype, 'name', dtype)
+            if name in stats:
+                for k, v in instance.parse_cache.stats().items():
+                    stats[name][k] += v
+            else:
+                stats[name] = instance.parse_cache.stats()
+        return stats
+
+    def reset_parse_cache_stats(self):
+        with self.lock:
+            instances = list(self.instances.values())
+        for instance in instances:
+            if instance.parse_cache is not None:
+                instance.parse_cache.reset_stats()
+
+    def get(self, dtype_ish, **kwargs):
+        if isinstance(dtype_ish, DataType):
+            return dtype_ish
+        try:
+            key = (dtype_ish, tuple(sorted(kwargs.items())))
+            instance = self.instances.get(key)
+        except TypeError:
+            # Unhashable configuration (eg a similarity model), don't cache
+            return self.get_class(dtype_ish)(**kwargs)
+        if instance is not None:
+            return instance
+        with self.lock:
+            instance = self.instances.get(key)
+            if instance is None:
+                instance = self.get_class(dtype_ish)(**kwargs)
+                self.instances[key] = instance
+        return instance
+
+    def get_class(self, dtype_ish):
+        if isinstance(dtype_ish, type) and issubclass(dtype_ish, DataType):
+            return dtype_ish
+        return self.lookup[dtype_ish]
+
+
+registry = DataTypeRegistry([
     # Generic
-    'string': StringType,
+    ('string', StringType),
 
     # Entities
-    'phonenumber': PhoneNumberType,
-    'email': EmailType,
-    # 'fullname': FullNameType,
-    'datetime': DateTimeType,
-}
-ALL_TYPES = list(datatype_lookup.keys())
+    ('phonenumber', PhoneNumberType),
+    ('email', EmailType),
+    # ('fullname', FullNameType),
+    ('datetime', DateTimeType),
+])
+datatype_lookup = registry.lookup
+ALL_TYPES = registry.names
 DEFAULT_DATATYPE = 'string'
 
 
 def get_datatype(dtype_ish, **kwargs):
-    if isinstance(dtype_ish, DataType):
-        return dtype_ish
-    if isinstance(dtype_ish, type):
-        if issubclass(dtype_ish, DataType):
-            return dtype_ish(**kwargs)
-    return datatype_lookup[dtype_ish](**kwargs)
+    return registry.get(dtype_ish, **kwargs)
+
+
+def add_type(name, dtype):
+    registry.add_type(name, dtype)
+    closest_common_type.cache.clear()
+
+
+def remove_type(name):
+    registry.remove_type(name)
+    closest_common_type.cache.clear()
+
+
+def set_parse_cache(dtype, maxsize):
+    registry.set_parse_cache(dtype, maxsize)
+
+
+def parse_cache_stats():
+    return registry.parse_cache_stats()
@@ -0,0 +1,402 @@
+# -*- coding: utf-8 -*-
+"""
+Indexes over tokenized corpora for fast similarity lookups
+"""
+from array import array
+from bisect import bisect_left, bisect_right
+import math
+import zlib
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .similarity import get_set_similarity
+
+
+# Guards threshold arithmetic against float rounding
+EPSILON = 1e-9
+
+
+def size_bounds(measure, threshold, size):
+    """Range of document sizes that can reach threshold against a query of size"""
+    if threshold <= 0:
+        return 1, float('inf')
+    if measure == 'jaccard':
+        return threshold * size, size / threshold
+    if measure == 'dice':
+        return threshold / (2 - threshold) * size, (2 - threshold) / threshold * size
+    if measure == 'cosine':
+        return threshold ** 2 * size, size / threshold ** 2
+    return 1, float('inf')
+
+
+def min_overlap(measure, threshold, size1, size2):
+    """Smallest overlap with which sets of size1 and size2 can reach threshold"""
+    if measure == 'jaccard':
+        o = threshold / (1 + threshold) * (size1 + size2)
+    elif measure == 'dice':
+        o = threshold * (size1 + size2) / 2.
+    elif measure == 'cosine':
+        o = threshold * math.sqrt(size1 * size2)
+    elif measure in ('overlap', 'overlap_coefficient'):
+        o = threshold * min(size1, size2)
+    else:
+        o = 1
+    return max(1, int(math.ceil(o - EPSILON)))
+
+
+class InvertedIndex(object):
+    """
+    Maps tokens to array-backed posting lists of document ids. Documents are
+    numbered in order of size, so size (length) filtering of a posting list
+    is a bisection.
+    """
+
+    def __init__(self):
+        self.vocabulary = {}
+        self.postings = []
+        # Internal id -> document size / original document id
+        self.sizes = array('I')
+        self.doc_ids = array('I')
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def fit(self, token_sets):
+        token_sets = list(token_sets)
+        order = sorted(range(len(token_sets)), key=lambda i: len(token_sets[i]))
+        self.doc_ids = array('I', order)
+        self.sizes = array('I', [len(token_sets[i]) for i in order])
+        for internal_id, doc_id in enumerate(order):
+            for token in token_sets[doc_id]:
+                token_id = self.vocabulary.get(token)
+                if token_id is None:
+                    token_id = self.vocabulary[token] = len(self.postings)
+                    self.postings.append(array('I'))
+                self.postings[token_id].append(internal_id)
+        return self
+
+    def query(self, tokens, measure='jaccard', threshold=.5):
+        """
+        Documents with similarity of at least threshold to the token set, as
+        (score, doc_id) with the highest scores first. Only documents sharing
+        at least one token with the query are returned.
+        """
+        score = get_set_similarity(measure)
+        size = len(tokens)
+        if not size:
+            return []
+        lo, hi = size_bounds(measure, threshold, size)
+        lo_id = bisect_left(self.sizes, int(math.ceil(lo - EPSILON)))
+        hi_id = bisect_right(self.sizes, int(min(hi + EPSILON, 2 ** 32 - 1)))
+        if lo_id >= hi_id:
+            return []
+        postings = []
+        for token in tokens:
+            token_id = self.vocabulary.get(token)
+            if token_id is not None:
+                postings.append(self.postings[token_id])
+        # Count filtering: a document needs at least `needed` of the query's
+        # tokens, so it must appear in one of the (size - needed + 1) rarest
+        needed = min_overlap(measure, threshold, size, int(self.sizes[lo_id]))
+        n_probe = size - needed + 1
+        postings.sort(key=len)
+        counts = {}
+        for i, posting in enumerate(postings):
+            start = bisect_left(posting, lo_id)
+            end = bisect_left(posting, hi_id, start)
+            if i < n_probe:
+                for doc in posting[start:end]:
+                    counts[doc] = counts.get(doc, 0) + 1
+            else:
+                for doc in posting[start:end]:
+                    if doc in counts:
+                        counts[doc] += 1
+        results = []
+        for doc, overlap in counts.items():
+            doc_size = int(self.sizes[doc])
+            if overlap < min_overlap(measure, threshold, size, doc_size):
+                continue
+            results.append((score(overlap, size, doc_size), int(self.doc_ids[doc])))
+        results.sort(key=lambda x: (-x[0], x[1]))
+        return results
+
+
+"""
+MinHash / LSH
+"""
+
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+BAND_HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+
+
+def require_numpy(feature):
+    if np is None:
+        raise ImportError("{} requires numpy".format(feature))
+
+
+def mod_mersenne(y):
+    """y mod MERSENNE_PRIME for a uint64 array y, as 2**61 = 1 modulo the prime"""
+    y = (y & np.uint64(MERSENNE_PRIME)) + (y >> np.uint64(61))
+    return np.where(y >= np.uint64(MERSENNE_PRIME), y - np.uint64(MERSENNE_PRIME), y)
+
+
+def universal_hashes(x, a, b):
+    """
+    (len(x), len(a)) array of (a * x + b) mod MERSENNE_PRIME, for 32 bit x
+    and a, b below the prime, computed exactly in uint64
+    """
+    x = np.asarray(x, dtype=np.uint64)
+    low = np.outer(x, a & np.uint64(MAX_HASH))
+    # x * a_high * 2**32 folded below 2**62, as x * a_high is below 2**61
+    high = np.outer(x, a >> np.uint64(32))
+    high = (high >> np.uint64(29)) + ((high & np.uint64((1 << 29) - 1)) << np.uint64(32))
+    return mod_mersenne(mod_mersenne(low) + mod_mersenne(high) + b)
+
+
+class MinHash(object):
+    """
+    MinHash signatures of token sets, using num_perm universal hash
+    functions over stable 32 bit token hashes.
+    """
+
+    def __init__(self, num_perm=128, seed=1):
+        require_numpy('MinHash')
+        self.num_perm = num_perm
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(1, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self.b = rng.randint(0, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+
+    def token_hashes(self, tokens):
+        return np.array([zlib.crc32(t.encode('utf-8')) & MAX_HASH for t in tokens],
+                        dtype=np.uint64)
+
+    def signatures(self, token_sets, batch_size=1024):
+        """(len(token_sets), num_perm) uint32 array of signatures"""
+        token_sets = list(token_sets)
+        result = np.full((len(token_sets), self.num_perm), MAX_HASH, dtype=np.uint32)
+        for start in range(0, len(token_sets), batch_size):
+            batch = token_sets[start:start + batch_size]
+            sizes = np.array([len(tokens) for tokens in batch])
+            nonempty = np.flatnonzero(sizes)
+            if not len(nonempty):
+                continue
+            hashes = self.token_hashes([t for tokens in batch for t in tokens])
+            permuted = universal_hashes(hashes, self.a, self.b)
+            permuted &= np.uint64(MAX_HASH)
+            offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]])[nonempty]
+            result[start + nonempty] = np.minimum.reduceat(permuted, offsets, axis=0)
+        return result
+
+    def signature(self, tokens):
+        return self.signatures([tokens])[0]
+
+
+def collision_probability(similarity, bands, rows):
+    """Probability that sets with a jaccard similarity share an LSH bucket"""
+    return 1 - (1 - similarity ** rows) ** bands
+
+
+def optimal_bands_rows(threshold, num_perm, false_negative_weight=.7):
+    """
+    (bands, rows) with bands * rows <= num_perm minimizing the weighted areas
+    under the S-curve below threshold (false positives) and above threshold
+    (missed pairs).
+    """
+    # Midpoint rule over 100 steps on each side of threshold
+    below = (np.arange(100) + .5) * threshold / 100.
+    above = threshold + (np.arange(100) + .5) * (1 - threshold) / 100.
+    best = None
+    for rows in range(1, num_perm + 1):
+        for bands in range(1, num_perm // rows + 1):
+            false_positives = collision_probability(below, bands, rows).mean() * threshold
+            false_negatives = (1 - collision_probability(above, bands, rows)).mean() * (1 - threshold)
+            error = ((1 - false_negative_weight) * false_positives +
+                     false_negative_weight * false_negatives)
+            if best is None or error < best[0]:
+                best = (error, bands, rows)
+    return best[1], best[2]
+
+
+class MinHashLSHIndex(object):
+    """
+    Approximate jaccard similarity index: MinHash signatures split into
+    `bands` bands of `rows` rows, hashed into per-band buckets. Documents
+    sharing any bucket with the query are candidates, scored by their
+    estimated jaccard similarity.
+    """
+
+    def __init__(self, num_perm=128, bands=None, rows=None, threshold=.5, seed=1,
+                 false_negative_weight=.7):
+        require_numpy('MinHashLSHIndex')
+        self.threshold = threshold
+        if bands is None or rows is None:
+            bands, rows = optimal_bands_rows(threshold, num_perm, false_negative_weight)
+        if bands * rows > num_perm:
+            raise ValueError("bands * rows must not exceed num_perm")
+        self.bands = bands
+        self.rows = rows
+        self.minhash = MinHash(num_perm, seed=seed)
+        self.signatures = None
+        self.bucket_keys = None
+        self.bucket_doc_ids = None
+
+    def __len__(self):
+        return 0 if self.signatures is None else len(self.signatures)
+
+    def band_keys(self, signatures):
+        """
+        (bands, len(signatures)) uint64 bucket keys of the bands of
+        signatures: the band number in the top bits and a hash of the band
+        in the rest, so the keys of all bands sort band by band.
+        """
+        signatures = np.asarray(signatures, dtype=np.uint64)
+        hashes = np.zeros((self.bands, len(signatures)), dtype=np.uint64)
+        for row in range(self.rows):
+            # Overflow wraps modulo 2**64, which is fine for hashing
+            hashes *= np.uint64(BAND_HASH_MULTIPLIER)
+            hashes += signatures[:, row:self.bands * self.rows:self.rows].T
+        band_bits = max(1, (self.bands - 1).bit_length())
+        hashes >>= np.uint64(band_bits)
+        hashes |= (np.arange(self.bands, dtype=np.uint64) << np.uint64(64 - band_bits))[:, None]
+        return hashes
+
+    def band_slice(self, band):
+        return slice(band * self.rows, (band + 1) * self.rows)
+
+    def fit(self, token_sets):
+        return self.fit_signatures(self.minhash.signatures(token_sets))
+
+    def fit_signatures(self, signatures):
+        """
+        Buckets are kept as arrays: for each band, the bucket keys of all
+        documents sorted, and the doc ids in that order. Saved indexes load
+        them without refitting.
+        """
+        keys = self.band_keys(signatures)
+        order = np.argsort(keys, axis=1, kind='stable')
+        return self.set_buckets(signatures, np.take_along_axis(keys, order, axis=1),
+                                order.astype(np.uint32))
+
+    def set_buckets(self, signatures, bucket_keys, bucket_doc_ids):
+        self.signatures = signatures
+        self.bucket_keys = bucket_keys
+        self.bucket_doc_ids = bucket_doc_ids
+        return self
+
+    def candidates(self, signature):
+        """Sorted ids of the documents sharing a band with signature"""
+        # Keys sort band by band, so all bands are searched at once
+        keys = self.bucket_keys.reshape(-1)
+        query = self.band_keys([signature])[:, 0]
+        starts = np.searchsorted(keys, query, 'left')
+        lengths = np.searchsorted(keys, query, 'right') - starts
+        total = int(lengths.sum())
+        if not total:
+            return np.zeros(0, dtype=np.int64)
+        positions = np.arange(total) + np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        doc_ids = self.bucket_doc_ids.reshape(-1)[positions].astype(np.int64)
+        # Different band values may share a key
+        bands = np.repeat(np.arange(self.bands), lengths)
+        columns = (bands * self.rows)[:, None] + np.arange(self.rows)
+        same = (self.signatures[doc_ids[:, None], columns] == signature[columns]).all(axis=1)
+        return np.unique(doc_ids[same])
+
+    def estimated_recall(self, threshold=None):
+        """
+        Expected share of pairs with jaccard similarity of at least threshold
+        that become candidates, assuming their similarities are spread evenly
+        over [threshold, 1].
+        """
+        if threshold is None:
+            threshold = self.threshold
+        similarities = threshold + (np.arange(100) + .5) * (1 - threshold) / 100.
+        return float(collision_probability(similarities, self.bands, self.rows).mean())
+
+    def estimate_similarity(self, signature, doc_ids):
+        return (self.signatures[doc_ids] == signature).mean(axis=1)
+
+    def query(self, tokens, measure='jaccard', threshold=None):
+        """
+        Documents with estimated jaccard similarity of at least threshold, as
+        (score, doc_id) with the highest scores first.
+        """
+        if measure != 'jaccard':
+            raise ValueError("MinHashLSHIndex only supports jaccard similarity")
+        if threshold is None:
+            threshold = self.threshold
+        if not tokens:
+            return []
+        signature = self.minhash.signature(tokens)
+        doc_ids = self.candidates(signature)
+        if not len(doc_ids):
+            return []
+        scores = self.estimate_similarity(signature, doc_ids)
+        results = [(float(score), int(doc_id)) for score, doc_id in zip(scores, doc_ids)
+                   if score >= threshold]
+        results.sort(key=lambda x: (-x[0], x[1]))
+        return results
+
+    def self_join(self, measure='jaccard', threshold=None):
+        """Yields (doc_id1, doc_id2, score) for candidate pairs reaching threshold"""
+        if measure != 'jaccard':
+            raise ValueError("MinHashLSHIndex only supports jaccard similarity")
+        if threshold is None:
+            threshold = self.threshold
+        for band, doc_ids in self.buckets():
+            # Pairs sharing an earlier band were emitted from that band
+            earlier = band * self.rows
+            for i, doc_id in enumerate(doc_ids):
+                others = doc_ids[i + 1:]
+                if earlier:
+                    shared = self.signatures[others, :earlier] == self.signatures[doc_id, :earlier]
+                    shared = shared.reshape(len(others), band, self.rows).all(axis=2).any(axis=1)
+                    others = [d for d, s in zip(others, shared) if not s]
+                    if not others:
+                        continue
+                scores = self.estimate_similarity(self.signatures[doc_id], others)
+                for other, score in zip(others, scores):
+                    if score >= threshold:
+                        yield doc_id, other, float(score)
+
+    def buckets(self):
+        """
+        Yields (band, doc ids) for each bucket holding more than one
+        document, with the doc ids in increasing order
+        """
+        for band in range(self.bands):
+            keys = self.bucket_keys[band]
+            bounds = np.concatenate([[0], np.flatnonzero(keys[1:] != keys[:-1]) + 1, [len(keys)]])
+            band_slice = self.band_slice(band)
+            for start, end in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+                if end - start < 2:
+                    continue
+                doc_ids = self.bucket_doc_ids[band, start:end].tolist()
+                bands = self.signatures[doc_ids, band_slice]
+                if (bands == bands[0]).all():
+                    yield band, doc_ids
+                    continue
+                groups = {}
+                for doc_id, values in zip(doc_ids, bands):
+                    groups.setdefault(values.tobytes(), []).append(doc_id)
+                for group in groups.values():
+                    if len(group) > 1:
+                        yield band, group
+
+
+index_lookup = {
+    'inverted': InvertedIndex,
+    'minhash': MinHashLSHIndex,
+}
+
+
+def get_index(backend, **kwargs):
+    if isinstance(backend, str):
+        try:
+            return index_lookup[backend](**kwargs)
+        except KeyError:
+            raise KeyError("No such index backend {}".format(backend))
+    return backend
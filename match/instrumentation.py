@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+Opt-in per-datatype instrumentation of parsing (`parse` and the bulk
+`parse_many`, `bulk_canonicalize`, `parse_column` and `canonicalize_column`),
+eligibility screening (`accepts_fingerprint` and `is_eligible`), type
+scoring and similarity scoring: call counts, cumulative time, latency
+histograms and failure rates (parse returning None, a type rejecting a
+value), plus parse cache hit rates. Bulk calls also count the values they
+handled, and their failure rate is per value.
+
+`enable()` wraps the methods on the DataType classes and `disable()` puts
+the originals back, so there is no overhead at all while disabled. Each
+thread records into its own counters, which are merged by `snapshot()`.
+
+    >>> from match import instrumentation, match
+    >>> instrumentation.enable()
+    >>> match.detect_type('608-555-5555')
+    (1, 'phonenumber')
+    >>> instrumentation.snapshot()['phonenumber']['parse']['calls']
+    1
+    >>> instrumentation.disable()
+"""
+from contextlib import contextmanager
+import functools
+import threading
+import time
+
+from .datatypes import DataType, registry
+
+
+METHODS = ['parse', 'is_eligible', 'accepts_fingerprint', 'score_type_match',
+           'score_similarity']
+# Methods taking and returning a list of values
+BULK_METHODS = ['parse_many', 'bulk_canonicalize', 'parse_column',
+                'canonicalize_column', 'score_type_matches']
+
+# Upper bounds, in seconds, of the latency histogram buckets
+BUCKETS = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4,
+           1e-3, 1e-2, 1e-1, float('inf'))
+
+
+class MethodStats(object):
+
+    def __init__(self):
+        self.calls = 0
+        # Values handled, one per call except for bulk methods
+        self.items = 0
+        self.failures = 0
+        self.total_time = 0.
+        self.histogram = [0] * len(BUCKETS)
+
+    def record(self, elapsed, items, failures):
+        self.calls += 1
+        self.items += items
+        self.total_time += elapsed
+        self.failures += failures
+        for i, bound in enumerate(BUCKETS):
+            if elapsed <= bound:
+                self.histogram[i] += 1
+                break
+
+    def merge(self, other):
+        self.calls += other.calls
+        self.items += other.items
+        self.failures += other.failures
+        self.total_time += other.total_time
+        self.histogram = [a + b for a, b in zip(self.histogram, other.histogram)]
+
+    def as_dict(self):
+        return {
+            'calls': self.calls,
+            'items': self.items,
+            'total_time': self.total_time,
+            'mean_time': self.total_time / self.calls if self.calls else 0.,
+            'failures': self.failures,
+            'failure_rate': self.failures / float(self.items) if self.items else 0.,
+            'histogram': list(zip(BUCKETS, self.histogram)),
+        }
+
+
+# Guards thread_stats and originals, recording itself takes no lock
+lock = threading.Lock()
+local = threading.local()
+# {type name: {method: MethodStats}} of every thread that recorded
+thread_stats = []
+# (class, method name) -> original function
+originals = {}
+
+
+def failures(method, result):
+    if method in ('parse', 'parse_many', 'bulk_canonicalize', 'parse_column',
+                  'canonicalize_column'):
+        if method == 'parse':
+            return int(result is None)
+        return sum(1 for obj in result if obj is None)
+    if method in ('is_eligible', 'accepts_fingerprint'):
+        return int(not result)
+    return 0
+
+
+def record(dtype, method, elapsed, result):
+    try:
+        stats = local.stats
+    except AttributeError:
+        stats = local.stats = {}
+        with lock:
+            thread_stats.append(stats)
+    name = getattr(dtype, 'name', dtype.__name__)
+    method_stats = stats.setdefault(name, {}).get(method)
+    if method_stats is None:
+        method_stats = stats[name][method] = MethodStats()
+    items = len(result) if method in BULK_METHODS else 1
+    method_stats.record(elapsed, items, failures(method, result))
+
+
+def instrument(func, method):
+    @functools.wraps(func)
+    def instrumented(self, *args, **kwargs):
+        start = time.perf_counter()
+        result = func(self, *args, **kwargs)
+        # self is the class for classmethods
+        dtype = self if isinstance(self, type) else type(self)
+        record(dtype, method, time.perf_counter() - start, result)
+        return result
+    instrumented.instrumented = True
+    return instrumented
+
+
+def datatype_classes():
+    classes = [DataType]
+    for cls in classes:
+        classes.extend(c for c in cls.__subclasses__() if c not in classes)
+    return classes
+
+
+def enable():
+    """
+    Instrument every DataType subclass defined so far. Call again after
+    defining new types to instrument them too.
+    """
+    with lock:
+        for cls in datatype_classes():
+            for method in METHODS + BULK_METHODS:
+                func = cls.__dict__.get(method)
+                if func is None:
+                    continue
+                if isinstance(func, classmethod):
+                    if getattr(func.__func__, 'instrumented', False):
+                        continue
+                    wrapped = classmethod(instrument(func.__func__, method))
+                elif getattr(func, 'instrumented', False):
+                    continue
+                else:
+                    wrapped = instrument(func, method)
+                originals[(cls, method)] = func
+                setattr(cls, method, wrapped)
+
+
+def disable():
+    with lock:
+        for (cls, method), func in originals.items():
+            setattr(cls, method, func)
+        originals.clear()
+
+
+def is_enabled():
+    return bool(originals)
+
+
+def snapshot():
+    """
+    {type name: {method: stats}}, plus parse cache counters per type under
+    'parse_cache'.
+    """
+    merged = {}
+    with lock:
+        for stats in thread_stats:
+            for name, methods in list(stats.items()):
+                for method, method_stats in list(methods.items()):
+                    merged.setdefault(name, {}).setdefault(method, MethodStats()).merge(method_stats)
+    result = dict((name, dict((method, s.as_dict()) for method, s in methods.items()))
+                  for name, methods in merged.items())
+    for name, cache_stats in registry.parse_cache_stats().items():
+        lookups = cache_stats['hits'] + cache_stats['misses']
+        cache_stats['hit_rate'] = cache_stats['hits'] / float(lookups) if lookups else 0.
+        result.setdefault(name, {})['parse_cache'] = cache_stats
+    return result
+
+
+def reset():
+    """Clear all recorded stats and parse cache counters"""
+    with lock:
+        for stats in thread_stats:
+            stats.clear()
+    registry.reset_parse_cache_stats()
+
+
+@contextmanager
+def instrumented():
+    enable()
+    try:
+        yield
+    finally:
+        disable()
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+Set similarity joins: all pairs of token sets with similarity of at least a
+threshold, found with the AllPairs / PPJoin filters instead of scoring every
+pair.
+
+Tokens are ranked by document frequency, rarest first, and every set is
+held as its sorted ranks. Two sets reaching the threshold must then share a
+token within short prefixes of both, so only prefix tokens are indexed and
+probed (prefix filtering). Candidates outside the size range the threshold
+allows are skipped (length filtering), as are those whose overlap so far
+plus the tokens remaining after the matching positions cannot reach the
+required overlap (positional filtering). Surviving candidates are verified
+by their exact overlap.
+
+    for i, j, score in similarity_join(names, measure='jaccard', threshold=.8):
+        ...
+"""
+from collections import Counter
+import math
+
+from .index import EPSILON, min_overlap, size_bounds
+from .similarity import get_cleaner, get_set_similarity, get_tokenizer
+
+
+class SetSimilarityJoin(object):
+    """
+    Joins tokenized strings on set similarity: jaccard, dice, cosine or
+    overlap. Pairs are yielded as they are found, with scores of at least
+    threshold; as for `InvertedIndex.query`, pairs must share a token.
+    """
+
+    def __init__(self, measure='jaccard', threshold=.8, tokenizer='3grams', cleaner='alphanum'):
+        self.measure = measure
+        self.threshold = threshold
+        self.score = get_set_similarity(measure)
+        self.tokenizer = get_tokenizer(tokenizer)
+        self.cleaner = get_cleaner(cleaner)
+
+    def tokens(self, s):
+        s = self.cleaner(s)
+        if not s:
+            return set()
+        return set(self.tokenizer.tokenize(s))
+
+    def rank_tokens(self, token_sets):
+        """Each token set as a tuple of token ranks, rarest token first"""
+        frequencies = Counter()
+        for tokens in token_sets:
+            frequencies.update(tokens)
+        ranks = dict((token, rank) for rank, (token, _) in enumerate(
+            sorted(frequencies.items(), key=lambda x: (x[1], x[0]))))
+        return [tuple(sorted(ranks[t] for t in tokens)) for tokens in token_sets]
+
+    def min_size(self, size):
+        """Smallest set size that can reach threshold against a set of size"""
+        lo, hi = size_bounds(self.measure, self.threshold, size)
+        return max(1, int(math.ceil(lo - EPSILON)))
+
+    def max_size(self, size):
+        lo, hi = size_bounds(self.measure, self.threshold, size)
+        return hi + EPSILON
+
+    def prefix_length(self, size, partner_size):
+        """
+        Prefix of a set of size that must share a token with any set of at
+        least partner_size reaching threshold
+        """
+        return max(0, size - min_overlap(self.measure, self.threshold, size, partner_size) + 1)
+
+    def self_join(self, values):
+        """Yields (i, j, score) with i < j for the similar pairs of values"""
+        records = self.rank_tokens([self.tokens(s) for s in values])
+        order = sorted((i for i, r in enumerate(records) if r), key=lambda i: len(records[i]))
+        # Rank -> [(record id, position)], records in order of size
+        index = {}
+        starts = {}
+        for x_id in order:
+            x = records[x_id]
+            size = len(x)
+            lo = self.min_size(size)
+            candidates = self.probe(x, self.prefix_length(size, lo), index, starts, records, lo)
+            for y_id, overlap in self.verify(x, candidates, records):
+                yield min(x_id, y_id), max(x_id, y_id), self.score(overlap, size, len(records[y_id]))
+            # Larger sets probe later, so the prefix only needs to cover partners
+            # at least as large as x
+            for position in range(self.prefix_length(size, size)):
+                index.setdefault(x[position], []).append((x_id, position))
+
+    def join(self, left, right):
+        """Yields (i, j, score) for the similar pairs of left[i] and right[j]"""
+        left = [self.tokens(s) for s in left]
+        n_left = len(left)
+        records = self.rank_tokens(left + [self.tokens(s) for s in right])
+        # Right records are indexed on prefixes covering partners of any size,
+        # left records probe in order of size
+        index = {}
+        for y_id in sorted(range(n_left, len(records)), key=lambda j: len(records[j])):
+            y = records[y_id]
+            for position in range(self.prefix_length(len(y), self.min_size(len(y))) if y else 0):
+                index.setdefault(y[position], []).append((y_id, position))
+        starts = {}
+        for x_id in sorted((i for i in range(n_left) if records[i]), key=lambda i: len(records[i])):
+            x = records[x_id]
+            size = len(x)
+            lo = self.min_size(size)
+            candidates = self.probe(x, self.prefix_length(size, lo), index, starts, records, lo,
+                                    self.max_size(size))
+            for y_id, overlap in self.verify(x, candidates, records):
+                yield x_id, y_id - n_left, self.score(overlap, size, len(records[y_id]))
+
+    def probe(self, x, prefix, index, starts, records, lo, hi=None):
+        """
+        {record id: overlap within prefixes} of the indexed records passing
+        the length and positional filters against x. Sets probe in order of
+        size, so `starts` keeps the start of each posting list past the
+        records too small for all later probes.
+        """
+        size = len(x)
+        counts = {}
+        # Partner size -> required overlap
+        needed = {}
+        for i in range(prefix):
+            token = x[i]
+            postings = index.get(token)
+            if not postings:
+                continue
+            start = starts.get(token, 0)
+            while start < len(postings) and len(records[postings[start][0]]) < lo:
+                start += 1
+            starts[token] = start
+            for y_id, j in postings[start:]:
+                y_size = len(records[y_id])
+                if hi is not None and y_size > hi:
+                    break
+                count = counts.get(y_id, 0)
+                if count < 0:
+                    continue
+                if y_size not in needed:
+                    needed[y_size] = min_overlap(self.measure, self.threshold, size, y_size)
+                if count + 1 + min(size - i - 1, y_size - j - 1) >= needed[y_size]:
+                    counts[y_id] = count + 1
+                else:
+                    # Pruned for good
+                    counts[y_id] = -1
+        return counts
+
+    def verify(self, x, candidates, records):
+        """(record id, overlap) for the candidates with enough overlap with x"""
+        x_set = None
+        size = len(x)
+        for y_id, count in candidates.items():
+            if count <= 0:
+                continue
+            if x_set is None:
+                x_set = set(x)
+            y = records[y_id]
+            overlap = len(x_set.intersection(y))
+            if overlap >= min_overlap(self.measure, self.threshold, size, len(y)):
+                yield y_id, overlap
+
+
+def similarity_join(left, right=None, measure='jaccard', threshold=.8, tokenizer='3grams',
+                    cleaner='alphanum'):
+    """
+    Yields (i, j, score) for all pairs of left[i] and right[j] with set
+    similarity of at least threshold, or of left[i] and left[j] with i < j
+    if right is None.
+    """
+    join = SetSimilarityJoin(measure, threshold, tokenizer, cleaner)
+    if right is None:
+        return join.self_join(left)
+    return join.join(left, right)
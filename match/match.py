@@ -1,10 +1,20 @@
 # -*- coding: utf-8 -*-
+from collections import Counter, namedtuple
 import logging
+import math
+import random
 
 from .datatypes import (
+    ALL_TYPES,
     get_closest_common_type,
     eligible_types,
-    get_datatype)
+    get_datatype,
+    value_key)
+# Re-exported as part of the main API
+from .datatypes import add_type, remove_type  # noqa: F401
+from . import similarity
+from .parallel import score_pairs  # noqa: F401
+from .utils import reservoir_sample
 
 
 """
@@ -25,10 +35,131 @@ def detect_type(s):
     return best
 
 
+def detect_types(values, dtypes=None):
+    """
+    Batch version of `detect_type`. Repeated values are detected once, and
+    the values eligible for each datatype are scored together through its
+    bulk parse path. Returns a list of (score, dtype) in the same order as
+    `values`.
+    """
+    values = list(values)
+    if dtypes is None:
+        dtypes = ALL_TYPES
+    # value_key -> value, values that can't be keyed are detected one by one
+    unique = {}
+    for s in values:
+        try:
+            unique.setdefault(value_key(s), s)
+        except TypeError:
+            pass
+    groups = dict((t, []) for t in dtypes)
+    for k, s in unique.items():
+        for t in eligible_types(s):
+            if t in groups:
+                groups[t].append(k)
+    best = {}
+    # Types are visited in `dtypes` order so ties resolve as in `detect_type`
+    for t in dtypes:
+        dtype = get_datatype(t)
+        keys = groups[t]
+        if dtype.MAX_TYPE_MATCH_SCORE is not None:
+            # Values an earlier type already scored this high keep that type
+            keys = [k for k in keys if k not in best or best[k][0] < dtype.MAX_TYPE_MATCH_SCORE]
+        if not keys:
+            continue
+        scores = dtype.score_type_matches([unique[k] for k in keys])
+        for k, score in zip(keys, scores):
+            if k not in best or score > best[k][0]:
+                best[k] = (score, t)
+    result = []
+    for s in values:
+        try:
+            result.append(best.get(value_key(s)))
+        except TypeError:
+            eligible = eligible_types(s)
+            scores = score_types(s, [t for t in dtypes if t in eligible])
+            result.append(max(scores, key=lambda x: x[0]) if scores else None)
+    return result
+
+
+def detect_column_type(values, dtypes=None):
+    """
+    Detect the type of a whole column. Returns (score, dtype) where score is
+    the share of values detected as dtype, along with the per-value results.
+    """
+    results = detect_types(values, dtypes=dtypes)
+    counts = Counter(r[1] for r in results if r is not None)
+    if not counts:
+        return (0, None), results
+    dtype, n = counts.most_common(1)[0]
+    return (n / float(len(results)), dtype), results
+
+
+ColumnInference = namedtuple('ColumnInference',
+                             ['score', 'dtype', 'confidence', 'examined'])
+
+
+def separation_confidence(counts, n):
+    """
+    Hoeffding bound on the probability that the leading type in `counts` is
+    truly more common than the runner-up, given n samples.
+    """
+    if not n:
+        return 0.
+    top = counts.most_common(2) + [(None, 0)]
+    gap = (top[0][1] - top[1][1]) / float(n)
+    return 1 - math.exp(-n * gap * gap / 2.)
+
+
+def infer_column_type(values, confidence=.99, min_samples=20, max_samples=1000,
+                      dtypes=None, random_state=None):
+    """
+    Infer a column's type from a random sample of its values, examining one
+    value at a time and stopping as soon as the best type is separated from
+    the runner-up with the requested confidence. Returns a ColumnInference
+    with the share of examined values detected as the best type, the
+    confidence reached and the examined values.
+    """
+    rng = random.Random(random_state)
+    sample = reservoir_sample(values, max_samples, rng)
+    counts = Counter()
+    detected = {}
+    examined = []
+    reached = 0.
+    for s in sample:
+        try:
+            k = value_key(s)
+            hash(k)
+        except TypeError:
+            # Unhashable, detected every time
+            k = None
+        if k is not None and k in detected:
+            dtype = detected[k]
+        else:
+            types = eligible_types(s)
+            if dtypes is not None:
+                types = [t for t in types if t in dtypes]
+            scores = score_types(s, types)
+            dtype = max(scores, key=lambda x: x[0])[1] if scores else None
+            if k is not None:
+                detected[k] = dtype
+        examined.append(s)
+        counts[dtype] += 1
+        if len(examined) >= min_samples:
+            reached = separation_confidence(counts, len(examined))
+            if reached >= confidence:
+                break
+    if not examined:
+        return ColumnInference(0, None, 0., examined)
+    reached = separation_confidence(counts, len(examined))
+    dtype, n = counts.most_common(1)[0]
+    return ColumnInference(n / float(len(examined)), dtype, reached, examined)
+
+
 def score_similarity(s1, s2, as_type=None, similarity_measure=None, **dtype_kwargs):
     if as_type is None:
         as_type = get_closest_common_type(s1, s2)
-    return get_datatype(dtype,
+    return get_datatype(as_type,
                         similarity_measure=similarity_measure,
                         **dtype_kwargs
                ).score_similarity(s1, s2), as_type
@@ -44,12 +175,60 @@ def is_exact_match(s1, s2, as_type=None, **dtype_kwargs):
     return get_datatype(as_type, **dtype_kwargs).is_exact_match(s1, s2), as_type
 
 
+def is_similar(s1, s2, threshold, as_type=None, similarity_measure=None, **dtype_kwargs):
+    """Whether s1 and s2 score above threshold, stopping early where the measure allows"""
+    if as_type is None:
+        as_type = get_closest_common_type(s1, s2)
+    dtype = get_datatype(as_type, similarity_measure=similarity_measure, **dtype_kwargs)
+    return dtype.is_similar(s1, s2, threshold), as_type
+
+
+def group_exact_matches(values, as_type=None, **dtype_kwargs):
+    """
+    Group the indices of values by canonical key in a single pass. Returns
+    {key: [indices]}, values that don't parse as `as_type` are left out.
+    """
+    values = list(values)
+    if as_type is None:
+        (score, as_type), _ = detect_column_type(values)
+    keys = get_datatype(as_type, **dtype_kwargs).bulk_canonicalize(values)
+    groups = {}
+    for i, key in enumerate(keys):
+        if key is not None:
+            groups.setdefault(key, []).append(i)
+    return groups
+
+
+def exact_match_pairs(left, right, as_type=None, **dtype_kwargs):
+    """
+    Hash join of two lists of values on canonical key. Yields (i, j) for
+    every left[i] that exactly matches right[j].
+    """
+    left = list(left)
+    if as_type is None:
+        (score, as_type), _ = detect_column_type(left)
+    groups = group_exact_matches(left, as_type, **dtype_kwargs)
+    keys = get_datatype(as_type, **dtype_kwargs).bulk_canonicalize(right)
+    for j, key in enumerate(keys):
+        for i in groups.get(key, ()):
+            yield i, j
+
+
 def is_eligible(s, dtype, **dtype_kwargs):
     return get_datatype(dtype, **dtype_kwargs).is_eligible(s)
 
 
 def build_similarity_model(corpus, model_type='tfidf', **model_kwargs):
-    return get_model(model_type, **model_kwargs).fit(corpus)
+    return similarity.build_similarity_model(corpus, model_type, **model_kwargs)
+
+
+def similarity_join(left, right=None, measure='jaccard', threshold=.8, **join_kwargs):
+    """
+    Streams (i, j, score) for all pairs of left and right values (or of left
+    values, if right is None) with token set similarity of at least threshold.
+    """
+    from .join import similarity_join
+    return similarity_join(left, right, measure, threshold, **join_kwargs)
 
 
 """
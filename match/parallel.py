@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+Parallel scoring of record pairs on a process pool
+"""
+from collections import deque
+import itertools
+import os
+
+from .datatypes import get_closest_common_type, get_datatype
+
+
+# Per-process datatype, set up once by `init_worker`
+worker_datatype = None
+
+
+def init_worker(as_type, dtype_kwargs):
+    global worker_datatype
+    if as_type is not None:
+        worker_datatype = get_datatype(as_type, **dtype_kwargs)
+
+
+def score_chunk(chunk, dtype_kwargs=None, dtype=None):
+    """
+    Scores of a chunk of pairs with dtype, the worker's datatype if None,
+    or with the closest common type of each pair if neither is set
+    """
+    if dtype is None:
+        dtype = worker_datatype
+    if dtype is not None:
+        score = dtype.score_similarity
+        return [score(s1, s2) for s1, s2 in chunk]
+    scores = []
+    for s1, s2 in chunk:
+        as_type = get_closest_common_type(s1, s2)
+        scores.append(get_datatype(as_type, **(dtype_kwargs or {})).score_similarity(s1, s2))
+    return scores
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def score_pairs(pairs, as_type=None, n_jobs=None, chunk_size=1000, **dtype_kwargs):
+    """
+    Score an iterable of (s1, s2) pairs, yielding scores in input order.
+    Pairs are sent in chunks to n_jobs worker processes (all cores if None),
+    each of which sets up its datatype and similarity measure once. If
+    as_type is None, the type is detected for each pair.
+    """
+    if n_jobs is None or n_jobs < 0:
+        n_jobs = os.cpu_count() or 1
+    chunks = chunked(pairs, chunk_size)
+    if n_jobs == 1:
+        # Scored in this process: the datatype stays local, as other
+        # generators may be scoring at the same time
+        dtype = get_datatype(as_type, **dtype_kwargs) if as_type is not None else None
+        for chunk in chunks:
+            for score in score_chunk(chunk, dtype_kwargs, dtype):
+                yield score
+        return
+    # Imported here as it pulls in multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(n_jobs, initializer=init_worker,
+                             initargs=(as_type, dtype_kwargs)) as executor:
+        # Bound the chunks in flight so huge inputs stream through
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(score_chunk, chunk, dtype_kwargs))
+            if len(pending) >= 2 * n_jobs:
+                for score in pending.popleft().result():
+                    yield score
+        while pending:
+            for score in pending.popleft().result():
+                yield score
@@ -1,76 +1,86 @@
+from array import array
+from bisect import bisect_left
 from collections import Counter
 import math
-
-import py_stringmatching as sm
-
-from .utils import clean_to_alphanum, lower_and_strip
-
-
-similarity_measure_lookup = {
-
-    # Sequence
-    'affine': sm.Affine,
-    'bag_distance': sm.BagDistance,
-    'editex': sm.Editex,
-    'hamming_distance': sm.HammingDistance,
-    'jaro': sm.Jaro,
-    'jaro_winkler': sm.JaroWinkler,
-    'levenshtein': sm.Levenshtein,
-    'monge_elkan': sm.MongeElkan,
-    'needleman_wunsch': sm.NeedlemanWunsch,
-    'smith_waterman': sm.SmithWaterman,
+import threading
+
+from .threshold import set_similarity_upper_bound
+from .utils import (Lazy, LazyLookup, LazyModule, LRUCache, clean_to_alphanum,
+                    lower_and_strip, optional_module)
+
+# Imported on first use
+np = optional_module('numpy')
+sparse = optional_module('scipy.sparse')
+sm = LazyModule('py_stringmatching')
+bitparallel = LazyModule('.bitparallel', __package__)
+
+
+# Measures and tokenizers are built on first lookup
+similarity_measure_lookup = LazyLookup({
+
+    # Sequence (bitparallel measures also score one-vs-many)
+    'affine': Lazy(lambda: sm.Affine),
+    'bag_distance': Lazy(lambda: sm.BagDistance),
+    'editex': Lazy(lambda: sm.Editex),
+    'hamming_distance': Lazy(lambda: sm.HammingDistance),
+    'jaro': Lazy(lambda: bitparallel.Jaro),
+    'jaro_winkler': Lazy(lambda: bitparallel.JaroWinkler),
+    'levenshtein': Lazy(lambda: bitparallel.Levenshtein),
+    'monge_elkan': Lazy(lambda: sm.MongeElkan),
+    'needleman_wunsch': Lazy(lambda: sm.NeedlemanWunsch),
+    'smith_waterman': Lazy(lambda: sm.SmithWaterman),
 
     # Phonetic
-    'soundex': sm.Soundex,
+    'soundex': Lazy(lambda: sm.Soundex),
 
     # Set-based
-    'cosine': sm.Cosine,
-    'dice': sm.Dice,
-    'generalized_jaccard': sm.GeneralizedJaccard,
-    'jaccard': sm.Jaccard,
-    'overlap_coefficient': sm.OverlapCoefficient,
-    'tversky_index': sm.TverskyIndex,
+    'cosine': Lazy(lambda: sm.Cosine),
+    'dice': Lazy(lambda: sm.Dice),
+    'generalized_jaccard': Lazy(lambda: sm.GeneralizedJaccard),
+    'jaccard': Lazy(lambda: sm.Jaccard),
+    'overlap_coefficient': Lazy(lambda: sm.OverlapCoefficient),
+    'tversky_index': Lazy(lambda: sm.TverskyIndex),
 
     # Corpus
-    'tfidf': sm.TfIdf,
-    'soft_tfidf': sm.SoftTfIdf,
-}
+    'tfidf': Lazy(lambda: sm.TfIdf),
+    'soft_tfidf': Lazy(lambda: sm.SoftTfIdf),
+})
 
 
-tokenizer_lookup = {
+tokenizer_lookup = LazyLookup({
 
     # Character gram tokenizers
-    '1gram': sm.QgramTokenizer(qval=1),
-    '1grams': sm.QgramTokenizer(qval=1),
-    '2grams': sm.QgramTokenizer(qval=2),
-    '3grams': sm.QgramTokenizer(qval=3),
-    '4grams': sm.QgramTokenizer(qval=4),
-    '5grams': sm.QgramTokenizer(qval=5),
-    '6grams': sm.QgramTokenizer(qval=6),
-    '7grams': sm.QgramTokenizer(qval=7),
-    '8grams': sm.QgramTokenizer(qval=8),
-    '9grams': sm.QgramTokenizer(qval=9),
-    '1gram_set': sm.QgramTokenizer(qval=1, return_set=True),
-    '1grams_set': sm.QgramTokenizer(qval=1, return_set=True),
-    '2grams_set': sm.QgramTokenizer(qval=2, return_set=True),
-    '3grams_set': sm.QgramTokenizer(qval=3, return_set=True),
-    '4grams_set': sm.QgramTokenizer(qval=4, return_set=True),
-    '5grams_set': sm.QgramTokenizer(qval=5, return_set=True),
-    '6grams_set': sm.QgramTokenizer(qval=6, return_set=True),
-    '7grams_set': sm.QgramTokenizer(qval=7, return_set=True),
-    '8grams_set': sm.QgramTokenizer(qval=8, return_set=True),
-    '9grams_set': sm.QgramTokenizer(qval=9, return_set=True),
+    '1gram': Lazy(lambda: sm.QgramTokenizer(qval=1)),
+    '1grams': Lazy(lambda: sm.QgramTokenizer(qval=1)),
+    '2grams': Lazy(lambda: sm.QgramTokenizer(qval=2)),
+    '3grams': Lazy(lambda: sm.QgramTokenizer(qval=3)),
+    '4grams': Lazy(lambda: sm.QgramTokenizer(qval=4)),
+    '5grams': Lazy(lambda: sm.QgramTokenizer(qval=5)),
+    '6grams': Lazy(lambda: sm.QgramTokenizer(qval=6)),
+    '7grams': Lazy(lambda: sm.QgramTokenizer(qval=7)),
+    '8grams': Lazy(lambda: sm.QgramTokenizer(qval=8)),
+    '9grams': Lazy(lambda: sm.QgramTokenizer(qval=9)),
+    '1gram_set': Lazy(lambda: sm.QgramTokenizer(qval=1, return_set=True)),
+    '1grams_set': Lazy(lambda: sm.QgramTokenizer(qval=1, return_set=True)),
+    '2grams_set': Lazy(lambda: sm.QgramTokenizer(qval=2, return_set=True)),
+    '3grams_set': Lazy(lambda: sm.QgramTokenizer(qval=3, return_set=True)),
+    '4grams_set': Lazy(lambda: sm.QgramTokenizer(qval=4, return_set=True)),
+    '5grams_set': Lazy(lambda: sm.QgramTokenizer(qval=5, return_set=True)),
+    '6grams_set': Lazy(lambda: sm.QgramTokenizer(qval=6, return_set=True)),
+    '7grams_set': Lazy(lambda: sm.QgramTokenizer(qval=7, return_set=True)),
+    '8grams_set': Lazy(lambda: sm.QgramTokenizer(qval=8, return_set=True)),
+    '9grams_set': Lazy(lambda: sm.QgramTokenizer(qval=9, return_set=True)),
 
     # Word tokenizers
-    'alphanumeric': sm.AlphanumericTokenizer(),
-    'alphanum': sm.AlphanumericTokenizer(),
-    'alphabetic': sm.AlphabeticTokenizer(),
-    'whitespace': sm.WhitespaceTokenizer(),
-    'alphanumeric_set': sm.AlphanumericTokenizer(return_set=True),
-    'alphanum_set': sm.AlphanumericTokenizer(return_set=True),
-    'alphabetic_set': sm.AlphabeticTokenizer(return_set=True),
-    'whitespace_set': sm.WhitespaceTokenizer(return_set=True),
-}
+    'alphanumeric': Lazy(lambda: sm.AlphanumericTokenizer()),
+    'alphanum': Lazy(lambda: sm.AlphanumericTokenizer()),
+    'alphabetic': Lazy(lambda: sm.AlphabeticTokenizer()),
+    'whitespace': Lazy(lambda: sm.WhitespaceTokenizer()),
+    'alphanumeric_set': Lazy(lambda: sm.AlphanumericTokenizer(return_set=True)),
+    'alphanum_set': Lazy(lambda: sm.AlphanumericTokenizer(return_set=True)),
+    'alphabetic_set': Lazy(lambda: sm.AlphabeticTokenizer(return_set=True)),
+    'whitespace_set': Lazy(lambda: sm.WhitespaceTokenizer(return_set=True)),
+})
 
 
 cleaner_lookup = {
@@ -97,7 +107,7 @@ def get_tokenizer(tokenizer):
             return tokenizer_lookup[tokenizer]
         except KeyError:
             raise KeyError("No such tokenizer {}".format(tokenizer))
-    if not hasattr(tokenizer, 'tokenizer'):
+    if not hasattr(tokenizer, 'tokenize'):
         raise ValueError("tokenizer must have a `tokenize` callable")
     return tokenizer
 
@@ -113,14 +123,437 @@ def get_cleaner(cleaner):
 
 
 
-def build_similarity_model(corpus, model_type, tokenizer='3grams',
-                           cleaner='alphanum', **model_kwargs):
-    pass
+"""
+Set similarity, as a function of overlap and set sizes
+"""
+
+def overlap_coefficient(overlap, size1, size2):
+    return overlap / float(min(size1, size2))
+
+
+def jaccard(overlap, size1, size2):
+    return overlap / float(size1 + size2 - overlap)
+
 
+def dice(overlap, size1, size2):
+    return 2. * overlap / (size1 + size2)
 
 
+def cosine(overlap, size1, size2):
+    return overlap / math.sqrt(size1 * size2)
+
+
+set_similarity_lookup = {
+    'overlap': overlap_coefficient,
+    'overlap_coefficient': overlap_coefficient,
+    'jaccard': jaccard,
+    'dice': dice,
+    'cosine': cosine,
+}
+
+
+def get_set_similarity(measure):
+    if callable(measure):
+        return measure
+    try:
+        return set_similarity_lookup[measure]
+    except KeyError:
+        raise KeyError("No such set similarity {}".format(measure))
+
+
+def set_similarity(measure, tokens1, tokens2):
+    if not tokens1 or not tokens2:
+        return 0.
+    overlap = len(tokens1 & tokens2)
+    return get_set_similarity(measure)(overlap, len(tokens1), len(tokens2))
+
+
+"""
+Token interning
+"""
+
+class TokenDictionary(object):
+    """
+    Interns tokens to integer ids, so each cleaned and tokenized string is
+    held once as a sorted array('I') of its distinct token ids rather than
+    as a set of substrings. Encodings of recently seen strings are cached.
+
+    Ids must stay stable for as long as encodings are held, so interned
+    tokens are never evicted: the dictionary grows with the number of
+    distinct tokens seen, bounded by the tokenizer's vocabulary (for q-grams
+    of cleaned strings, the distinct q-grams of the alphabet in use).
+    Interning is thread-safe.
+    """
+
+    def __init__(self, tokenizer='3grams', cleaner='alphanum', cache_size=65536):
+        self.tokenizer = get_tokenizer(tokenizer)
+        self.cleaner = get_cleaner(cleaner)
+        self.ids = {}
+        self.tokens = []
+        self.lock = threading.Lock()
+        self.cache = LRUCache(cache_size) if cache_size else None
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def token_id(self, token):
+        token_id = self.ids.get(token)
+        if token_id is None:
+            with self.lock:
+                # Another thread may have interned it meanwhile
+                token_id = self.ids.get(token)
+                if token_id is None:
+                    self.tokens.append(token)
+                    token_id = self.ids[token] = len(self.tokens) - 1
+        return token_id
+
+    def encode(self, s):
+        """Sorted array('I') of the distinct token ids of s"""
+        if self.cache is not None:
+            try:
+                return self.cache.get_or_compute(s, lambda: self._encode(s))
+            except TypeError:
+                # Unhashable input
+                pass
+        return self._encode(s)
+
+    def _encode(self, s):
+        s = self.cleaner(s)
+        if not s:
+            return array('I')
+        return array('I', sorted(set(self.token_id(t) for t in self.tokenizer.tokenize(s))))
+
+    def decode(self, ids):
+        return set(self.tokens[i] for i in ids)
+
+
+# Length ratio above which id_overlap merges by bisection rather than with
+# a set, which is faster for arrays of similar lengths
+BISECT_OVERLAP_RATIO = 16
+
+
+def id_overlap(ids1, ids2):
+    """Number of ids shared by two sorted arrays of distinct ids"""
+    if len(ids1) > len(ids2):
+        ids1, ids2 = ids2, ids1
+    if len(ids2) < BISECT_OVERLAP_RATIO * len(ids1):
+        return len(set(ids1).intersection(ids2))
+    # Merge the short array into the long one, bisecting the rest of the
+    # long array for each id
+    overlap = 0
+    lo = 0
+    hi = len(ids2)
+    for token_id in ids1:
+        lo = bisect_left(ids2, token_id, lo, hi)
+        if lo == hi:
+            break
+        if ids2[lo] == token_id:
+            overlap += 1
+            lo += 1
+    return overlap
+
+
+def bulk_id_overlaps(ids, candidates):
+    """
+    Overlap of the sorted id array ids with each of candidates, merged
+    against all of them at once. Requires numpy.
+    """
+    sizes = np.array([len(c) for c in candidates], dtype=np.int64)
+    overlaps = np.zeros(len(candidates), dtype=np.int64)
+    if not len(ids) or not sizes.sum():
+        return overlaps
+    query = np.frombuffer(ids, dtype=np.uint32)
+    flat = np.concatenate([np.frombuffer(c, dtype=np.uint32) for c in candidates if len(c)])
+    positions = np.minimum(np.searchsorted(query, flat), len(query) - 1)
+    hits = query[positions] == flat
+    owners = np.repeat(np.arange(len(candidates)), sizes)
+    return np.bincount(owners[hits], minlength=len(candidates))
+
+
+def id_set_similarity(measure, ids1, ids2):
+    """set_similarity of two arrays of distinct token ids"""
+    if not len(ids1) or not len(ids2):
+        return 0.
+    return get_set_similarity(measure)(id_overlap(ids1, ids2), len(ids1), len(ids2))
+
+
+"""
+Similarity models
+"""
+
 class SimilarityModel(object):
-    pass
+    """
+    Set similarity of tokenized strings, with optional indexing of a corpus
+    for fast similarity lookups.
+    """
+
+    def __init__(self, measure='jaccard', tokenizer='3grams', cleaner='alphanum'):
+        self.measure = measure
+        # Names are kept so fitted models can be saved
+        self.tokenizer_name = tokenizer
+        self.cleaner_name = cleaner
+        self.tokenizer = get_tokenizer(tokenizer)
+        self.cleaner = get_cleaner(cleaner)
+        self.dictionary = TokenDictionary(self.tokenizer, self.cleaner)
+        self.corpus = []
+        self.index = None
+
+    def tokens(self, s):
+        s = self.cleaner(s)
+        if not s:
+            return set()
+        return set(self.tokenizer.tokenize(s))
+
+    def fit(self, corpus):
+        self.corpus = list(corpus)
+        self.index = None
+        return self
+
+    def similarity(self, s1, s2):
+        return id_set_similarity(self.measure, self.dictionary.encode(s1),
+                                 self.dictionary.encode(s2))
+
+    def similarity_many(self, s, candidates):
+        """similarity of s to each of candidates"""
+        encode = self.dictionary.encode
+        ids = encode(s)
+        candidate_ids = [encode(c) for c in candidates]
+        if np is None:
+            return [id_set_similarity(self.measure, ids, c) for c in candidate_ids]
+        score = get_set_similarity(self.measure)
+        overlaps = bulk_id_overlaps(ids, candidate_ids).tolist()
+        size = len(ids)
+        return [score(overlap, size, len(c)) if size and len(c) else 0.
+                for overlap, c in zip(overlaps, candidate_ids)]
+
+    def exceeds_threshold(self, s1, s2, threshold):
+        """
+        Whether similarity(s1, s2) > threshold. The overlap is only counted
+        when the set sizes allow a score above threshold.
+        """
+        ids1 = self.dictionary.encode(s1)
+        ids2 = self.dictionary.encode(s2)
+        if not len(ids1) or not len(ids2):
+            return 0. > threshold
+        score = get_set_similarity(self.measure)
+        if set_similarity_upper_bound(score, len(ids1), len(ids2)) <= threshold:
+            return False
+        return score(id_overlap(ids1, ids2), len(ids1), len(ids2)) > threshold
+
+    def build_index(self, backend='inverted', **index_kwargs):
+        from .index import get_index
+        self.index = get_index(backend, **index_kwargs).fit(
+            [self.tokens(doc) for doc in self.corpus])
+        return self.index
+
+    def get_all_similar(self, s, measure=None, threshold=.5):
+        """
+        All corpus documents with similarity to s of at least threshold, as a
+        list of (score, doc_id) with the highest scores first.
+        """
+        if self.index is None:
+            self.build_index()
+        return self.index.query(self.tokens(s), measure or self.measure, threshold)
+
+    def save(self, path):
+        """Save the fitted model (and index) in the binary format of `match.storage`"""
+        from .storage import save_model
+        save_model(self, path)
+
+    @staticmethod
+    def load(path, mmap=True):
+        from .storage import load_model
+        return load_model(path, mmap=mmap)
+
+    def self_join(self, measure=None, threshold=.5):
+        """Yields (doc_id1, doc_id2, score) for all similar pairs in the corpus"""
+        measure = measure or self.measure
+        if self.index is None:
+            # Without an index a prefix filtering join is faster than building one
+            from .join import SetSimilarityJoin
+            join = SetSimilarityJoin(measure, threshold, self.tokenizer, self.cleaner)
+            for pair in join.self_join(self.corpus):
+                yield pair
+            return
+        if hasattr(self.index, 'self_join'):
+            for pair in self.index.self_join(measure, threshold):
+                yield pair
+            return
+        for doc_id, doc in enumerate(self.corpus):
+            for score, other in self.index.query(self.tokens(doc), measure, threshold):
+                if other > doc_id:
+                    yield doc_id, other, score
+
+
+# Measures TfIdfModel scores on its weighted vectors, others are set measures
+TFIDF_MEASURES = (None, 'cosine', 'tfidf')
+
+
+class TfIdfModel(SimilarityModel):
+    """
+    Cosine similarity of TF-IDF weighted token vectors. Fitting builds a CSR
+    matrix of L2 normalized document vectors over a frozen vocabulary, so
+    scoring a block of queries against the corpus is one sparse product.
+    Requires numpy and scipy.
+    """
+
+    def __init__(self, tokenizer='3grams', cleaner='alphanum', sublinear_tf=False):
+        if sparse is None:
+            raise ImportError("TfIdfModel requires numpy and scipy")
+        super(TfIdfModel, self).__init__(measure='cosine', tokenizer=tokenizer,
+                                         cleaner=cleaner)
+        self.sublinear_tf = sublinear_tf
+        self.vocabulary = {}
+        self.idf = None
+        self.matrix = None
+
+    def token_counts(self, s):
+        s = self.cleaner(s)
+        if not s:
+            return Counter()
+        return Counter(self.tokenizer.tokenize(s))
+
+    def fit(self, corpus):
+        super(TfIdfModel, self).fit(corpus)
+        vocabulary = {}
+        document_frequency = []
+        counts = []
+        for doc in self.corpus:
+            doc_counts = self.token_counts(doc)
+            for token in doc_counts:
+                token_id = vocabulary.get(token)
+                if token_id is None:
+                    token_id = vocabulary[token] = len(document_frequency)
+                    document_frequency.append(0)
+                document_frequency[token_id] += 1
+            counts.append(doc_counts)
+        self.vocabulary = vocabulary
+        # Smoothed idf, as if one extra document contained every token
+        n = len(self.corpus)
+        self.idf = np.log((1. + n) / (1. + np.array(document_frequency, dtype=np.float64))) + 1
+        self.matrix = self._vectorize(counts)
+        return self
+
+    def transform(self, docs):
+        """CSR matrix of normalized TF-IDF vectors, ignoring unseen tokens"""
+        return self._vectorize([self.token_counts(doc) for doc in docs])
+
+    def _vectorize(self, counts):
+        indptr = [0]
+        indices = []
+        data = []
+        for doc_counts in counts:
+            for token, count in doc_counts.items():
+                token_id = self.vocabulary.get(token)
+                if token_id is not None:
+                    indices.append(token_id)
+                    data.append(count)
+            indptr.append(len(indices))
+        data = np.array(data, dtype=np.float64)
+        if self.sublinear_tf:
+            data = 1 + np.log(data)
+        indices = np.array(indices, dtype=np.int32)
+        data *= self.idf[indices]
+        matrix = sparse.csr_matrix((data, indices, np.array(indptr, dtype=np.int64)),
+                                   shape=(len(counts), len(self.vocabulary)))
+        matrix.sort_indices()
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        norms[norms == 0] = 1
+        return sparse.diags(1 / norms).dot(matrix).tocsr()
+
+    def similarity(self, s1, s2):
+        vectors = self.transform([s1, s2])
+        return float(vectors[0].multiply(vectors[1]).sum())
+
+    def similarity_many(self, s, candidates):
+        vectors = self.transform([s] + list(candidates))
+        return vectors[1:].dot(vectors[0].T).toarray().ravel().tolist()
+
+    def exceeds_threshold(self, s1, s2, threshold):
+        # Weighted vectors have no size bound
+        return self.similarity(s1, s2) > threshold
+
+    def score(self, queries, doc_ids=None):
+        """
+        (len(queries), n_candidates) sparse matrix of scores against the
+        corpus, or against the documents in doc_ids.
+        """
+        matrix = self.matrix if doc_ids is None else self.matrix[doc_ids]
+        return self.transform(queries).dot(matrix.T).tocsr()
+
+    def top_k(self, queries, k=10, doc_ids=None, threshold=0):
+        """
+        For each of queries, the k most similar documents with a score above
+        threshold as a list of (score, doc_id), highest first.
+        """
+        scores = self.score(queries, doc_ids)
+        results = []
+        for row in range(scores.shape[0]):
+            start, end = scores.indptr[row], scores.indptr[row + 1]
+            data = scores.data[start:end]
+            columns = scores.indices[start:end]
+            keep = data > threshold
+            data, columns = data[keep], columns[keep]
+            if len(data) > k:
+                # Keep ties with the k-th best so they break on doc id below
+                kth = np.partition(data, len(data) - k)[len(data) - k]
+                keep = data >= kth
+                data, columns = data[keep], columns[keep]
+            if doc_ids is not None:
+                columns = np.asarray(doc_ids)[columns]
+            order = np.lexsort((columns, -data))[:k]
+            results.append([(float(data[i]), int(columns[i])) for i in order])
+        return results
+
+    def build_index(self, backend=None, **index_kwargs):
+        """
+        The document matrix is the index for cosine similarity. Set
+        measures use an index of token sets, built by `SimilarityModel` on
+        first use, or here if a backend is given.
+        """
+        if backend is None:
+            return self.matrix
+        return super(TfIdfModel, self).build_index(backend, **index_kwargs)
+
+    def get_all_similar(self, s, measure=None, threshold=.5):
+        if measure not in TFIDF_MEASURES:
+            if self.index is None:
+                self.build_index('inverted')
+            return super(TfIdfModel, self).get_all_similar(s, measure, threshold)
+        results = self.top_k([s], k=self.matrix.shape[0], threshold=threshold - 1e-9)[0]
+        return results
+
+    def self_join(self, measure=None, threshold=.5, batch_size=1024):
+        if measure not in TFIDF_MEASURES:
+            for pair in super(TfIdfModel, self).self_join(measure, threshold):
+                yield pair
+            return
+        for start in range(0, self.matrix.shape[0], batch_size):
+            scores = self.matrix[start:start + batch_size].dot(self.matrix.T).tocoo()
+            for i, j, score in zip(scores.row, scores.col, scores.data):
+                i += start
+                if j > i and score >= threshold - 1e-9:
+                    yield int(i), int(j), float(score)
+
+
+model_lookup = {
+    'tfidf': TfIdfModel,
+}
+
+
+def get_model(model_type, **model_kwargs):
+    if model_type in set_similarity_lookup:
+        return SimilarityModel(measure=model_type, **model_kwargs)
+    try:
+        return model_lookup[model_type](**model_kwargs)
+    except KeyError:
+        raise KeyError("No such model {}".format(model_type))
+
+
+def build_similarity_model(corpus, model_type='tfidf', tokenizer='3grams',
+                           cleaner='alphanum', **model_kwargs):
+    return get_model(model_type, tokenizer=tokenizer, cleaner=cleaner,
+                     **model_kwargs).fit(corpus)
 
 
 
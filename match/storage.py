@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+"""
+Binary on-disk format for fitted similarity models and their indexes.
+
+    8 bytes    magic, b'PYMATCH\0'
+    uint32     format version
+    uint32     header length
+    header     utf-8 JSON: model type, parameters and, for every array, its
+               dtype, shape and byte offset
+    arrays     raw little-endian array data, each aligned to 64 bytes
+
+Loading maps the file with mmap and wraps each array in a NumPy view, so
+worker processes share one page-cached copy and loading does no refitting.
+"""
+from collections.abc import Mapping
+import json
+import struct
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .index import InvertedIndex, MinHashLSHIndex
+from .similarity import SimilarityModel, TfIdfModel
+
+
+MAGIC = b'PYMATCH\0'
+VERSION = 2
+ALIGNMENT = 64
+PREAMBLE = struct.Struct('<8sII')
+
+
+class StringArray(object):
+    """Read-only sequence of strings stored as a utf-8 blob and offsets"""
+
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    @classmethod
+    def from_strings(cls, strings):
+        encoded = [s.encode('utf-8') for s in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        blob = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+        return cls(blob, offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("StringArray index out of range")
+        return self.blob[self.offsets[i]:self.offsets[i + 1]].tobytes().decode('utf-8')
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+class PostingLists(object):
+    """Read-only posting lists stored as one flat array and offsets"""
+
+    def __init__(self, flat, offsets):
+        self.flat = flat
+        self.offsets = offsets
+
+    @classmethod
+    def from_lists(cls, postings):
+        offsets = np.zeros(len(postings) + 1, dtype=np.int64)
+        np.cumsum([len(p) for p in postings], out=offsets[1:])
+        arrays = [np.asarray(p, dtype=np.uint32) for p in postings] or [np.zeros(0, dtype=np.uint32)]
+        flat = np.concatenate(arrays)
+        return cls(flat, offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.flat[self.offsets[i]:self.offsets[i + 1]]
+
+
+class SortedVocabulary(Mapping):
+    """
+    Read-only token -> id mapping stored as a sorted array of tokens and
+    their ids. Lookups are a binary search, so loading builds no dict.
+    """
+
+    def __init__(self, tokens, ids):
+        self.tokens = tokens
+        self.ids = ids
+
+    @classmethod
+    def from_dict(cls, vocabulary):
+        tokens = sorted(vocabulary)
+        ids = np.array([vocabulary[token] for token in tokens], dtype=np.uint32)
+        return cls(np.array(tokens, dtype=np.str_) if tokens else np.zeros(0, dtype='U1'), ids)
+
+    def __getitem__(self, token):
+        i = int(np.searchsorted(self.tokens, token))
+        if i < len(self.tokens) and self.tokens[i] == token:
+            return int(self.ids[i])
+        raise KeyError(token)
+
+    def __iter__(self):
+        for token in self.tokens:
+            yield str(token)
+
+    def __len__(self):
+        return len(self.tokens)
+
+
+def require_numpy():
+    if np is None:
+        raise ImportError("Saving and loading models requires numpy")
+
+
+def strings_arrays(prefix, strings):
+    strings = StringArray.from_strings(strings)
+    return {prefix + '_blob': strings.blob, prefix + '_offsets': strings.offsets}
+
+
+"""
+Model <-> arrays
+"""
+
+def model_to_arrays(model):
+    for name in ('tokenizer_name', 'cleaner_name'):
+        if not isinstance(getattr(model, name), str):
+            raise ValueError("Only models with named tokenizers and cleaners can be saved")
+    params = {'tokenizer': model.tokenizer_name, 'cleaner': model.cleaner_name}
+    arrays = strings_arrays('corpus', model.corpus)
+    if isinstance(model, TfIdfModel):
+        params['model'] = 'tfidf'
+        params['sublinear_tf'] = model.sublinear_tf
+        params['n_features'] = len(model.vocabulary)
+        arrays.update(vocabulary_arrays(model.vocabulary))
+        arrays['idf'] = model.idf
+        arrays['matrix_data'] = model.matrix.data
+        arrays['matrix_indices'] = model.matrix.indices
+        arrays['matrix_indptr'] = model.matrix.indptr
+        return params, arrays
+    params['model'] = 'set'
+    params['measure'] = model.measure
+    index = model.index
+    if isinstance(index, InvertedIndex):
+        params['index'] = 'inverted'
+        arrays.update(vocabulary_arrays(index.vocabulary))
+        postings = PostingLists.from_lists(index.postings)
+        arrays['postings'] = postings.flat
+        arrays['postings_offsets'] = postings.offsets
+        arrays['sizes'] = np.asarray(index.sizes, dtype=np.uint32)
+        arrays['doc_ids'] = np.asarray(index.doc_ids, dtype=np.uint32)
+    elif isinstance(index, MinHashLSHIndex):
+        params['index'] = 'minhash'
+        params.update(num_perm=index.minhash.num_perm, bands=index.bands,
+                      rows=index.rows, threshold=index.threshold)
+        arrays['minhash_a'] = index.minhash.a
+        arrays['minhash_b'] = index.minhash.b
+        arrays['signatures'] = index.signatures
+        arrays['bucket_keys'] = index.bucket_keys
+        arrays['bucket_doc_ids'] = index.bucket_doc_ids
+    elif index is not None:
+        raise ValueError("Can't save index of type {}".format(type(index).__name__))
+    return params, arrays
+
+
+def vocabulary_arrays(vocabulary):
+    vocabulary = SortedVocabulary.from_dict(vocabulary)
+    return {'vocabulary_tokens': vocabulary.tokens, 'vocabulary_ids': vocabulary.ids}
+
+
+def load_vocabulary(arrays):
+    return SortedVocabulary(arrays['vocabulary_tokens'], arrays['vocabulary_ids'])
+
+
+def load_strings(arrays, prefix):
+    return StringArray(arrays[prefix + '_blob'], arrays[prefix + '_offsets'])
+
+
+def arrays_to_model(params, arrays):
+    model_type = params['model']
+    if model_type == 'tfidf':
+        from scipy import sparse
+        model = TfIdfModel(tokenizer=params['tokenizer'], cleaner=params['cleaner'],
+                           sublinear_tf=params['sublinear_tf'])
+        model.vocabulary = load_vocabulary(arrays)
+        model.idf = arrays['idf']
+        n_docs = len(arrays['matrix_indptr']) - 1
+        model.matrix = sparse.csr_matrix(
+            (arrays['matrix_data'], arrays['matrix_indices'], arrays['matrix_indptr']),
+            shape=(n_docs, params['n_features']), copy=False)
+    elif model_type == 'set':
+        model = SimilarityModel(measure=params['measure'], tokenizer=params['tokenizer'],
+                                cleaner=params['cleaner'])
+        index_type = params.get('index')
+        if index_type == 'inverted':
+            index = model.index = InvertedIndex()
+            index.vocabulary = load_vocabulary(arrays)
+            index.postings = PostingLists(arrays['postings'], arrays['postings_offsets'])
+            index.sizes = arrays['sizes']
+            index.doc_ids = arrays['doc_ids']
+        elif index_type == 'minhash':
+            index = MinHashLSHIndex(num_perm=params['num_perm'], bands=params['bands'],
+                                    rows=params['rows'], threshold=params['threshold'])
+            index.minhash.a = arrays['minhash_a']
+            index.minhash.b = arrays['minhash_b']
+            model.index = index.set_buckets(arrays['signatures'], arrays['bucket_keys'],
+                                            arrays['bucket_doc_ids'])
+    else:
+        raise ValueError("Unknown model type {}".format(model_type))
+    model.corpus = load_strings(arrays, 'corpus')
+    return model
+
+
+"""
+Files
+"""
+
+def align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def save_model(model, path):
+    require_numpy()
+    params, arrays = model_to_arrays(model)
+    layout = {}
+    offset = 0
+    contiguous = {}
+    for name in sorted(arrays):
+        array = np.ascontiguousarray(arrays[name])
+        array = array.astype(array.dtype.newbyteorder('<'), copy=False)
+        contiguous[name] = array
+        layout[name] = {'dtype': array.dtype.str, 'shape': list(array.shape),
+                        'offset': offset}
+        offset = align(offset + array.nbytes)
+    header = json.dumps({'params': params, 'arrays': layout}).encode('utf-8')
+    data_start = align(PREAMBLE.size + len(header))
+    with open(path, 'wb') as f:
+        f.write(PREAMBLE.pack(MAGIC, VERSION, len(header)))
+        f.write(header)
+        for name in sorted(contiguous):
+            f.write(b'\0' * (data_start + layout[name]['offset'] - f.tell()))
+            f.write(contiguous[name].tobytes())
+
+
+def read_arrays(path, mmap=True):
+    require_numpy()
+    with open(path, 'rb') as f:
+        magic, version, header_length = PREAMBLE.unpack(f.read(PREAMBLE.size))
+        if magic != MAGIC:
+            raise ValueError("{} is not a saved match model".format(path))
+        if version != VERSION:
+            raise ValueError("Unsupported model format version {}".format(version))
+        header = json.loads(f.read(header_length).decode('utf-8'))
+    if mmap:
+        buf = np.memmap(path, dtype=np.uint8, mode='r')
+    else:
+        with open(path, 'rb') as f:
+            buf = np.frombuffer(f.read(), dtype=np.uint8)
+    data_start = align(PREAMBLE.size + header_length)
+    arrays = {}
+    for name, spec in header['arrays'].items():
+        dtype = np.dtype(spec['dtype'])
+        count = int(np.prod(spec['shape'])) if spec['shape'] else 1
+        start = data_start + spec['offset']
+        view = buf[start:start + count * dtype.itemsize].view(dtype)
+        arrays[name] = view.reshape(spec['shape'])
+    return header['params'], arrays
+
+
+def load_model(path, mmap=True):
+    params, arrays = read_arrays(path, mmap=mmap)
+    return arrays_to_model(params, arrays)
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+Threshold-aware similarity: whether a pair scores above a threshold,
+decided without the full computation where a cheap bound already rules it
+out. Most candidate pairs are non-matches, so early rejection is the common
+case. Each test agrees exactly with comparing the measure's score.
+"""
+import struct
+
+
+# Above this many edits a banded Levenshtein in Python is slower than the
+# full computation in C
+MAX_BANDED_DISTANCE = 3
+
+
+def to_float32(x):
+    """x rounded to a C float, as py_stringmatching's Jaro scores are"""
+    return struct.unpack('f', struct.pack('f', x))[0]
+
+
+def common_prefix_length(s1, s2):
+    # Binary search on slice equality, which compares in C
+    lo, hi = 0, min(len(s1), len(s2))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if s1[:mid] == s2[:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def common_suffix_length(s1, s2):
+    lo, hi = 0, min(len(s1), len(s2))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if s1[len(s1) - mid:] == s2[len(s2) - mid:]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def max_levenshtein_distance(threshold, max_len):
+    """Largest distance d with 1 - d / max_len > threshold, -1 if there is none"""
+    d = min(max(int((1 - threshold) * max_len), 0), max_len)
+    while d >= 0 and not 1 - d / float(max_len) > threshold:
+        d -= 1
+    while d < max_len and 1 - (d + 1) / float(max_len) > threshold:
+        d += 1
+    return d
+
+
+def bounded_levenshtein(s1, s2, k):
+    """
+    Levenshtein distance of s1 and s2 if it is at most k, otherwise None.
+    Only the diagonal band of width 2k + 1 is computed, after stripping the
+    common prefix and suffix, and the computation stops as soon as every
+    cell of a row exceeds k.
+    """
+    if k < 0 or abs(len(s1) - len(s2)) > k:
+        return None
+    prefix = common_prefix_length(s1, s2)
+    s1, s2 = s1[prefix:], s2[prefix:]
+    suffix = common_suffix_length(s1, s2)
+    if suffix:
+        s1, s2 = s1[:len(s1) - suffix], s2[:len(s2) - suffix]
+    if len(s1) > len(s2):
+        s1, s2 = s2, s1
+    n1, n2 = len(s1), len(s2)
+    if not n1:
+        return n2 if n2 <= k else None
+    over = k + 1
+    prev = [j if j <= k else over for j in range(n2 + 1)]
+    for i in range(1, n1 + 1):
+        c = s1[i - 1]
+        lo = max(1, i - k)
+        hi = min(n2, i + k)
+        cur = [over] * (n2 + 1)
+        if i <= k:
+            cur[0] = i
+        left = cur[lo - 1]
+        row_min = left
+        for j in range(lo, hi + 1):
+            v = prev[j - 1] if s2[j - 1] == c else prev[j - 1] + 1
+            if prev[j] + 1 < v:
+                v = prev[j] + 1
+            if left + 1 < v:
+                v = left + 1
+            if v > over:
+                v = over
+            cur[j] = left = v
+            if v < row_min:
+                row_min = v
+        if row_min > k:
+            return None
+        prev = cur
+    return prev[n2] if prev[n2] <= k else None
+
+
+def jaro_upper_bound(len1, len2):
+    """
+    Highest Jaro similarity strings of these lengths can have: all characters
+    of the shorter one in common and no transpositions
+    """
+    if not len1 or not len2:
+        return 0.
+    common = float(min(len1, len2))
+    return (common / len1 + common / len2 + 1.) / 3
+
+
+def jaro_winkler_upper_bound(s1, s2, prefix_weight=.1):
+    """Highest Jaro-Winkler similarity of s1 and s2 given their lengths and common prefix"""
+    jaro = to_float32(jaro_upper_bound(len(s1), len(s2)))
+    prefix = 0
+    for c1, c2 in zip(s1[:4], s2[:4]):
+        if c1 != c2:
+            break
+        prefix += 1
+    if not prefix:
+        return jaro
+    # As py_stringmatching computes the bonus
+    return to_float32(jaro + prefix * to_float32(prefix_weight) * (1 - jaro))
+
+
+def set_similarity_upper_bound(score, size1, size2):
+    """
+    Highest similarity of sets of size1 and size2, with score a set
+    similarity of (overlap, size1, size2): one set contains the other
+    """
+    if not size1 or not size2:
+        return 0.
+    return score(min(size1, size2), size1, size2)
+
+
+def exceeds_threshold(measure, s1, s2, threshold):
+    """
+    Whether measure scores s1 and s2 above threshold, using the measure's
+    early-terminating `exceeds_threshold` if it has one.
+    """
+    if hasattr(measure, 'exceeds_threshold'):
+        return measure.exceeds_threshold(s1, s2, threshold)
+    if hasattr(measure, 'similarity'):
+        return measure.similarity(s1, s2) > threshold
+    return measure.get_sim_score(s1, s2) > threshold
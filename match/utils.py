@@ -1,20 +1,98 @@
+from collections import OrderedDict
+from collections.abc import MutableMapping
+import importlib
+import importlib.util
+import random
 import re
+import threading
 non_an = re.compile(r'[^\w\s]')
 collapse = re.compile(r'\s+')
 
 
-def memoize(f):
+class LRUCache(object):
+    """
+    Bounded, thread-safe least-recently-used cache with hit, miss and
+    eviction counters.
+    """
 
-    class memodict(dict):
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
 
-        def __getitem__(self, *key):
-            return dict.__getitem__(self, key)
+    def __len__(self):
+        return len(self.data)
 
-        def __missing__(self, key):
-            ret = self[key] = f(*key)
-            return ret
+    def get_or_compute(self, key, compute):
+        with self.lock:
+            try:
+                value = self.data[key]
+            except KeyError:
+                self.misses += 1
+            else:
+                self.data.move_to_end(key)
+                self.hits += 1
+                return value
+        # Compute outside the lock, a concurrent miss may compute twice
+        value = compute()
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+                self.evictions += 1
+        return value
 
-    return memodict().__getitem__
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def reset_stats(self):
+        with self.lock:
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self.data),
+            'maxsize': self.maxsize,
+        }
+
+
+def memoize(f=None, maxsize=4096):
+    """Bounded memoization, usable as `@memoize` or `@memoize(maxsize=n)`"""
+    if f is None:
+        return lambda f: memoize(f, maxsize=maxsize)
+    cache = LRUCache(maxsize)
+
+    def memoized(*key):
+        return cache.get_or_compute(key, lambda: f(*key))
+
+    memoized.cache = cache
+    return memoized
+
+
+def reservoir_sample(iterable, k, rng=None):
+    """
+    Uniform sample of up to k items from an iterable of unknown length,
+    returned in random order (Algorithm R).
+    """
+    if rng is None:
+        rng = random
+    sample = []
+    for i, item in enumerate(iterable):
+        if i < k:
+            sample.append(item)
+            continue
+        j = rng.randint(0, i)
+        if j < k:
+            sample[j] = item
+    rng.shuffle(sample)
+    return sample
 
 
 """
@@ -37,4 +115,76 @@ def lower_and_strip(s):
         return ''
     if not isinstance(s, str):
         s = str(s)
-    return s.lower().strip()
\ No newline at end of file
+    return s.lower().strip()
+
+
+"""
+Lazy loading, so `import match` doesn't pay for dependencies until they are used
+"""
+
+class LazyModule(object):
+    """
+    Stands in for a module, which is imported on first attribute access.
+    Attributes are looked up on the module every time, so patching the
+    module (eg to mock or count calls) also applies here. Relative names are
+    resolved against package, as by importlib.import_module.
+    """
+
+    def __init__(self, name, package=None):
+        self._name = name
+        self._package = package
+        self._module = None
+
+    def __getattr__(self, attr):
+        if attr.startswith('__'):
+            raise AttributeError(attr)
+        if self._module is None:
+            self._module = importlib.import_module(self._name, self._package)
+        return getattr(self._module, attr)
+
+    def __repr__(self):
+        return '<LazyModule {}>'.format(self._name)
+
+
+def optional_module(name):
+    """LazyModule for an optional dependency, or None if it isn't installed"""
+    # Only the top level package is looked up, finding a submodule would
+    # import its parent
+    if importlib.util.find_spec(name.split('.')[0]) is None:
+        return None
+    return LazyModule(name)
+
+
+class Lazy(object):
+    """A LazyLookup value, built by factory() on first lookup"""
+
+    def __init__(self, factory):
+        self.factory = factory
+
+
+class LazyLookup(MutableMapping):
+    """Name -> value mapping whose Lazy values are built on first lookup"""
+
+    def __init__(self, items=()):
+        self.data = dict(items)
+
+    def __getitem__(self, key):
+        value = self.data[key]
+        if isinstance(value, Lazy):
+            value = self.data[key] = value.factory()
+        return value
+
+    def __setitem__(self, key, value):
+        self.data[key] = value
+
+    def __delitem__(self, key):
+        del self.data[key]
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __len__(self):
+        return len(self.data)
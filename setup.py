@@ -17,6 +17,11 @@ test_requirements = [
     # TODO: put package test requirements here
 ]
 
+# TF-IDF models, MinHash LSH indexes and saved models
+extras_requirements = {
+    'fast': ['numpy', 'scipy'],
+}
+
 setup(
     name='pymatch',
     version='0.1.0',
@@ -31,7 +36,13 @@ setup(
     package_dir={'match':
                  'match'},
     include_package_data=True,
+    entry_points={
+        'console_scripts': [
+            'match=match.cli:main',
+        ],
+    },
     install_requires=requirements,
+    extras_require=extras_requirements,
     license="MIT license",
     zip_safe=False,
     keywords='match',
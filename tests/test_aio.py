@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+test_aio
+----------------------------------
+
+Tests for `match.aio` module.
+'''
+
+import asyncio
+import unittest
+
+from match import aio
+from match import match
+
+
+VALUES = ['608-555-5555', 'foo@gmail.com', 'Foo.Bar+baz@gmail.com', '2016-01-02',
+          'hello world', '', 'foo@gmail.com']
+
+
+class TestAsyncMatcher(unittest.TestCase):
+
+    def test_results_match_sync_api(self):
+        async def run():
+            matcher = aio.AsyncMatcher(batch_size=3)
+            types = await asyncio.gather(*[matcher.detect_type(s) for s in VALUES])
+            parsed = await asyncio.gather(*[matcher.parse_as(s, 'email') for s in VALUES])
+            scores = await asyncio.gather(*[matcher.score_similarity(VALUES[1], s) for s in VALUES])
+            return types, parsed, scores, matcher.metrics()
+        types, parsed, scores, metrics = asyncio.run(run())
+        self.assertEqual([match.detect_type(s) for s in VALUES], types)
+        self.assertEqual([match.parse_as(s, 'email') for s in VALUES], parsed)
+        self.assertEqual([match.score_similarity(VALUES[1], s) for s in VALUES], scores)
+        detect = metrics['methods']['detect_type']
+        self.assertEqual(len(VALUES), detect['submitted'])
+        # 7 concurrent calls in batches of at most 3
+        self.assertEqual(3, detect['batches'])
+        self.assertEqual(3, detect['max_queue_depth'])
+        self.assertEqual(0, metrics['queue_depth'])
+        self.assertEqual(0, metrics['in_flight'])
+
+    def test_latency_budget(self):
+        async def run():
+            matcher = aio.AsyncMatcher(batch_size=100, max_latency=.01)
+            task = asyncio.ensure_future(matcher.detect_type('foo@gmail.com'))
+            await asyncio.sleep(0)
+            queued = matcher.metrics()['queue_depth']
+            return queued, await task
+        queued, result = asyncio.run(run())
+        self.assertEqual(1, queued)
+        self.assertEqual(match.detect_type('foo@gmail.com'), result)
+
+    def test_failures_are_isolated(self):
+        def parse_all(values):
+            return [parse(s) for s in values]
+
+        def parse(s):
+            if s == 'bad':
+                raise ValueError(s)
+            return s.upper()
+
+        async def run():
+            batcher = aio.MicroBatcher(parse_all, parse, batch_size=10)
+            return await asyncio.gather(*[batcher.submit(s) for s in ['a', 'bad', 'b']],
+                                        return_exceptions=True)
+        a, bad, b = asyncio.run(run())
+        self.assertEqual(('A', 'B'), (a, b))
+        self.assertIsInstance(bad, ValueError)
+
+    def test_loop_closed_mid_flight(self):
+        matcher = aio.AsyncMatcher(max_latency=10)
+
+        async def abandon():
+            asyncio.ensure_future(matcher.detect_type('foo@gmail.com'))
+            await asyncio.sleep(0)
+            return matcher.metrics()['queue_depth']
+
+        self.assertEqual(1, asyncio.run(abandon()))
+        matcher.max_latency = .001
+        self.assertEqual(match.detect_type('foo@gmail.com'),
+                         asyncio.run(matcher.detect_type('foo@gmail.com')))
+        self.assertEqual(1, len(matcher.loop_batchers))
+
+    def test_unhashable_dtype_kwargs(self):
+        class Measure(object):
+            __hash__ = None
+
+            def similarity(self, s1, s2):
+                return float(s1 == s2)
+
+        async def run():
+            matcher = aio.AsyncMatcher()
+            scores = await asyncio.gather(*[matcher.score_similarity(
+                'abc', s, as_type='string', similarity_measure=Measure()) for s in ['abc', 'abd']])
+            return scores, matcher.metrics()
+        scores, metrics = asyncio.run(run())
+        self.assertEqual([(1., 'string'), (0., 'string')], scores)
+        self.assertEqual({}, metrics['methods'])
+
+    def test_module_functions(self):
+        async def run():
+            return await asyncio.gather(aio.detect_type('foo@gmail.com'),
+                                        aio.parse_as('Foo@Gmail.com', 'email'),
+                                        aio.score_similarity('abc', 'abd', as_type='string'))
+        detected, parsed, score = asyncio.run(run())
+        self.assertEqual(match.detect_type('foo@gmail.com'), detected)
+        self.assertEqual('foo@gmail.com', parsed)
+        self.assertEqual(match.score_similarity('abc', 'abd', as_type='string'), score)
+
+
+if __name__ == '__main__':
+    unittest.main()
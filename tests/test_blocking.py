@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+test_blocking
+----------------------------------
+
+Tests for `match.blocking` module.
+'''
+
+import itertools
+import unittest
+
+from match import blocking
+
+
+names = ['jonathan smith', 'jon smith', 'Jonathan Smith', 'susan johnson',
+         'susie johnson', 'bob wjorcek', 'robert wjorcek']
+
+
+class TestBlocking(unittest.TestCase):
+
+    def assertValidPairs(self, blocker, left, right=None):
+        pairs = list(blocker.candidate_pairs(left, right))
+        self.assertEqual(len(pairs), len(set(pairs)))
+        self.assertEqual(len(pairs), blocker.stats.n_candidates)
+        if right is None:
+            self.assertTrue(all(i < j for i, j in pairs))
+        n_right = len(left if right is None else right)
+        self.assertTrue(all(0 <= j < n_right for i, j in pairs))
+        self.assertTrue(0 <= blocker.stats.reduction_ratio <= 1)
+        return set(pairs)
+
+    def test_standard_blocker(self):
+        blocker = blocking.get_blocker('standard', prefix_length=3)
+        pairs = self.assertValidPairs(blocker, names)
+        self.assertEqual({(0, 1), (0, 2), (1, 2), (3, 4)}, pairs)
+        self.assertEqual(3, blocker.stats.block_pairs['jon'])
+        self.assertAlmostEqual(1 - 4 / 21., blocker.stats.reduction_ratio)
+
+    def test_canonical_key_blocker(self):
+        left = ['608-345-6789', 'a@b.com', '(608) 345 6789']
+        right = ['+1 608 345 6789', 'nope']
+        blocker = blocking.CanonicalKeyBlocker('phonenumber')
+        pairs = self.assertValidPairs(blocker, left, right)
+        self.assertEqual({(0, 0), (2, 0)}, pairs)
+
+    def test_qgram_blocker(self):
+        blocker = blocking.QgramBlocker(max_block_size=4)
+        pairs = self.assertValidPairs(blocker, names)
+        self.assertIn((0, 1), pairs)
+        self.assertIn((5, 6), pairs)
+        self.assertNotIn((0, 5), pairs)
+        left, right = names[:4], names[2:] + ['smith jon']
+        left_index, right_index = blocker.index(left), blocker.index(right)
+        expected = set((i, j) for key, left_ids in left_index.items()
+                       for i in left_ids for j in right_index.get(key, ()))
+        self.assertEqual(expected, self.assertValidPairs(blocker, left, right))
+
+    def test_sorted_neighbourhood_blocker(self):
+        blocker = blocking.SortedNeighbourhoodBlocker(window=2)
+        pairs = self.assertValidPairs(blocker, names)
+        self.assertEqual(len(names) - 1, len(pairs))
+        pairs = self.assertValidPairs(blocker, names[:3], names[3:])
+        self.assertTrue(pairs)
+
+    def test_score_candidate_pairs(self):
+        pairs = itertools.combinations(range(3), 2)
+        scores = list(blocking.score_candidate_pairs(
+            pairs, ['608-345-6789', '(608) 345 6789', '608-345-6780'],
+            as_type='phonenumber'))
+        self.assertEqual([(0, 1, 1), (0, 2, 0), (1, 2, 0)], scores)
+
+
+if __name__ == '__main__':
+    unittest.main()
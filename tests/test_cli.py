@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+test_cli
+----------------------------------
+
+Tests for `match.cli` module.
+'''
+
+import csv
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from match import cli
+
+
+class TestCli(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.output = os.path.join(self.dir, 'out.csv')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, name, rows):
+        path = os.path.join(self.dir, name)
+        with io.open(path, 'w', newline='', encoding='utf-8') as f:
+            if name.endswith('.jsonl'):
+                for row in rows:
+                    f.write(json.dumps(row) + u'\n')
+            else:
+                writer = csv.DictWriter(f, fieldnames=sorted(rows[0]))
+                writer.writeheader()
+                writer.writerows(rows)
+        return path
+
+    def run_cli(self, *args):
+        self.assertEqual(0, cli.main(list(args) + ['--output', self.output,
+                                                   '--quiet', '--chunk-size', '2']))
+        with io.open(self.output, newline='', encoding='utf-8') as f:
+            return list(csv.DictReader(f))
+
+    def test_exact_clusters(self):
+        phones = ['608-345-6789', '(608) 345 6789', '608-555-1234', 'nope', '+1 608 345 6789']
+        path = self.write('people.csv', [{'name': 'x', 'phone': p} for p in phones])
+        rows = self.run_cli(path, '--column', 'phone')
+        self.assertEqual(['0', '0', '2', '3', '0'], [r['cluster'] for r in rows])
+        self.assertEqual('+16083456789', rows[1]['parsed'])
+
+    def test_fuzzy_pairs(self):
+        names = ['jonathan smith', 'susan johnson', 'jonathan smyth', 'susan johnsen']
+        path = self.write('people.jsonl', [{'name': n} for n in names])
+        rows = self.run_cli(path, '--column', 'name', '--type', 'string',
+                            '--output-mode', 'pairs', '--threshold', '.9')
+        self.assertEqual([('2', '0'), ('3', '1')],
+                         [(r['row'], r['match_row']) for r in rows])
+
+    def test_non_string_values(self):
+        path = self.write('people.jsonl', [{'name': 12}, {'name': 12.0}, {'name': 'x'},
+                                           {'name': None}, {'name': 12}])
+        rows = self.run_cli(path, '--column', 'name', '--type', 'string')
+        self.assertEqual(['0', '1', '2', '3', '0'], [r['cluster'] for r in rows])
+
+    def test_missing_column(self):
+        path = self.write('people.jsonl', [{'name': 'x'}])
+        with self.assertRaises(SystemExit) as e:
+            cli.main([path, '--column', 'nmae', '--output', self.output, '--quiet'])
+        self.assertEqual(2, e.exception.code)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+test_instrumentation
+----------------------------------
+
+Tests for `match.instrumentation` module.
+'''
+
+import unittest
+
+from match import datatypes
+from match import instrumentation
+from match import match
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def setUp(self):
+        instrumentation.reset()
+
+    def tearDown(self):
+        instrumentation.disable()
+        instrumentation.reset()
+
+    def test_records_calls_and_failures(self):
+        with instrumentation.instrumented():
+            self.assertTrue(instrumentation.is_enabled())
+            match.parse_as('608-345-6789', 'phonenumber')
+            match.parse_as('not a phone 12345', 'phonenumber')
+            match.parse_as('x', 'phonenumber')
+        self.assertFalse(instrumentation.is_enabled())
+        parse = instrumentation.snapshot()['phonenumber']['parse']
+        self.assertEqual(3, parse['calls'])
+        self.assertEqual(2, parse['failures'])
+        self.assertEqual(3, sum(count for bound, count in parse['histogram']))
+        self.assertTrue(parse['total_time'] > 0)
+        eligible = instrumentation.snapshot()['phonenumber']['is_eligible']
+        self.assertEqual(1, eligible['failures'])
+
+    def test_records_screening_and_bulk_paths(self):
+        with instrumentation.instrumented():
+            match.detect_type('no digits here')
+            match.detect_types(['a@b.com', 'a@b.com', 'x', None])
+        snapshot = instrumentation.snapshot()
+        screened = snapshot['phonenumber']['accepts_fingerprint']
+        self.assertEqual(screened['calls'], screened['failures'])
+        bulk = snapshot['email']['canonicalize_column']
+        self.assertEqual(1, bulk['calls'])
+        self.assertEqual(1, bulk['items'])
+        self.assertEqual(0, bulk['failures'])
+        self.assertEqual(1, snapshot['email']['score_type_matches']['calls'])
+
+    def test_merges_threads(self):
+        import threading
+        with instrumentation.instrumented():
+            threads = [threading.Thread(target=match.parse_as, args=('a@b.com', 'email'))
+                       for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            match.parse_as('a@b.com', 'email')
+        self.assertEqual(5, instrumentation.snapshot()['email']['parse']['calls'])
+        instrumentation.reset()
+        self.assertNotIn('parse', instrumentation.snapshot().get('email', {}))
+
+    def test_disable_restores_methods(self):
+        original = datatypes.DataType.__dict__['parse']
+        instrumentation.enable()
+        instrumentation.enable()
+        self.assertIsNot(original, datatypes.DataType.__dict__['parse'])
+        instrumentation.disable()
+        self.assertIs(original, datatypes.DataType.__dict__['parse'])
+        self.assertIsInstance(datatypes.EmailType.__dict__['accepts_fingerprint'], classmethod)
+        match.detect_type('a@b.com')
+        self.assertNotIn('score_type_match', instrumentation.snapshot().get('email', {}))
+
+    def test_parse_cache_hit_rate(self):
+        for _ in range(4):
+            match.parse_as('hit.rate@instrumentation.test', 'email')
+        cache = instrumentation.snapshot()['email']['parse_cache']
+        self.assertEqual(.75, cache['hit_rate'])
+
+
+if __name__ == '__main__':
+    unittest.main()
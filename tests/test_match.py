@@ -8,10 +8,14 @@ test_match
 Tests for `match` module.
 '''
 
+import os
 import random
 import sys
+import time
 import unittest
 
+import phonenumbers
+
 from match import datatypes
 from match import match
 from match import similarity
@@ -93,6 +97,310 @@ class TestDataTypes(unittest.TestCase):
                              "{0}: expected match with {1}".format(s,
                                                              canonical))
 
+    def test_canonical_types_score_by_key(self):
+        email = datatypes.get_datatype('email')
+        others = ['f.oo@gmail.com', 'fooo@gmail.com']
+        self.assertEqual([1, 0], email.score_similarity_many('foo@gmail.com', others))
+        self.assertEqual([True, False], [email.is_exact_match('foo@gmail.com', s) for s in others])
+
+    def test_detect_types_matches_detect_type(self):
+        values = []
+        for dtype, instances in datatype_instances.items():
+            values.extend(instances['valid'] + instances['invalid'])
+        values = values * 2 + [1500000000.0, 1500000000, ['608-345-6789'], 'on Monday of March']
+        results = match.detect_types(values)
+        self.assertEqual(len(values), len(results))
+        for s, result in zip(values, results):
+            self.assertEqual(match.detect_type(s), result,
+                             "{0}: batch detection differs".format(s))
+
+    def test_detect_column_type(self):
+        values = datatype_instances['phonenumber']['valid'] + ['hi there']
+        (score, dtype), results = match.detect_column_type(values)
+        self.assertEqual('phonenumber', dtype)
+        self.assertAlmostEqual(9 / 10., score)
+        self.assertEqual((1, 'phonenumber'), results[0])
+
+    def test_infer_column_type_stops_early(self):
+        values = datatype_instances['phonenumber']['valid'] * 1000
+        inferred = match.infer_column_type(values, confidence=.99, random_state=0)
+        self.assertEqual('phonenumber', inferred.dtype)
+        self.assertEqual(1, inferred.score)
+        self.assertTrue(inferred.confidence >= .99)
+        self.assertTrue(len(inferred.examined) < len(values))
+
+    def test_infer_column_type_mixed(self):
+        values = (datatype_instances['email']['valid'] * 30 +
+                  datatype_instances['phonenumber']['valid'] * 2)
+        inferred = match.infer_column_type(iter(values), random_state=0)
+        self.assertEqual('email', inferred.dtype)
+        self.assertTrue(0 < inferred.confidence <= 1)
+        inferred = match.infer_column_type([1500000000.0, 1500000000, ['x']] * 20,
+                                           random_state=0)
+        detected = [match.detect_type(s)[1] for s in inferred.examined]
+        self.assertEqual(detected.count(inferred.dtype) / float(len(detected)), inferred.score)
+
+    def test_eligible_types_keeps_valid_datatypes(self):
+        for dtype, instances in datatype_instances.items():
+            for s in instances['valid'] + instances['equivalent']:
+                self.assertIn(dtype, datatypes.eligible_types(s),
+                              "{0}: {1} was filtered out".format(s, dtype))
+
+    def test_eligible_types_filters_free_text(self):
+        # Words may be month or weekday names, so only datetime stays eligible
+        self.assertEqual({'string', 'datetime'}, set(datatypes.eligible_types('Hi, how are you?')))
+        self.assertEqual(['string'], datatypes.eligible_types('Hi!'))
+        self.assertEqual(['string'], datatypes.eligible_types(''))
+
+    def test_eligible_types_keep_detection(self):
+        values = ['on Monday of March', 'the 3rd of May', 'March', 'Hi, how are you?',
+                  'x@y', '608 555 5555', 'tue', 'ab']
+        for s in values:
+            scores = match.score_types(s, datatypes.ALL_TYPES)
+            self.assertEqual(max(scores, key=lambda x: x[0]), match.detect_type(s), s)
+        self.assertEqual('datetime', match.detect_type('on Monday of March')[1])
+
+    def test_digit_free_datetimes_match_dateutil(self):
+        from dateutil import parser
+        dtype = datatypes.DateTimeType()
+        dtype.disable_parse_cache()
+        words = ['on', 'of', 'the', 'at', 'March', 'mon', 'Sept.', 'TUESDAY', 'xmas', 'may',
+                 'pm', 'UTC', 'Z', 'febr', 'monday,', 'foo', u'jänner']
+        rng = random.Random(0)
+        for _ in range(2000):
+            s = ' '.join(rng.choice(words) for _ in range(rng.randint(1, 4)))
+            try:
+                expected = parser.parse(s).isoformat()
+            except (ValueError, OverflowError):
+                expected = None
+            if dtype.is_eligible(s):
+                self.assertEqual(expected, dtype.parse(s), s)
+
+    def test_get_datatype_reuses_instances(self):
+        self.assertIs(datatypes.get_datatype('email'),
+                      datatypes.get_datatype('email'))
+        self.assertIs(datatypes.get_datatype('string', similarity_measure='levenshtein'),
+                      datatypes.get_datatype('string', similarity_measure='levenshtein'))
+        self.assertIsNot(datatypes.get_datatype('string'),
+                         datatypes.get_datatype('string', similarity_measure='levenshtein'))
+
+    def test_add_and_remove_type(self):
+
+        class CheeseType(datatypes.StringType):
+            super_types = [datatypes.StringType]
+            name = 'cheese'
+
+            def score_type_match(self, s):
+                return int(s in ('brie', 'colby'))
+
+        match.add_type('cheese', CheeseType)
+        try:
+            self.assertEqual((1, 'cheese'), match.detect_type('brie'))
+            self.assertIsInstance(datatypes.get_datatype('cheese'), CheeseType)
+        finally:
+            match.remove_type('cheese')
+        self.assertNotIn('cheese', datatypes.ALL_TYPES)
+        self.assertEqual((0, 'string'), match.detect_type('brie'))
+        self.assertRaises(KeyError, match.remove_type, 'cheese')
+
+    def test_parse_cache(self):
+        dtype = datatypes.PhoneNumberType()
+        self.assertIsNotNone(dtype.parse_cache)
+        for _ in range(3):
+            self.assertEqual('+16083456789', dtype.parse('608-345-6789'))
+        self.assertEqual(2, dtype.parse_cache.hits)
+        self.assertEqual(1, dtype.parse_cache.misses)
+        dtype.disable_parse_cache()
+        self.assertEqual('+16083456789', dtype.parse('608-345-6789'))
+
+    def test_equal_values_of_different_types(self):
+        dtype = datatypes.DateTimeType()
+        expected = dtype.parse('1500000000')
+        values = [1500000000.0, 1500000000, True, 1, 1.0]
+        self.assertEqual(None, dtype.parse(1500000000.0))
+        self.assertEqual(expected, dtype.parse(1500000000))
+        for column in [dtype.parse_many(values), dtype.bulk_canonicalize(values),
+                       dtype.parse_column(values)]:
+            self.assertEqual([dtype.parse(s) for s in values], column)
+            self.assertEqual(expected, column[1])
+        email = datatypes.EmailType()
+        values = [1, 1.0, True, 'A@b.com']
+        self.assertEqual([email.canonical_key(s) for s in values],
+                         email.canonicalize_column(values))
+
+    def test_parse_cache_objects_are_not_shared(self):
+        dtype = datatypes.PhoneNumberType()
+        for parsed in [dtype.parse('608-345-6789', to_object=True),
+                       dtype.parse_many(['608-345-6789'] * 2, to_object=True)[0]]:
+            parsed.national_number = 1
+        self.assertEqual(6083456789, dtype.parse('608-345-6789', to_object=True).national_number)
+        first, second = dtype.parse_many(['608-345-6789'] * 2, to_object=True)
+        self.assertIsNot(first, second)
+
+    def test_phonenumber_screening(self):
+        instances = datatype_instances['phonenumber']
+        for region in ['US', 'GB']:
+            dtype = datatypes.PhoneNumberType(default_region=region)
+            dtype.disable_parse_cache()
+            for s in instances['valid'] + instances['invalid'] + ['1-800-FLOWERS', 'ab-cd-ef-1']:
+                try:
+                    expected = phonenumbers.parse(s, region)
+                    if not phonenumbers.is_valid_number(expected):
+                        expected = None
+                except phonenumbers.NumberParseException:
+                    expected = None
+                self.assertEqual(expected, dtype.parse(s, to_object=True))
+
+    def test_email_canonicalize_column(self):
+        dtype = datatypes.get_datatype('email')
+        instances = datatype_instances['email']
+        values = (instances['valid'] + instances['invalid'] + instances['equivalent'] +
+                  ['', None, ' J.Smith+news@GoogleMail.com ', 'j.smith+x@outlook.com'])
+        keys = dtype.canonicalize_column(values)
+        self.assertEqual([dtype.canonical_key(s) for s in values], keys)
+        self.assertEqual(['jsmith@gmail.com', 'j.smith@outlook.com'], keys[-2:])
+
+    def test_bulk_canonicalize(self):
+        for dtype, instances in datatype_instances.items():
+            keys = datatypes.get_datatype(dtype).bulk_canonicalize(
+                instances['equivalent'] + instances['invalid'])
+            n = len(instances['equivalent'])
+            self.assertEqual([instances['equivalent'][0]] * n, keys[:n])
+            self.assertEqual([None] * len(instances['invalid']), keys[n:])
+
+    def test_datetime_parse_column(self):
+        dtype = datatypes.DateTimeType()
+        dtype.disable_parse_cache()
+        instances = datatype_instances['datetime']
+        values = instances['valid'] + instances['invalid'] + instances['equivalent']
+        self.assertEqual([dtype.parse(s) for s in values], dtype.parse_column(values))
+        column = ['2003-09-25', '2003-02-30', '1999-12-31', 'Sept 25 2003']
+        self.assertEqual(['%Y-%m-%d'], datatypes.infer_datetime_formats(column))
+        self.assertEqual(['2003-09-25T00:00:00', None, '1999-12-31T00:00:00',
+                          '2003-09-25T00:00:00'], dtype.parse_column(column))
+        configured = datatypes.get_datatype('datetime', formats=('%m/%d/%Y',))
+        self.assertEqual('2003-09-25T00:00:00', configured.parse('09/25/2003'))
+
+    def test_datetime_parse_epochs(self):
+        dtype = datatypes.DateTimeType()
+        dtype.disable_parse_cache()
+        instances = datatype_instances['datetime']
+        columns = [
+            instances['valid'] + instances['invalid'],
+            [1064486188, 1064486188123, 0, 12, -5, 10 ** 16, 3 * 10 ** 11, -10 ** 11],
+            ['1064486188', ' 1064486188123 ', '+123', '0', '12', '', '1' * 20],
+            [str(t) for t in range(1710000000, 1740000000, 3599)],
+            # Either side of the top of the bulk milliseconds range
+            [2 ** 33 * 1000 - 1, 2 ** 33 * 1000, 165276029873152, 249999999999999],
+        ]
+        zones = [None]
+        if hasattr(time, 'tzset'):
+            zones += ['America/New_York', 'Australia/Lord_Howe']
+        tz = os.environ.get('TZ')
+        try:
+            for zone in zones:
+                if zone is not None:
+                    os.environ['TZ'] = zone
+                    time.tzset()
+                for values in columns:
+                    for to_object in [False, True]:
+                        self.assertEqual([dtype.parse(s, to_object) for s in values],
+                                         dtype.parse_epochs(values, to_object))
+        finally:
+            if tz is None:
+                os.environ.pop('TZ', None)
+            else:
+                os.environ['TZ'] = tz
+            if hasattr(time, 'tzset'):
+                time.tzset()
+
+    def test_exact_match_grouping_and_join(self):
+        equivalent = datatype_instances['phonenumber']['equivalent']
+        values = ['608-555-1234'] + equivalent + ['not a phone']
+        groups = match.group_exact_matches(values, 'phonenumber')
+        self.assertEqual(list(range(1, len(equivalent) + 1)),
+                         groups['+16083456789'])
+        self.assertEqual([0], groups['+16085551234'])
+        self.assertEqual(groups, match.group_exact_matches(iter(values)))
+        pairs = list(match.exact_match_pairs(values, ['(608) 345-6789', 'x'],
+                                             'phonenumber'))
+        self.assertEqual([(i, 0) for i in range(1, len(equivalent) + 1)], pairs)
+
+    def test_score_pairs(self):
+        phones = datatype_instances['phonenumber']['equivalent']
+        pairs = [(s, phones[0]) for s in phones] + [('608-345-6789', '608-345-6780')]
+        expected = [match.score_similarity(s1, s2, as_type='phonenumber')[0]
+                    for s1, s2 in pairs]
+        for n_jobs in [1, 2]:
+            scores = list(match.score_pairs(pairs, as_type='phonenumber',
+                                            n_jobs=n_jobs, chunk_size=3))
+            self.assertEqual(expected, scores)
+        names = [('jonathan smith', 'jon smith'), ('608-345-6789', '6083456789')]
+        self.assertEqual([match.score_similarity(s1, s2)[0] for s1, s2 in names],
+                         list(match.score_pairs(names, n_jobs=1)))
+        # A paused generator doesn't change the datatype of another
+        emails = match.score_pairs([('a@b.com', 'a@b.com')] * 2, as_type='email', n_jobs=1)
+        next(emails)
+        self.assertEqual([match.score_similarity('hello world', 'hello wurld')[0]],
+                         list(match.score_pairs([('hello world', 'hello wurld')], n_jobs=1)))
+        self.assertEqual([1], list(emails))
+
+
+class TestUtils(unittest.TestCase):
+
+    def test_lru_cache_evicts(self):
+        cache = utils.LRUCache(maxsize=2)
+        for key in ['a', 'b', 'a', 'c', 'b']:
+            cache.get_or_compute(key, lambda: key.upper())
+        self.assertEqual(2, len(cache))
+        self.assertEqual({'hits': 1, 'misses': 4, 'evictions': 2,
+                          'size': 2, 'maxsize': 2}, cache.stats())
+
+    def test_memoize_is_bounded(self):
+        calls = []
+
+        @utils.memoize(maxsize=10)
+        def square(x):
+            calls.append(x)
+            return x * x
+
+        for x in list(range(100)) + list(range(95, 100)):
+            self.assertEqual(x * x, square(x))
+        self.assertEqual(100, len(calls))
+        self.assertEqual(10, len(square.cache))
+
+    def test_lazy_lookup(self):
+        built = []
+        lookup = utils.LazyLookup({'a': utils.Lazy(lambda: built.append('a') or 'A'), 'b': 'B'})
+        self.assertEqual(['a', 'b'], sorted(lookup))
+        self.assertEqual([], built)
+        self.assertEqual('A', lookup['a'])
+        self.assertEqual('A', lookup['a'])
+        self.assertEqual(['a'], built)
+
+    def test_lazy_module_sees_patches(self):
+        lazy = utils.LazyModule('json')
+        self.assertEqual('[]', lazy.dumps([]))
+        import json
+        original = json.dumps
+        json.dumps = lambda obj: 'patched'
+        try:
+            self.assertEqual('patched', lazy.dumps([]))
+        finally:
+            json.dumps = original
+
+    def test_dependencies_load_on_first_use(self):
+        import subprocess
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        script = ("import sys\n"
+                  "from match import match\n"
+                  "assert match.parse_as('Foo@gmail.com', 'email') == 'foo@gmail.com'\n"
+                  "print(' '.join(m for m in ['phonenumbers', 'dateutil.parser', 'numpy',\n"
+                  "    'scipy', 'py_stringmatching'] if m in sys.modules))\n")
+        output = subprocess.check_output([sys.executable, '-c', script],
+                                         env=dict(os.environ, PYTHONPATH=root))
+        self.assertEqual(b'', output.strip())
+
 # def test_000_phone_number_detect(self):
 #         for s in valid_us_phone_numbers:
 #             score, dtype = match.detect_type(s)
@@ -0,0 +1,305 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+test_similarity
+----------------------------------
+
+Tests for `match.similarity` and `match.index` modules.
+'''
+
+import random
+import unittest
+
+from match import datatypes
+from match import match
+from match import similarity
+
+
+def generate_corpus(n, alphabet='abcd ', length=(3, 12), seed=0):
+    rng = random.Random(seed)
+    return [''.join(rng.choice(alphabet) for _ in range(rng.randint(*length)))
+            for _ in range(n)]
+
+
+class TestSimilarityModel(unittest.TestCase):
+
+    def setUp(self):
+        self.corpus = generate_corpus(300)
+        self.model = similarity.build_similarity_model(self.corpus, 'jaccard',
+                                                       tokenizer='2grams')
+
+    def brute_force(self, s, measure, threshold):
+        query = self.model.tokens(s)
+        results = []
+        for doc_id, doc in enumerate(self.corpus):
+            tokens = self.model.tokens(doc)
+            if not query & tokens:
+                continue
+            score = similarity.set_similarity(measure, query, tokens)
+            if score >= threshold - 1e-9:
+                results.append((score, doc_id))
+        return sorted(results, key=lambda x: (-x[0], x[1]))
+
+    def test_similarity(self):
+        self.assertEqual(1, self.model.similarity('abc', 'abc'))
+        self.assertEqual(0, self.model.similarity('abc', 'xyz'))
+        self.assertEqual(0, self.model.similarity('', 'abc'))
+
+    def test_get_all_similar_matches_brute_force(self):
+        self.model.build_index()
+        for measure in ['overlap', 'jaccard', 'dice', 'cosine']:
+            for threshold in [0, .3, .6, .9, 1]:
+                for s in ['ab ba c', 'dddd', 'a', 'abcd dcba']:
+                    self.assertEqual(self.brute_force(s, measure, threshold),
+                                     self.model.get_all_similar(s, measure, threshold),
+                                     '{0} {1} {2}'.format(s, measure, threshold))
+
+    def test_interned_similarity_matches_token_sets(self):
+        queries = ['ab ba c', 'dddd', '', 'abcd dcba']
+        for measure in ['overlap', 'jaccard', 'dice', 'cosine']:
+            model = similarity.SimilarityModel(measure, tokenizer='2grams')
+            for s in queries:
+                expected = [similarity.set_similarity(measure, model.tokens(s), model.tokens(doc))
+                            for doc in self.corpus]
+                self.assertEqual(expected, [model.similarity(s, doc) for doc in self.corpus])
+                self.assertEqual(expected, model.similarity_many(s, self.corpus))
+
+    def test_token_dictionary(self):
+        dictionary = similarity.TokenDictionary(tokenizer='2grams')
+        ids = dictionary.encode('abab')
+        tokens = set(similarity.get_tokenizer('2grams').tokenize('abab'))
+        self.assertEqual(list(range(len(tokens))), list(ids))
+        self.assertEqual(tokens, dictionary.decode(ids))
+        self.assertIs(ids, dictionary.encode('abab'))
+        # '#a', 'ab' and 'b$'
+        self.assertEqual(3, similarity.id_overlap(ids, dictionary.encode('abb')))
+        from array import array
+        short_ids, long_ids = array('I', [0, 3, 4, 198, 199]), array('I', range(0, 200, 2))
+        self.assertEqual(3, similarity.id_overlap(short_ids, long_ids))
+        self.assertEqual(3, similarity.id_overlap(long_ids, short_ids))
+
+    def test_token_dictionary_threads(self):
+        import threading
+        dictionary = similarity.TokenDictionary(tokenizer='2grams', cache_size=0)
+        corpus = generate_corpus(2000, alphabet='abcdefghijklmnopqrstuvwxyz0123456789')
+        threads = [threading.Thread(target=lambda: [dictionary.encode(s) for s in corpus])
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(dictionary.tokens), len(dictionary.ids))
+        self.assertEqual(list(range(len(dictionary))),
+                         sorted(dictionary.ids[t] for t in dictionary.tokens))
+        for token_id, token in enumerate(dictionary.tokens):
+            self.assertEqual(token_id, dictionary.ids[token])
+
+    def test_usable_as_similarity_measure(self):
+        score, dtype = match.score_similarity('ab ba c', 'ab ba d', as_type='string',
+                                              similarity_measure=self.model)
+        self.assertEqual(self.model.similarity('ab ba c', 'ab ba d'), score)
+
+
+class TestBitParallel(unittest.TestCase):
+
+    def test_similarity_many_matches_pairwise(self):
+        import py_stringmatching as sm
+        from match import bitparallel
+        measures = [(bitparallel.Levenshtein(), sm.Levenshtein()),
+                    (bitparallel.Jaro(), sm.Jaro()),
+                    (bitparallel.JaroWinkler(), sm.JaroWinkler())]
+        for alphabet, length in [('ab', (0, 10)), ('abcdefgh ', (0, 70)), (u'ab\xe9\x00\U0001f600', (0, 20))]:
+            candidates = generate_corpus(100, alphabet=alphabet, length=length)
+            for query in candidates[:5] + ['', 'a']:
+                for bulk, pairwise in measures:
+                    self.assertEqual([pairwise.get_sim_score(query, c) for c in candidates],
+                                     bulk.similarity_many(query, candidates))
+
+    def test_string_type_uses_similarity_many(self):
+        dtype = datatypes.get_datatype('string', similarity_measure='levenshtein')
+        candidates = generate_corpus(50)
+        self.assertEqual([dtype.score_similarity('abcd', c) for c in candidates],
+                         dtype.score_similarity_many('abcd', candidates))
+
+
+class TestThreshold(unittest.TestCase):
+
+    def test_bounded_levenshtein(self):
+        import py_stringmatching as sm
+        from match.threshold import bounded_levenshtein
+        lev = sm.Levenshtein()
+        corpus = generate_corpus(60, alphabet='abc', length=(0, 12))
+        for s1 in corpus[:20]:
+            for s2 in corpus:
+                distance = lev.get_raw_score(s1, s2)
+                for k in range(4):
+                    self.assertEqual(distance if distance <= k else None,
+                                     bounded_levenshtein(s1, s2, k))
+
+    def test_exceeds_threshold_matches_scores(self):
+        from match import bitparallel
+        measures = [bitparallel.Levenshtein(), bitparallel.Jaro(), bitparallel.JaroWinkler(),
+                    similarity.SimilarityModel('jaccard'), similarity.SimilarityModel('cosine')]
+        corpus = generate_corpus(60, alphabet=u'abcd \U0001f600', length=(0, 30))
+        # Near duplicates, so some pairs are above the thresholds
+        corpus += [s[:-1] + 'b' for s in corpus[:20] if s]
+        for measure in measures:
+            score = getattr(measure, 'similarity', None) or measure.get_sim_score
+            for threshold in [.95, .9, .7, 0]:
+                for s1 in corpus[::3]:
+                    for s2 in corpus:
+                        self.assertEqual(score(s1, s2) > threshold,
+                                         measure.exceeds_threshold(s1, s2, threshold))
+
+    def test_is_exact_match_uses_threshold(self):
+        dtype = datatypes.get_datatype('string', similarity_measure='levenshtein')
+        s = 'abcdefghijklmnopqrstuvwxyz'
+        self.assertTrue(dtype.is_exact_match(s, s[:-1] + 'A'))
+        self.assertFalse(dtype.is_exact_match(s, s[:-2] + 'AB'))
+        self.assertTrue(dtype.is_similar(s, s[:-2] + 'AB', .9))
+        self.assertEqual((True, 'string'), match.is_similar('abcd', 'abce', .7, as_type='string'))
+
+
+class TestSimilarityJoin(unittest.TestCase):
+
+    def setUp(self):
+        self.corpus = generate_corpus(200, length=(3, 14))
+        self.model = similarity.SimilarityModel(tokenizer='2grams')
+
+    def brute_force(self, measure, threshold, left, right):
+        from match.index import min_overlap
+        pairs = set()
+        right = [self.model.tokens(s) for s in right]
+        for i, s1 in enumerate(left):
+            tokens1 = self.model.tokens(s1)
+            for j, tokens2 in enumerate(right):
+                if not tokens1 or not tokens2:
+                    continue
+                overlap = len(tokens1 & tokens2)
+                if overlap >= min_overlap(measure, threshold, len(tokens1), len(tokens2)):
+                    pairs.add((i, j))
+        return pairs
+
+    def test_self_join_matches_brute_force(self):
+        for measure in ['jaccard', 'dice', 'cosine', 'overlap']:
+            for threshold in [.9, .7, .4]:
+                expected = set((i, j) for i, j in self.brute_force(
+                    measure, threshold, self.corpus, self.corpus) if i < j)
+                pairs = list(match.similarity_join(self.corpus, measure=measure,
+                                                   threshold=threshold, tokenizer='2grams'))
+                self.assertEqual(expected, set((i, j) for i, j, score in pairs))
+                self.assertEqual(len(expected), len(pairs))
+                for i, j, score in pairs:
+                    self.assertEqual(similarity.set_similarity(
+                        measure, self.model.tokens(self.corpus[i]),
+                        self.model.tokens(self.corpus[j])), score)
+
+    def test_join_matches_brute_force(self):
+        left, right = self.corpus[:80], self.corpus[80:] + ['']
+        for measure in ['jaccard', 'cosine']:
+            expected = self.brute_force(measure, .6, left, right)
+            pairs = match.similarity_join(left, right, measure=measure, threshold=.6,
+                                          tokenizer='2grams')
+            self.assertEqual(expected, set((i, j) for i, j, score in pairs))
+
+    def test_model_self_join(self):
+        model = similarity.build_similarity_model(self.corpus, 'jaccard', tokenizer='2grams')
+        pairs = set((i, j) for i, j, score in model.self_join(threshold=.6))
+        model.build_index()
+        self.assertEqual(set((i, j) for i, j, score in model.self_join(threshold=.6)), pairs)
+
+
+@unittest.skipUnless(similarity.np is not None, 'requires numpy')
+class TestMinHashLSH(unittest.TestCase):
+
+    def setUp(self):
+        self.corpus = generate_corpus(500, alphabet='abcdefghijklmnop ', length=(8, 20))
+        self.corpus += [s + 'a' for s in self.corpus[:50]]
+        self.model = similarity.build_similarity_model(self.corpus, 'jaccard',
+                                                       tokenizer='3grams')
+
+    def test_signature_estimates_jaccard(self):
+        index = self.model.build_index('minhash', num_perm=256)
+        s1, s2 = self.corpus[0], self.corpus[500]
+        exact = self.model.similarity(s1, s2)
+        estimate = (index.signatures[0] == index.signatures[500]).mean()
+        self.assertAlmostEqual(exact, estimate, delta=.15)
+
+    def test_universal_hashes_are_exact(self):
+        from match.index import MERSENNE_PRIME, universal_hashes
+        rng = random.Random(0)
+        x = [rng.randrange(2 ** 32) for _ in range(50)] + [2 ** 32 - 1]
+        a = [rng.randrange(1, MERSENNE_PRIME) for _ in range(20)] + [MERSENNE_PRIME - 1]
+        b = [rng.randrange(MERSENNE_PRIME) for _ in range(20)] + [MERSENNE_PRIME - 1]
+        hashes = universal_hashes(x, similarity.np.array(a, dtype='uint64'),
+                                  similarity.np.array(b, dtype='uint64'))
+        self.assertEqual([[(ai * xi + bi) % MERSENNE_PRIME for ai, bi in zip(a, b)] for xi in x],
+                         hashes.tolist())
+
+    def test_query_and_self_join(self):
+        index = self.model.build_index('minhash', threshold=.6)
+        self.assertTrue(index.bands * index.rows <= 128)
+        self.assertTrue(.5 < index.estimated_recall() <= 1)
+        results = self.model.get_all_similar(self.corpus[0], threshold=.6)
+        self.assertEqual((1, 0), results[0])
+        self.assertIn(500, [doc_id for score, doc_id in results])
+        pairs = [(i, j) for i, j, score in self.model.self_join(threshold=.6)]
+        self.assertEqual(len(pairs), len(set(pairs)))
+        found = len([i for i in range(50) if (i, 500 + i) in pairs])
+        self.assertTrue(found >= 40, found)
+        self.assertRaises(ValueError, self.model.get_all_similar, 'abc', 'dice')
+
+
+@unittest.skipUnless(similarity.sparse is not None, 'requires numpy and scipy')
+class TestTfIdfModel(unittest.TestCase):
+
+    def setUp(self):
+        self.corpus = generate_corpus(200)
+        self.model = match.build_similarity_model(self.corpus, tokenizer='2grams')
+
+    def test_similarity(self):
+        self.assertAlmostEqual(1, self.model.similarity('ab ba c', 'ab ba c'))
+        self.assertEqual(0, self.model.similarity('ab ba c', ''))
+        score = self.model.similarity('ab ba c', 'ab ba d')
+        self.assertTrue(0 < score < 1)
+
+    def test_top_k_matches_pairwise_scores(self):
+        queries = self.corpus[:5] + ['ab ba c']
+        for query, results in zip(queries, self.model.top_k(queries, k=5)):
+            expected = sorted(((self.model.similarity(query, doc), doc_id)
+                               for doc_id, doc in enumerate(self.corpus)),
+                              key=lambda x: (-round(x[0], 9), x[1]))[:5]
+            self.assertEqual([doc_id for score, doc_id in expected],
+                             [doc_id for score, doc_id in results])
+            for (expected_score, _), (score, _) in zip(expected, results):
+                self.assertAlmostEqual(expected_score, score)
+
+    def test_top_k_over_candidates(self):
+        results = self.model.top_k(['ab ba c'], k=2, doc_ids=[3, 5, 7])[0]
+        self.assertTrue(set(doc_id for score, doc_id in results) <= {3, 5, 7})
+
+    def test_self_join(self):
+        pairs = list(self.model.self_join(threshold=.8))
+        for i, j, score in pairs:
+            self.assertTrue(i < j)
+            self.assertAlmostEqual(self.model.similarity(self.corpus[i], self.corpus[j]), score)
+            self.assertTrue(score >= .8 - 1e-9)
+
+    def test_similarity_many(self):
+        candidates = self.corpus[:20] + ['']
+        for expected, score in zip([self.model.similarity('ab ba c', doc) for doc in candidates],
+                                   self.model.similarity_many('ab ba c', candidates)):
+            self.assertAlmostEqual(expected, score)
+
+    def test_set_measures(self):
+        self.model.build_index()
+        set_model = similarity.build_similarity_model(self.corpus, 'overlap', tokenizer='2grams')
+        self.assertEqual(set_model.get_all_similar('db bd c', threshold=.6),
+                         self.model.get_all_similar('db bd c', measure='overlap', threshold=.6))
+        self.assertEqual(list(set_model.self_join(threshold=.9)),
+                         list(self.model.self_join(measure='overlap', threshold=.9)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+test_storage
+----------------------------------
+
+Tests for `match.storage` module.
+'''
+
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from match import similarity
+from match import storage
+from .test_similarity import generate_corpus
+
+
+def backed_by_mmap(array):
+    while array is not None:
+        if isinstance(array, np.memmap):
+            return True
+        array = array.base
+    return False
+
+
+@unittest.skipUnless(np is not None, 'requires numpy')
+class TestStorage(unittest.TestCase):
+
+    def setUp(self):
+        self.corpus = generate_corpus(200) + [u'caf\xe9 d\xe9j\xe0 vu']
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'model.bin')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def round_trip(self, model):
+        model.save(self.path)
+        loaded = similarity.SimilarityModel.load(self.path)
+        self.assertEqual(list(model.corpus), list(loaded.corpus))
+        return loaded
+
+    def assertSameResults(self, model, loaded, queries, **kwargs):
+        for s in queries:
+            self.assertEqual(model.get_all_similar(s, **kwargs),
+                             loaded.get_all_similar(s, **kwargs))
+
+    def test_inverted_index_round_trip(self):
+        model = similarity.build_similarity_model(self.corpus, 'dice', tokenizer='2grams')
+        model.build_index()
+        loaded = self.round_trip(model)
+        self.assertTrue(backed_by_mmap(loaded.index.sizes))
+        self.assertTrue(backed_by_mmap(loaded.index.postings.flat))
+        self.assertTrue(backed_by_mmap(loaded.index.vocabulary.tokens))
+        self.assertEqual(model.index.vocabulary, dict(loaded.index.vocabulary))
+        self.assertSameResults(model, loaded, self.corpus[:10] + [u'caf\xe9'], threshold=.4)
+        self.assertEqual(sorted(model.self_join(threshold=.7)),
+                         sorted(loaded.self_join(threshold=.7)))
+
+    @unittest.skipUnless(similarity.sparse is not None, 'requires scipy')
+    def test_tfidf_round_trip(self):
+        model = similarity.build_similarity_model(self.corpus, 'tfidf', tokenizer='2grams')
+        loaded = self.round_trip(model)
+        self.assertTrue(backed_by_mmap(loaded.matrix.data))
+        self.assertTrue(backed_by_mmap(loaded.matrix.indices))
+        self.assertEqual(model.vocabulary, dict(loaded.vocabulary))
+        self.assertSameResults(model, loaded, self.corpus[:10], threshold=.3)
+        self.assertAlmostEqual(model.similarity('ab ba c', 'ab ba d'),
+                               loaded.similarity('ab ba c', 'ab ba d'))
+
+    def test_minhash_round_trip(self):
+        model = similarity.build_similarity_model(self.corpus, 'jaccard', tokenizer='2grams')
+        model.build_index('minhash', threshold=.5)
+        loaded = self.round_trip(model)
+        self.assertTrue(backed_by_mmap(loaded.index.bucket_keys))
+        self.assertTrue(backed_by_mmap(loaded.index.bucket_doc_ids))
+        self.assertSameResults(model, loaded, self.corpus[:10], threshold=.5)
+
+    def test_rejects_other_files(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'not a model at all')
+        self.assertRaises(ValueError, storage.load_model, self.path)
+
+
+if __name__ == '__main__':
+    unittest.main()